@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+'''
+Compiles the target selections of exp1 logs into a single csv. Each line of
+a log contains a timestamp in milliseconds, an event identifier and a JSON
+string of the event's attributes, as written by exp1/logger.pde.
+
+A selection begins when a (non-discarded) target is spawned and ends when it
+is hit; the misses in between are its errors, and it starts from the centre
+of the target before it. Only the events needed for this are decoded.
+
+The rows of each log are kept in a cache directory, together with a manifest
+of the SHA-1 hash of every log they were compiled from, so that recompiling
+a directory only reads the logs that are new or have changed. The rows are
+kept under the hash of the log and of the version of the rows, so that
+rows compiled by an earlier version are never read.
+'''
+
+import os
+import csv
+import sys
+import glob
+import json
+import math
+import hashlib
+
+
+screen_size = (413, 117)
+screen_resolution = (7680, 2160)
+pixel_to_real = screen_size[0] / screen_resolution[0]
+
+# Only these events are decoded; the rest of the log is skipped by identifier.
+analyzed_events = {'System.Startup',
+                   'Trial.InteractionModeChanged',
+                   'Trial.TargetWidthChanged',
+                   'Trial.BeginBlock',
+                   'Trial.BeginBigBlock',
+                   'Trial.DiscardedTargetSpawned',
+                   'Trial.TargetSpawned',
+                   'Trial.TargetHit',
+                   'Trial.TargetMissed',
+                   'Hybrid.ScreenPulled',
+                   'Hybrid.ScreenReset',
+                   'Trial.Resumed'}
+
+selection_row_keys = ['RowIndex',
+                      'TrialIndex',
+                      'Log',
+                      'InteractionMode',
+                      'BigBlockIndex',
+                      'StandingPosition_cm',
+                      'WidthCondition_px',
+                      'BlockIndex',
+                      'SelectionIndex',
+                      'StartX_cm',
+                      'StartY_cm',
+                      'TargetX_cm',
+                      'TargetY_cm',
+                      'TargetWidth_cm',
+                      'TargetHeight_cm',
+                      'Distance_cm',
+                      'MovementTime_ms',
+                      'ErrorCount',
+                      'ErrorIndicator',
+                      'HitSource',
+                      'HitX_cm',
+                      'HitY_cm',
+                      'EndpointAlong_cm',
+                      'EndpointAcross_cm']
+
+manifest_filename = 'manifest.json'
+
+# Raised whenever selection_rows computes its rows differently; the columns
+# are versioned on their own.
+rows_version = 2
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Compile the target selections of exp1 logs.')
+    parser.add_argument('--csv', type=str, required=True, help='the directory containing the logs to compile '
+            '(or a single log)')
+    parser.add_argument('--cache-dir', type=str, default=os.path.join('export', 'cache'), help='the directory '
+            'in which the rows of each log and the manifest are kept (default: export/cache)')
+    arguments = parser.parse_args()
+
+    if os.path.isdir(arguments.csv):
+        filenames = sorted(glob.glob(os.path.join(arguments.csv, '*.csv')))
+    else:
+        filenames = [arguments.csv]
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(selection_row_keys)
+    row_index = -1
+    for trial_index, rows in enumerate(compile_logs(filenames, arguments.cache_dir)):
+        for row_data in rows:
+            row_index += 1
+            row_data[0] = row_index
+            row_data[1] = trial_index
+            writer.writerow(row_data)
+
+
+def compile_logs(filenames, cache_dir):
+    '''
+    Yield the selection rows of each log in turn, reading a log only if its
+    hash is not in the manifest of `cache_dir`. The RowIndex and TrialIndex
+    columns are left for the caller to fill in, since they depend on which
+    logs are compiled together.
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    rows_key = rows_digest()
+    manifest_path = os.path.join(cache_dir, manifest_filename)
+    try:
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {}
+
+    updated = {}
+    try:
+        for filename in filenames:
+            key = os.path.abspath(filename)
+            entry = manifest.get(key)
+            stat = os.stat(filename)
+            # The hash is only recomputed when the size or modification time changed.
+            if entry is not None and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                digest = entry['sha1']
+            else:
+                digest = file_digest(filename)
+            rows_path = os.path.join(cache_dir, '{}.{}.csv'.format(digest, rows_key))
+            if os.path.exists(rows_path):
+                with open(rows_path, newline='') as file:
+                    rows = list(csv.reader(file))
+            else:
+                rows = selection_rows(filename)
+                with open(rows_path + '.partial', 'w', newline='') as file:
+                    csv.writer(file).writerows(rows)
+                os.replace(rows_path + '.partial', rows_path)
+            updated[key] = {'sha1': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': rows_key}
+            yield rows
+    finally:
+        # Logs that were not compiled this time keep their entries.
+        for key, entry in manifest.items():
+            updated.setdefault(key, entry)
+        with open(manifest_path + '.partial', 'w') as file:
+            json.dump(updated, file, indent=1, sort_keys=True)
+        os.replace(manifest_path + '.partial', manifest_path)
+
+
+def rows_digest():
+    '''Return a short hash of `rows_version` and `selection_row_keys`, which the cached rows are kept under.'''
+    return hashlib.sha1(json.dumps([rows_version, selection_row_keys]).encode()).hexdigest()[:12]
+
+
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def selection_rows(filename):
+    '''
+    Return a row of `selection_row_keys` for each target selection in a log.
+    Selections interrupted by a crash are dropped, as are the first targets of
+    each block, which are discarded by the script.
+    '''
+    rows = []
+    scale = 1.0
+    mode = None
+    big_block_index = -1
+    standing_position = None
+    width_condition = None
+    block_index = -1
+    selection_index = -1
+    screen_offset = (0.0, 0.0)
+    previous_target = None
+    target = None
+    spawn_time = None
+    errors = 0
+    for timestamp, identifier, data, line_number in read_events(filename):
+        try:
+            if identifier == 'System.Startup':
+                scale = data['scale']
+            elif identifier == 'Trial.InteractionModeChanged':
+                mode = data['mode']
+            elif identifier == 'Trial.TargetWidthChanged':
+                width_condition = int(data['width'])
+            elif identifier == 'Trial.BeginBigBlock':
+                big_block_index += 1
+                # The sketch scales the script to the machine, as it does the
+                # targets, but logs the standing position before scaling it.
+                standing_position = int(data['standing_position']) * scale * pixel_to_real
+            elif identifier == 'Trial.BeginBlock':
+                block_index += 1
+                selection_index = -1
+            elif identifier in ('Trial.DiscardedTargetSpawned', 'Trial.TargetSpawned'):
+                previous_target = target
+                target = (data['tx'], data['ty'], data['tw'], data['th'])
+                spawn_time = timestamp if identifier == 'Trial.TargetSpawned' else None
+                errors = 0
+            elif identifier in ('Hybrid.ScreenPulled', 'Hybrid.ScreenReset'):
+                screen_offset = (data['x'], data['y'])
+            elif identifier == 'Trial.Resumed':
+                target = previous_target = spawn_time = None
+                screen_offset = (0.0, 0.0)
+            elif identifier == 'Trial.TargetMissed':
+                errors += 1
+            elif identifier == 'Trial.TargetHit':
+                if spawn_time is None or previous_target is None:
+                    continue
+                selection_index += 1
+                # The hit is logged in screen coordinates, but is tested
+                # against the target after the screen is pulled.
+                hit_x = data['x'] - screen_offset[0]
+                hit_y = data['y'] - screen_offset[1]
+                start_x, start_y = previous_target[0], previous_target[1]
+                target_x, target_y, target_width, target_height = target
+                dx = target_x - start_x
+                dy = target_y - start_y
+                length = math.hypot(dx, dy)
+                along = across = None
+                if length > 0:
+                    along = ((hit_x - target_x) * dx + (hit_y - target_y) * dy) / length
+                    across = ((hit_y - target_y) * dx - (hit_x - target_x) * dy) / length
+                row_data = [None] * len(selection_row_keys)
+                row_data[selection_row_keys.index('Log')] = os.path.basename(filename)
+                row_data[selection_row_keys.index('InteractionMode')] = mode
+                row_data[selection_row_keys.index('BigBlockIndex')] = big_block_index
+                row_data[selection_row_keys.index('StandingPosition_cm')] = standing_position
+                row_data[selection_row_keys.index('WidthCondition_px')] = width_condition
+                row_data[selection_row_keys.index('BlockIndex')] = block_index
+                row_data[selection_row_keys.index('SelectionIndex')] = selection_index
+                row_data[selection_row_keys.index('StartX_cm')] = start_x * pixel_to_real
+                row_data[selection_row_keys.index('StartY_cm')] = start_y * pixel_to_real
+                row_data[selection_row_keys.index('TargetX_cm')] = target_x * pixel_to_real
+                row_data[selection_row_keys.index('TargetY_cm')] = target_y * pixel_to_real
+                row_data[selection_row_keys.index('TargetWidth_cm')] = target_width * pixel_to_real
+                row_data[selection_row_keys.index('TargetHeight_cm')] = target_height * pixel_to_real
+                row_data[selection_row_keys.index('Distance_cm')] = length * pixel_to_real
+                row_data[selection_row_keys.index('MovementTime_ms')] = timestamp - spawn_time
+                row_data[selection_row_keys.index('ErrorCount')] = errors
+                row_data[selection_row_keys.index('ErrorIndicator')] = int(errors > 0)
+                row_data[selection_row_keys.index('HitSource')] = data['source']
+                row_data[selection_row_keys.index('HitX_cm')] = hit_x * pixel_to_real
+                row_data[selection_row_keys.index('HitY_cm')] = hit_y * pixel_to_real
+                row_data[selection_row_keys.index('EndpointAlong_cm')] = (along * pixel_to_real
+                        if along is not None else None)
+                row_data[selection_row_keys.index('EndpointAcross_cm')] = (across * pixel_to_real
+                        if across is not None else None)
+                rows.append(row_data)
+                spawn_time = None
+        except:
+            print("In file", filename, "line", line_number, file=sys.stderr)
+            raise
+    return rows
+
+
+def read_events(filename, identifiers=analyzed_events):
+    '''Yield (timestamp, identifier, data, line number) for each event of `identifiers` in a log.'''
+    with open(filename) as file:
+        for index, line in enumerate(file):
+            timestamp, _, rest = line.partition(',')
+            identifier, _, data = rest.partition(',')
+            identifier = identifier.strip()
+            if identifier not in identifiers:
+                continue
+            try:
+                yield int(timestamp), identifier, json.loads(data), index + 1
+            except ValueError:
+                print("In file", filename, "line", index + 1, file=sys.stderr)
+                raise
+
+
+if __name__ == '__main__':
+    main()
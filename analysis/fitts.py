@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+'''
+Computes Fitts' law throughput from the selections compiled by compare.py,
+per participant, interaction mode, target width and target distance, with
+bootstrap confidence intervals.
+
+The effective width of a cell is 4.133 times the standard deviation of the
+selection endpoints along the movement axis, and its effective index of
+difficulty is log2(Ae / We + 1), where Ae is the mean effective distance
+moved. Throughput is the effective index of difficulty over the mean
+movement time, in bits per second.
+
+The bootstrap resamples the selections of every cell at once as arrays, and
+the replicates are split between worker processes.
+'''
+
+import os
+import csv
+import sys
+
+import numpy
+
+# The distances between targets in the scripts, in centimetres, are those the
+# scripts were generated with, by exp1/generate_script.py.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'exp1'))
+from generate_script import our_target_distances_in_centimetres as nominal_distances
+
+
+fitts_row_keys = ['Log',
+                  'InteractionMode',
+                  'WidthCondition_px',
+                  'Distance_cm',
+                  'SelectionCount',
+                  'ErrorRate',
+                  'MeanMovementTime_ms',
+                  'EffectiveWidth_cm',
+                  'EffectiveDistance_cm',
+                  'EffectiveIndexOfDifficulty_bits',
+                  'Throughput_bps',
+                  'ThroughputLower_bps',
+                  'ThroughputUpper_bps']
+
+mode_row_keys = ['Log',
+                 'InteractionMode',
+                 'CellCount',
+                 'Throughput_bps',
+                 'ThroughputLower_bps',
+                 'ThroughputUpper_bps']
+
+# The endpoint spread that contains 96% of selections, in standard deviations.
+effective_width_factor = 4.133
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Compute Fitts' law throughput with bootstrap confidence intervals.")
+    parser.add_argument('filename', type=str, help='a csv of selections, as written by compare.py')
+    parser.add_argument('--resamples', type=int, default=2000, help='the number of bootstrap resamples '
+            '(default: 2000)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='the confidence level of the intervals '
+            '(default: 0.95)')
+    parser.add_argument('--seed', type=int, default=None, help='the seed of the bootstrap')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes used for '
+            'the bootstrap (default: one per CPU)')
+    parser.add_argument('--mode-summary', action='store_true', help='summarize the throughput of each '
+            'participant and interaction mode as the mean over its width and distance cells')
+    arguments = parser.parse_args()
+
+    cells = read_cells(arguments.filename)
+    replicates = bootstrap_throughput(cells, arguments.resamples, arguments.seed, arguments.processes)
+    alpha = (1 - arguments.confidence) / 2
+    writer = csv.writer(sys.stdout)
+    if arguments.mode_summary:
+        writer.writerow(mode_row_keys)
+        groups = {}
+        for index, key in enumerate(cells.keys):
+            groups.setdefault(key[:2], []).append(index)
+        for group, indices in sorted(groups.items()):
+            # A cell with a single selection has no effective width, so its
+            # throughput is NaN and it is left out of the mean.
+            measured = [index for index in indices if not numpy.isnan(cells.throughput[index])]
+            if measured:
+                group_replicates = numpy.nanmean(replicates[measured], axis=0)
+                lower, upper = numpy.nanquantile(group_replicates, [alpha, 1 - alpha])
+                throughput = cells.throughput[measured].mean()
+            else:
+                lower = upper = throughput = None
+            row_data = [None] * len(mode_row_keys)
+            row_data[mode_row_keys.index('Log')] = group[0]
+            row_data[mode_row_keys.index('InteractionMode')] = group[1]
+            row_data[mode_row_keys.index('CellCount')] = len(measured)
+            row_data[mode_row_keys.index('Throughput_bps')] = throughput
+            row_data[mode_row_keys.index('ThroughputLower_bps')] = lower
+            row_data[mode_row_keys.index('ThroughputUpper_bps')] = upper
+            writer.writerow(row_data)
+        return
+
+    writer.writerow(fitts_row_keys)
+    lower, upper = numpy.quantile(replicates, [alpha, 1 - alpha], axis=1)
+    for index, key in enumerate(cells.keys):
+        row_data = [None] * len(fitts_row_keys)
+        row_data[fitts_row_keys.index('Log')] = key[0]
+        row_data[fitts_row_keys.index('InteractionMode')] = key[1]
+        row_data[fitts_row_keys.index('WidthCondition_px')] = key[2]
+        row_data[fitts_row_keys.index('Distance_cm')] = key[3]
+        row_data[fitts_row_keys.index('SelectionCount')] = cells.counts[index]
+        row_data[fitts_row_keys.index('ErrorRate')] = cells.error_rate[index]
+        row_data[fitts_row_keys.index('MeanMovementTime_ms')] = cells.movement_time[index]
+        row_data[fitts_row_keys.index('EffectiveWidth_cm')] = cells.effective_width[index]
+        row_data[fitts_row_keys.index('EffectiveDistance_cm')] = cells.effective_distance[index]
+        row_data[fitts_row_keys.index('EffectiveIndexOfDifficulty_bits')] = cells.index_of_difficulty[index]
+        row_data[fitts_row_keys.index('Throughput_bps')] = cells.throughput[index]
+        row_data[fitts_row_keys.index('ThroughputLower_bps')] = lower[index]
+        row_data[fitts_row_keys.index('ThroughputUpper_bps')] = upper[index]
+        writer.writerow(row_data)
+
+
+class Cells(object):
+    '''
+    The selections of each cell, padded into arrays of shape (cells, the
+    largest cell's selection count); `mask` marks the real selections. The
+    remaining attributes are the per-cell statistics of `cell_statistics`.
+    '''
+    __slots__ = '''
+        keys
+        counts
+        mask
+        movement_times
+        distances
+        endpoints
+        errors
+        movement_time
+        error_rate
+        effective_width
+        effective_distance
+        index_of_difficulty
+        throughput
+    '''.split()
+
+
+def read_cells(filename):
+    '''Read the selections of a compare.py csv into `Cells`.'''
+    with open(filename, newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        key_indices = [header.index(key) for key in ('Log', 'InteractionMode', 'WidthCondition_px')]
+        distance_index = header.index('Distance_cm')
+        value_indices = [header.index(key) for key in ('MovementTime_ms', 'EndpointAlong_cm', 'ErrorCount')]
+        selections = {}
+        for row in reader:
+            if not row[value_indices[1]]:
+                continue
+            # The sketch truncates target positions to whole pixels, so the
+            # distance moved is grouped with the nearest distance of the scripts.
+            key = tuple(row[index] for index in key_indices) + (nominal_distance(float(row[distance_index])),)
+            selections.setdefault(key, []).append((float(row[distance_index]),) +
+                                                  tuple(float(row[index]) for index in value_indices))
+
+    cells = Cells()
+    cells.keys = sorted(selections)
+    cells.counts = numpy.array([len(selections[key]) for key in cells.keys])
+    columns = numpy.zeros((4, len(cells.keys), cells.counts.max() if cells.keys else 0))
+    for index, key in enumerate(cells.keys):
+        columns[:, index, :cells.counts[index]] = numpy.array(selections[key]).T
+    cells.mask = numpy.arange(columns.shape[2]) < cells.counts[:, None]
+    cells.distances, cells.movement_times, cells.endpoints, cells.errors = columns
+    statistics = cell_statistics(cells.movement_times, cells.distances, cells.endpoints, cells.mask)
+    cells.movement_time, cells.effective_width, cells.effective_distance, cells.index_of_difficulty, \
+            cells.throughput = statistics
+    cells.error_rate = (cells.errors > 0).sum(axis=1) / cells.counts
+    return cells
+
+
+def nominal_distance(distance):
+    '''Return the one of `nominal_distances` nearest to `distance`.'''
+    return min(nominal_distances, key=lambda nominal: abs(nominal - distance))
+
+
+def cell_statistics(movement_times, distances, endpoints, mask):
+    '''
+    Return the mean movement time, effective width, effective distance,
+    effective index of difficulty and throughput of each cell, where the
+    selections are along the last axis and `mask` marks the real ones.
+    Leading axes are kept, so that many resamples can be computed at once.
+    '''
+    counts = mask.sum(axis=-1)
+    movement_time = numpy.where(mask, movement_times, 0).sum(axis=-1) / counts
+    effective_distance = numpy.where(mask, distances + endpoints, 0).sum(axis=-1) / counts
+    endpoint_mean = numpy.where(mask, endpoints, 0).sum(axis=-1) / counts
+    squares = numpy.where(mask, (endpoints - endpoint_mean[..., None]) ** 2, 0).sum(axis=-1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        effective_width = effective_width_factor * numpy.sqrt(squares / (counts - 1))
+        index_of_difficulty = numpy.log2(effective_distance / effective_width + 1)
+        throughput = index_of_difficulty / (movement_time / 1000)
+    return movement_time, effective_width, effective_distance, index_of_difficulty, throughput
+
+
+def bootstrap_throughput(cells, resamples, seed=None, processes=None):
+    '''
+    Return the bootstrap throughput of each cell as an array of shape
+    (cells, resamples). Each resample draws as many selections from a cell,
+    with replacement, as the cell has.
+    '''
+    from multiprocessing import Pool
+    seeds = numpy.random.SeedSequence(seed)
+    # Batches are kept to a few million drawn selections each.
+    batch_size = max(1, 4000000 // max(1, cells.mask.size))
+    batches = [min(batch_size, resamples - start) for start in range(0, resamples, batch_size)]
+    jobs = [(cells.counts, cells.movement_times, cells.distances, cells.endpoints, size, child)
+            for size, child in zip(batches, seeds.spawn(len(batches)))]
+    if processes == 1 or len(jobs) <= 1:
+        results = list(map(bootstrap_batch, jobs))
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(bootstrap_batch, jobs)
+    return numpy.concatenate(results, axis=1) if results else numpy.zeros((len(cells.keys), 0))
+
+
+def bootstrap_batch(job):
+    counts, movement_times, distances, endpoints, size, seed = job
+    random = numpy.random.default_rng(seed)
+    cell_count, width = movement_times.shape
+    # Draw an index below each cell's count for every selection slot; the
+    # slots past the count are masked out as in the original arrays.
+    indices = (random.random((cell_count, size, width)) * counts[:, None, None]).astype(numpy.intp)
+    mask = numpy.broadcast_to(numpy.arange(width) < counts[:, None, None], indices.shape)
+    cell_indices = numpy.arange(cell_count)[:, None, None]
+    statistics = cell_statistics(movement_times[cell_indices, indices],
+                                 distances[cell_indices, indices],
+                                 endpoints[cell_indices, indices],
+                                 mask)
+    return statistics[-1]
+
+
+if __name__ == '__main__':
+    main()
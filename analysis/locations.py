@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+'''
+Replays the touches of exp1 logs through estimators of where the participant
+stands, and scores them against the standing position shown to them at each
+big block (the standing_x of Script.BeginBigBlock, scaled to the machine as
+the sketch does).
+
+The estimators are evaluated at the moments the sketch made its own estimate
+(Hybrid.ParticipantLocationEstimated, when a cursor is spawned), so that the
+online estimate can be scored alongside them. An estimator is a function of
+a `Session`, the moments of one log together with the touches on screen at
+each of them and every touch put down in the log, as flat arrays; it returns
+an estimated x in pixels for every moment, or NaN where it has none. More
+estimators can be added from other modules with --module, which adds the
+`estimators` dict of each module to those below.
+
+Each log is replayed and estimated in a worker process of its own.
+'''
+
+import os
+import csv
+import sys
+import glob
+import importlib
+
+import numpy
+
+from compare import pixel_to_real, read_events
+
+
+# The touch-downs of this many milliseconds before a moment are averaged by
+# the recent touch-downs estimator.
+recent_touch_window = 10000
+
+replayed_events = {'System.Startup',
+                   'Trial.InteractionModeChanged',
+                   'Trial.BeginBigBlock',
+                   'Trial.Resumed',
+                   'Input.TouchDown',
+                   'Input.TouchMove',
+                   'Input.TouchUp',
+                   'Hybrid.ParticipantLocationEstimated'}
+
+location_row_keys = ['Log',
+                     'InteractionMode',
+                     'Estimator',
+                     'MomentCount',
+                     'EstimateCount',
+                     'MeanError_cm',
+                     'MeanAbsoluteError_cm',
+                     'MedianAbsoluteError_cm',
+                     'RMSError_cm']
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Score estimators of the participant location against the '
+                                                 'standing positions of exp1 logs.')
+    parser.add_argument('--csv', type=str, required=True, help='the directory containing the logs to replay '
+            '(or a single log)')
+    parser.add_argument('--module', type=str, action='append', default=[], help='a module whose `estimators` '
+            'dict of name to estimator is added to the built-in estimators (may be given more than once)')
+    parser.add_argument('--estimators', type=str, nargs='+', default=None, help='the estimators to score '
+            '(default: all of them)')
+    parser.add_argument('--pool-logs', action='store_true', help='score the moments of all logs together, for '
+            'each interaction mode, rather than each log on its own')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes used '
+            '(default: one per CPU)')
+    arguments = parser.parse_args()
+
+    available = load_estimators(arguments.module)
+    names = arguments.estimators or list(available)
+    for name in names:
+        if name not in available:
+            parser.error('unknown estimator {!r}; the estimators are {}'.format(name, ', '.join(available)))
+
+    if os.path.isdir(arguments.csv):
+        filenames = sorted(glob.glob(os.path.join(arguments.csv, '*.csv')))
+    else:
+        filenames = [arguments.csv]
+
+    jobs = [(filename, arguments.module, names) for filename in filenames]
+    if arguments.processes == 1 or len(jobs) <= 1:
+        results = list(map(estimate_log, jobs))
+    else:
+        from multiprocessing import Pool
+        with Pool(arguments.processes) as pool:
+            results = pool.map(estimate_log, jobs, chunksize=1)
+
+    if arguments.pool_logs:
+        modes = numpy.concatenate([result[1] for result in results]) if results else numpy.array([], dtype=object)
+        errors = {name: numpy.concatenate([result[2][name] for result in results]) if results else numpy.zeros(0)
+                  for name in names}
+        results = [(None, modes, errors)]
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(location_row_keys)
+    for log, modes, errors in results:
+        for mode in sorted(set(modes.tolist()), key=str):
+            in_mode = modes == mode
+            for name in names:
+                mode_errors = errors[name][in_mode]
+                mode_errors = mode_errors[~numpy.isnan(mode_errors)]
+                row_data = [None] * len(location_row_keys)
+                row_data[location_row_keys.index('Log')] = log
+                row_data[location_row_keys.index('InteractionMode')] = mode
+                row_data[location_row_keys.index('Estimator')] = name
+                row_data[location_row_keys.index('MomentCount')] = int(in_mode.sum())
+                row_data[location_row_keys.index('EstimateCount')] = len(mode_errors)
+                if len(mode_errors):
+                    row_data[location_row_keys.index('MeanError_cm')] = mode_errors.mean()
+                    row_data[location_row_keys.index('MeanAbsoluteError_cm')] = abs(mode_errors).mean()
+                    row_data[location_row_keys.index('MedianAbsoluteError_cm')] = numpy.median(abs(mode_errors))
+                    row_data[location_row_keys.index('RMSError_cm')] = numpy.sqrt((mode_errors ** 2).mean())
+                writer.writerow(row_data)
+
+
+def load_estimators(modules):
+    '''Return the built-in estimators, with those of each of `modules` added.'''
+    available = dict(estimators)
+    for module in modules:
+        available.update(importlib.import_module(module).estimators)
+    return available
+
+
+def estimate_log(job):
+    '''
+    Replay a single log and return its name, the interaction mode of each
+    moment, and the error in centimetres of each estimator at each moment,
+    which is NaN where the estimator or the standing position is missing.
+    '''
+    filename, modules, names = job
+    available = load_estimators(modules)
+    session = read_session(filename)
+    errors = {}
+    for name in names:
+        estimate = numpy.asarray(available[name](session), dtype=float)
+        errors[name] = (estimate - session.standing_x) * pixel_to_real
+    return os.path.basename(filename), session.modes, errors
+
+
+class Session(object):
+    '''
+    The moments of a log at which the sketch estimated the location of the
+    participant: their `times`, interaction `modes`, the `standing_x` shown
+    and the `online_x` estimated, in pixels. The touches on screen at the
+    i-th moment are `contact_x[contact_offsets[i]:contact_offsets[i + 1]]`
+    and the matching `contact_y`, and `contact_owners` holds the moment of
+    each. `down_times`, `down_x` and `down_y` are every touch put down in
+    the log, in order.
+    '''
+    __slots__ = '''
+        times
+        modes
+        standing_x
+        online_x
+        contact_offsets
+        contact_owners
+        contact_x
+        contact_y
+        down_times
+        down_x
+        down_y
+    '''.split()
+
+
+def read_session(filename):
+    '''Replay the touches of a log into a `Session`.'''
+    moments = []
+    contacts = []
+    counts = []
+    downs = []
+    scale = 1.0
+    mode = None
+    standing_x = numpy.nan
+    touches = {}
+    for timestamp, identifier, data, line_number in read_events(filename, replayed_events):
+        try:
+            if identifier in ('Input.TouchDown', 'Input.TouchMove'):
+                touches[data['id']] = (data['x'], data['y'])
+                if identifier == 'Input.TouchDown':
+                    downs.append((timestamp, data['x'], data['y']))
+            elif identifier == 'Input.TouchUp':
+                touches.pop(data['id'], None)
+            elif identifier == 'Hybrid.ParticipantLocationEstimated':
+                moments.append((timestamp, mode, standing_x, data['x']))
+                contacts.extend(touches.values())
+                counts.append(len(touches))
+            elif identifier == 'System.Startup':
+                scale = data['scale']
+            elif identifier == 'Trial.InteractionModeChanged':
+                mode = data['mode']
+            elif identifier == 'Trial.BeginBigBlock':
+                standing_x = int(data['standing_position']) * scale
+            elif identifier == 'Trial.Resumed':
+                # The touches of the crashed session never come up.
+                touches.clear()
+        except:
+            print("In file", filename, "line", line_number, file=sys.stderr)
+            raise
+
+    session = Session()
+    session.times = numpy.array([moment[0] for moment in moments], dtype=float)
+    session.modes = numpy.array([moment[1] for moment in moments], dtype=object)
+    session.standing_x = numpy.array([moment[2] for moment in moments], dtype=float)
+    session.online_x = numpy.array([moment[3] for moment in moments], dtype=float)
+    counts = numpy.array(counts, dtype=numpy.intp)
+    session.contact_offsets = numpy.concatenate([[0], numpy.cumsum(counts)])
+    session.contact_owners = numpy.repeat(numpy.arange(len(moments)), counts)
+    contacts = numpy.array(contacts, dtype=float).reshape(-1, 2)
+    session.contact_x = contacts[:, 0]
+    session.contact_y = contacts[:, 1]
+    downs = numpy.array(downs, dtype=float).reshape(-1, 3)
+    session.down_times, session.down_x, session.down_y = downs.T
+    return session
+
+
+def online_estimate(session):
+    '''The estimate the sketch logged.'''
+    return session.online_x
+
+
+def bounding_box_estimate(session):
+    '''The centre of the bounding box of the touches on screen, as the sketch computes it.'''
+    estimate = numpy.full(len(session.times), numpy.nan)
+    touched = numpy.diff(session.contact_offsets) > 0
+    if touched.any():
+        starts = session.contact_offsets[:-1][touched]
+        estimate[touched] = (numpy.minimum.reduceat(session.contact_x, starts) +
+                             numpy.maximum.reduceat(session.contact_x, starts)) / 2
+    return estimate
+
+
+def centroid_estimate(session):
+    '''The mean of the touches on screen.'''
+    counts = numpy.diff(session.contact_offsets)
+    sums = numpy.bincount(session.contact_owners, weights=session.contact_x, minlength=len(session.times))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return sums / counts
+
+
+def median_estimate(session):
+    '''The median of the touches on screen.'''
+    counts = numpy.diff(session.contact_offsets)
+    ordered = session.contact_x[numpy.lexsort((session.contact_x, session.contact_owners))]
+    touched = counts > 0
+    starts = session.contact_offsets[:-1][touched]
+    estimate = numpy.full(len(session.times), numpy.nan)
+    estimate[touched] = (ordered[starts + (counts[touched] - 1) // 2] + ordered[starts + counts[touched] // 2]) / 2
+    return estimate
+
+
+def recent_touches_estimate(session):
+    '''The mean of the touches put down in the `recent_touch_window` before each moment, the moment included.'''
+    sums = numpy.concatenate([[0], numpy.cumsum(session.down_x)])
+    first = numpy.searchsorted(session.down_times, session.times - recent_touch_window, side='left')
+    last = numpy.searchsorted(session.down_times, session.times, side='right')
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return (sums[last] - sums[first]) / (last - first)
+
+
+estimators = {'online': online_estimate,
+              'bounding-box': bounding_box_estimate,
+              'centroid': centroid_estimate,
+              'median': median_estimate,
+              'recent-touches': recent_touches_estimate}
+
+
+if __name__ == '__main__':
+    main()
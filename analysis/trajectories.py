@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+'''
+Resamples the movement of every target selection of exp1 logs to a fixed
+number of steps, and measures its path. Selections are delimited as in
+compare.py, from the spawn of a target to its hit, and the movement of one
+is either the path of the cursor (Hybrid.CursorSpawned and CursorMoved) or
+of the touch that moved the most (Input.TouchDown, TouchMove and TouchUp)
+in between, in centimetres on the coordinates of the targets, that is after
+taking off the offset of a pulled screen.
+
+Each path is resampled at equal steps of time and at equal steps of distance
+along it, into arrays of shape (selections, steps, 2). The samples of all
+selections are kept in flat arrays, so that every path is interpolated and
+measured at once rather than one selection at a time:
+
+- PathLengthRatio is the length of the path over the straight distance from
+  its first sample to its last.
+- Overshoot_cm is how far the path went past the centre of the target, along
+  the axis from the previous target to this one.
+- SubmovementCount is the number of peaks of the speed along the path
+  resampled in time that reach a fraction of its highest speed.
+'''
+
+import os
+import csv
+import sys
+import glob
+
+import numpy
+
+from compare import analyzed_events, pixel_to_real, read_events
+
+
+source_events = {'cursor': {'Hybrid.CursorSpawned', 'Hybrid.CursorMoved'},
+                 'touch': {'Input.TouchDown', 'Input.TouchMove', 'Input.TouchUp'}}
+
+trajectory_row_keys = ['RowIndex',
+                       'TrialIndex',
+                       'Log',
+                       'InteractionMode',
+                       'BlockIndex',
+                       'SelectionIndex',
+                       'Source',
+                       'SampleCount',
+                       'Duration_ms',
+                       'PathLength_cm',
+                       'StraightLength_cm',
+                       'PathLengthRatio',
+                       'Overshoot_cm',
+                       'SubmovementCount']
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Resample and measure the movement of the target selections of '
+                                                 'exp1 logs.')
+    parser.add_argument('--csv', type=str, required=True, help='the directory containing the logs to read '
+            '(or a single log)')
+    parser.add_argument('--source', type=str, default='cursor', choices=sorted(source_events), help='the path '
+            'that is resampled: that of the cursor, or of the touch that moved the most (default: cursor)')
+    parser.add_argument('--steps', type=int, default=101, help='the number of steps each path is resampled to, '
+            'including both of its ends (default: 101)')
+    parser.add_argument('--until-first-attempt', action='store_true', help='end each path at the first hit or '
+            'miss of its target, rather than at the hit')
+    parser.add_argument('--peak-fraction', type=float, default=0.1, help='the fraction of its highest speed '
+            'that a peak of speed must reach to count as a submovement (default: 0.1)')
+    parser.add_argument('--npz', type=str, default=None, help='also save the resampled paths to this NumPy '
+            'archive, as the arrays time_paths and arc_paths, with a selection for each row of the csv')
+    arguments = parser.parse_args()
+    if arguments.steps < 2:
+        parser.error('--steps must be at least 2')
+
+    if os.path.isdir(arguments.csv):
+        filenames = sorted(glob.glob(os.path.join(arguments.csv, '*.csv')))
+    else:
+        filenames = [arguments.csv]
+
+    selections = read_selections(filenames, arguments.source, arguments.until_first_attempt)
+    measure_selections(selections, arguments.steps, arguments.peak_fraction)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(trajectory_row_keys)
+    columns = [selections.counts, selections.duration, selections.path_length, selections.straight_length,
+               selections.path_length_ratio, selections.overshoot, selections.submovements]
+    # Measures that do not exist for a selection, such as those of a path
+    # without samples, are NaN, and are written as empty cells.
+    columns = [[None if value != value else value for value in column.tolist()] for column in columns]
+    for row_index, (key, measures) in enumerate(zip(selections.keys, zip(*columns))):
+        counts, duration, path_length, straight_length, ratio, overshoot, submovements = measures
+        row_data = [None] * len(trajectory_row_keys)
+        row_data[trajectory_row_keys.index('RowIndex')] = row_index
+        row_data[trajectory_row_keys.index('TrialIndex')] = key[0]
+        row_data[trajectory_row_keys.index('Log')] = key[1]
+        row_data[trajectory_row_keys.index('InteractionMode')] = key[2]
+        row_data[trajectory_row_keys.index('BlockIndex')] = key[3]
+        row_data[trajectory_row_keys.index('SelectionIndex')] = key[4]
+        row_data[trajectory_row_keys.index('Source')] = arguments.source
+        row_data[trajectory_row_keys.index('SampleCount')] = counts
+        row_data[trajectory_row_keys.index('Duration_ms')] = duration
+        row_data[trajectory_row_keys.index('PathLength_cm')] = path_length
+        row_data[trajectory_row_keys.index('StraightLength_cm')] = straight_length
+        row_data[trajectory_row_keys.index('PathLengthRatio')] = ratio
+        row_data[trajectory_row_keys.index('Overshoot_cm')] = overshoot
+        row_data[trajectory_row_keys.index('SubmovementCount')] = (int(submovements)
+                if submovements is not None else None)
+        writer.writerow(row_data)
+
+    if arguments.npz is not None:
+        numpy.savez_compressed(arguments.npz, time_paths=selections.time_paths, arc_paths=selections.arc_paths)
+
+
+class Selections(object):
+    '''
+    The samples of many selections, packed into flat arrays: the samples of
+    the i-th selection of `keys` are `times[offsets[i]:offsets[i + 1]]` and
+    the matching rows of `positions`. `starts` and `targets` hold the centre
+    of the previous target and of the target of each selection. The remaining
+    attributes are filled in by `measure_selections`.
+    '''
+    __slots__ = '''
+        keys
+        starts
+        targets
+        offsets
+        counts
+        times
+        positions
+        time_paths
+        arc_paths
+        duration
+        path_length
+        straight_length
+        path_length_ratio
+        overshoot
+        submovements
+    '''.split()
+
+
+def read_selections(filenames, source, until_first_attempt=False):
+    '''Read the selections of every log into `Selections`, keyed by (TrialIndex, Log, mode, block, selection).'''
+    selections = Selections()
+    selections.keys = []
+    starts = []
+    targets = []
+    counts = []
+    samples = []
+    for trial_index, filename in enumerate(filenames):
+        for key, start, target, log_samples in log_selections(filename, source, until_first_attempt):
+            selections.keys.append((trial_index, os.path.basename(filename)) + key)
+            starts.append(start)
+            targets.append(target)
+            counts.append(len(log_samples))
+            samples.extend(log_samples)
+    selections.starts = numpy.array(starts, dtype=float).reshape(-1, 2) * pixel_to_real
+    selections.targets = numpy.array(targets, dtype=float).reshape(-1, 2) * pixel_to_real
+    selections.counts = numpy.array(counts, dtype=numpy.intp)
+    selections.offsets = numpy.concatenate([[0], numpy.cumsum(selections.counts)])
+    samples = numpy.array(samples, dtype=float).reshape(-1, 3)
+    selections.times = samples[:, 0]
+    selections.positions = samples[:, 1:] * pixel_to_real
+    return selections
+
+
+def log_selections(filename, source, until_first_attempt=False):
+    '''
+    Return (mode, block index, selection index), the previous target, the
+    target and the (timestamp, x, y) samples of `source` for each selection
+    of a log, with the selections delimited as by compare.selection_rows.
+    Coordinates are in pixels on the coordinates of the targets. For touches,
+    only the samples of the touch with the most of them are kept.
+    '''
+    moved_events = source_events[source]
+    selections = []
+    mode = None
+    block_index = -1
+    selection_index = -1
+    screen_offset = (0.0, 0.0)
+    previous_target = None
+    target = None
+    samples = None
+    attempted = False
+    for timestamp, identifier, data, line_number in read_events(filename, analyzed_events | moved_events):
+        try:
+            if identifier in moved_events:
+                if samples is not None and not attempted:
+                    samples.append((timestamp, data.get('id'), data['x'] - screen_offset[0],
+                                    data['y'] - screen_offset[1]))
+            elif identifier == 'Trial.InteractionModeChanged':
+                mode = data['mode']
+            elif identifier == 'Trial.BeginBlock':
+                block_index += 1
+                selection_index = -1
+            elif identifier in ('Trial.DiscardedTargetSpawned', 'Trial.TargetSpawned'):
+                previous_target = target
+                target = (data['tx'], data['ty'])
+                samples = [] if identifier == 'Trial.TargetSpawned' else None
+                attempted = False
+            elif identifier in ('Hybrid.ScreenPulled', 'Hybrid.ScreenReset'):
+                screen_offset = (data['x'], data['y'])
+            elif identifier == 'Trial.Resumed':
+                target = previous_target = samples = None
+                screen_offset = (0.0, 0.0)
+            elif identifier == 'Trial.TargetMissed':
+                attempted = attempted or until_first_attempt
+            elif identifier == 'Trial.TargetHit':
+                if samples is None or previous_target is None:
+                    continue
+                selection_index += 1
+                if source == 'touch' and samples:
+                    touch_counts = {}
+                    for sample in samples:
+                        touch_counts[sample[1]] = touch_counts.get(sample[1], 0) + 1
+                    touch_id = max(touch_counts, key=touch_counts.get)
+                    samples = [sample for sample in samples if sample[1] == touch_id]
+                selections.append(((mode, block_index, selection_index), previous_target, target,
+                                   [(sample[0], sample[2], sample[3]) for sample in samples]))
+                samples = None
+        except:
+            print("In file", filename, "line", line_number, file=sys.stderr)
+            raise
+    return selections
+
+
+def measure_selections(selections, steps, peak_fraction):
+    '''Resample the paths of `selections` to `steps` steps, and fill in their measures.'''
+    offsets = selections.offsets
+    sampled = selections.counts > 0
+    firsts = offsets[:-1][sampled]
+    lasts = offsets[1:][sampled] - 1
+    owners = numpy.repeat(numpy.arange(len(selections.keys)), selections.counts)
+    nan = numpy.full(len(selections.keys), numpy.nan)
+
+    times = selections.times
+    positions = selections.positions
+    selections.duration = nan.copy()
+    selections.duration[sampled] = times[lasts] - times[firsts]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        progress = (times - times[offsets[owners]]) / selections.duration[owners]
+    selections.time_paths = resample_paths(numpy.nan_to_num(progress, nan=0.0, posinf=0.0), positions, offsets,
+                                           steps)
+
+    # The distance travelled since the first sample of the selection.
+    travelled = numpy.zeros(len(times))
+    if len(times):
+        travelled[1:] = numpy.hypot(*(positions[1:] - positions[:-1]).T)
+        travelled[offsets[:-1][sampled]] = 0
+        travelled = numpy.cumsum(travelled)
+        travelled -= travelled[offsets[owners]]
+    selections.path_length = nan.copy()
+    selections.path_length[sampled] = travelled[lasts]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        progress = travelled / selections.path_length[owners]
+    selections.arc_paths = resample_paths(numpy.nan_to_num(progress, nan=0.0, posinf=0.0), positions, offsets,
+                                          steps)
+
+    selections.straight_length = nan.copy()
+    selections.straight_length[sampled] = numpy.hypot(*(positions[lasts] - positions[firsts]).T)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        selections.path_length_ratio = numpy.where(selections.straight_length > 0,
+                                                   selections.path_length / selections.straight_length, numpy.nan)
+
+    # How far each sample is past the target, along the axis of the movement.
+    axes = selections.targets - selections.starts
+    distances = numpy.hypot(*axes.T)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        along = ((positions - selections.targets[owners]) * axes[owners]).sum(axis=1) / distances[owners]
+    selections.overshoot = nan.copy()
+    if len(firsts):
+        selections.overshoot[sampled] = numpy.maximum(numpy.maximum.reduceat(along, firsts), 0)
+    selections.overshoot[distances == 0] = numpy.nan
+
+    # The movement starts and ends at rest, so the speeds are padded with
+    # zeros, and a peak at either end of a path is counted too. The steps of
+    # a path are equal in time, so the distances moved stand in for speeds.
+    speeds = numpy.zeros((len(selections.keys), steps + 1))
+    speeds[:, 1:-1] = numpy.hypot(*numpy.moveaxis(numpy.diff(selections.time_paths, axis=1), 2, 0))
+    speeds = numpy.nan_to_num(speeds)
+    # A peak is where the speed stops rising and starts falling; a step
+    # without change takes the direction of the next change, so that a flat
+    # top is a single peak and a flat stretch on the way up is none.
+    # Steps within one segment of a path are equal, but for rounding.
+    changes = numpy.diff(speeds, axis=1)
+    changes = numpy.where(abs(changes) > 1e-9 * speeds.max(axis=1, keepdims=True), numpy.sign(changes), 0)
+    columns = numpy.arange(changes.shape[1])
+    next_changes = numpy.where(changes != 0, columns, columns[-1])
+    next_changes = numpy.minimum.accumulate(next_changes[:, ::-1], axis=1)[:, ::-1]
+    changes = numpy.take_along_axis(changes, next_changes, axis=1)
+    threshold = peak_fraction * speeds.max(axis=1, keepdims=True)
+    peaks = (changes[:, :-1] > 0) & (changes[:, 1:] < 0) & (speeds[:, 1:-1] >= threshold)
+    selections.submovements = numpy.where(sampled, peaks.sum(axis=1), numpy.nan)
+
+
+def resample_paths(progress, positions, offsets, steps):
+    '''
+    Interpolate the positions of every selection at `steps` equal steps of
+    `progress`, which rises from 0 to 1 over the samples of each selection,
+    into an array of shape (selections, steps, 2). A path with a single
+    sample stays there, and one without samples is NaN.
+    '''
+    counts = numpy.diff(offsets)
+    paths = numpy.full((len(counts), steps, 2), numpy.nan)
+    sampled = numpy.flatnonzero(counts > 0)
+    if not len(sampled):
+        return paths
+    # Each selection is shifted past the progress of the one before it, so
+    # that a single search finds the samples on either side of every step.
+    keys = progress + 2.0 * numpy.repeat(numpy.arange(len(counts)), counts)
+    queries = numpy.linspace(0, 1, steps)[None, :] + 2.0 * sampled[:, None]
+    after = numpy.searchsorted(keys, queries, side='right')
+    firsts = offsets[:-1][sampled][:, None]
+    lasts = offsets[1:][sampled][:, None] - 1
+    right = numpy.clip(after, firsts, lasts)
+    left = numpy.clip(after - 1, firsts, lasts)
+    spans = keys[right] - keys[left]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        weights = numpy.clip(numpy.where(spans > 0, (queries - keys[left]) / spans, 0.0), 0, 1)[..., None]
+    paths[sampled] = positions[left] * (1 - weights) + positions[right] * weights
+    return paths
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import os
+import io
 import sys
 import math
+import bisect
+import contextlib
 import json
 import random
 import itertools
@@ -40,6 +44,11 @@ our_standing_positions = [our_screen_resolution[0] / 8, our_screen_resolution[0]
 
 
 angle_candidates = list(range(720))
+angle_candidate_sines = None
+angle_candidate_cosines = None
+
+# The number of times a vertical run is started over before giving up.
+max_attempts = 1000
 
 
 def main():
@@ -48,13 +57,16 @@ def main():
     parser.add_argument('--mode', help='specify an interaction mode. if none are specified, all will be included')
     parser.add_argument('--blocks', help='number of blocks', type=int, default=4)
     parser.add_argument('--repetitions', help='number of repetitions', type=int, default=3)
+    parser.add_argument('--seed', help='seed the random number generator, so the same script is generated '
+                        'again (in batch mode, the base seed of the roster)')
     subparser = parser.add_subparsers(dest='subparser')
     latin = subparser.add_parser('permute',
                                  help="permute an existing script's interaction modes and standing positions")
     latin = subparser.add_parser('swap-side',
                                  help="swap which side of the screen the user is standing on")
-    random = subparser.add_parser('random',
-                                  help="generate a trial that jumps around arbitrarily")
+    # Not bound to `random`, which would hide the module in this function.
+    subparser.add_parser('random',
+                         help="generate a trial that jumps around arbitrarily")
     radial = subparser.add_parser('radial',
                                    help="generate a trial with distance from centre")
     vertical = subparser.add_parser('vertical',
@@ -70,31 +82,124 @@ def main():
                                         "with edges of rectangle aligned to standing positions\n"
                                         "(repetitions is number of backtracks, blocks is number of full "
                                         "rectangle traverals)")
+    transform = subparser.add_parser('transform',
+                                     help="apply transforms to an existing script in a single pass, in the "
+                                     "order they are given")
+    transform.add_argument('filename', nargs='?', help="the script to transform (default: standard input)")
+    transform.add_argument('--permute', dest='steps', action='append_const', const=('permute',),
+                           help="permute the interaction modes and standing positions, as the permute command")
+    transform.add_argument('--swap-side', dest='steps', action='append_const', const=('swap-side',),
+                           help="swap which side of the screen the user is standing on")
+    transform.add_argument('--rescale', dest='steps', action='append', metavar='WIDTHxHEIGHT',
+                           type=lambda value: ('rescale', parse_resolution(value)),
+                           help="rescale the script to another screen resolution")
+    batch = subparser.add_parser('batch',
+                                 help="generate a counterbalanced script for each participant of a roster")
+    batch.add_argument('generator', choices=generators,
+                       help="the kind of trial to generate, as for the commands above")
+    batch.add_argument('--roster', required=True,
+                       help="a file listing one participant per line, in the order they take part")
+    batch.add_argument('--output-dir', default='.',
+                       help="the directory in which <participant>.csv is written for each participant")
+    batch.add_argument('--processes', type=int, default=None,
+                       help="the number of worker processes (default: one per CPU)")
     arguments = parser.parse_args()
     if arguments.subparser == 'permute':
         do_latin()
     elif arguments.subparser == 'swap-side':
         do_swap_side()
-    elif arguments.subparser == 'radial':
-        do_radial(arguments.blocks, arguments.repetitions)
-    elif arguments.subparser == 'vertical':
-        do_vertical(arguments.blocks, arguments.repetitions)
-    elif arguments.subparser == 'rectangular':
-        do_rectangular(arguments.blocks, arguments.repetitions)
-    elif arguments.subparser == 'strict-rectangular':
-        do_strict_rectangular(arguments.blocks, arguments.repetitions)
-    elif arguments.subparser == 'aligned-rectangular':
-        do_aligned_rectangular(arguments.blocks, arguments.repetitions)
-    elif arguments.subparser == 'random':
-        if arguments.mode:
-            do_single_mode(arguments.mode, arguments.blocks, arguments.repetitions)
+    elif arguments.subparser == 'transform':
+        do_transform(arguments.filename, arguments.steps or [])
+    elif arguments.subparser == 'batch':
+        seed = arguments.seed
+        if seed is None:
+            seed = str(random.SystemRandom().randrange(2 ** 32))
+            print('Using seed', seed, file=sys.stderr)
+        with open(arguments.roster) as file:
+            roster = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+        do_batch(arguments.generator, arguments.mode, arguments.blocks, arguments.repetitions,
+                 roster, seed, arguments.output_dir, arguments.processes)
+    elif arguments.subparser in generators:
+        if arguments.seed is not None:
+            random.seed(arguments.seed)
+        generate(arguments.subparser, arguments.mode, arguments.blocks, arguments.repetitions)
+    else:
+        raise TypeError()
+
+
+generators = ['random', 'radial', 'vertical', 'rectangular', 'strict-rectangular', 'aligned-rectangular']
+
+
+def generate(generator, mode, blocks, repetitions):
+    '''Print a script of the given kind, one of `generators`.'''
+    if generator == 'radial':
+        do_radial(blocks, repetitions)
+    elif generator == 'vertical':
+        do_vertical(blocks, repetitions)
+    elif generator == 'rectangular':
+        do_rectangular(blocks, repetitions)
+    elif generator == 'strict-rectangular':
+        do_strict_rectangular(blocks, repetitions)
+    elif generator == 'aligned-rectangular':
+        do_aligned_rectangular(blocks, repetitions)
+    elif generator == 'random':
+        if mode:
+            do_single_mode(mode, blocks, repetitions)
         else:
-            do_multi_mode(arguments.blocks, arguments.repetitions)
+            do_multi_mode(blocks, repetitions)
     else:
         raise TypeError()
 
 
+def do_batch(generator, mode, blocks, repetitions, roster, seed, output_dir, processes=None):
+    '''
+    Generate a script for each participant of `roster` into `output_dir`,
+    counterbalanced as the October scripts were. Participants are taken in
+    groups of as many as there are interaction modes, and each participant of
+    a group gets the group's base script permuted once more than the last.
+    Every four groups use two base scripts: the first two groups get one each
+    and the last two get the same scripts mirrored to the other side.
+
+    Each base script is generated in a worker process, from the module's
+    random number generator seeded with `seed` and the base script's index,
+    so the files do not depend on the number of processes.
+    '''
+    from multiprocessing import Pool
+    os.makedirs(output_dir, exist_ok=True)
+    group_size = len(interaction_modes)
+    bases = {}
+    for index, participant in enumerate(roster):
+        group = index // group_size
+        base = group // 4 * 2 + group % 2
+        swap_side = group // 2 % 2 == 1
+        bases.setdefault(base, []).append((participant, index % group_size, swap_side))
+    jobs = [(generator, mode, blocks, repetitions, '{}:{}'.format(seed, base), participants, output_dir)
+            for base, participants in sorted(bases.items())]
+    if processes == 1 or len(jobs) <= 1:
+        list(map(generate_batch_scripts, jobs))
+    else:
+        with Pool(processes) as pool:
+            pool.map(generate_batch_scripts, jobs)
+
+
+def generate_batch_scripts(job):
+    generator, mode, blocks, repetitions, seed, participants, output_dir = job
+    random.seed(seed)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        generate(generator, mode, blocks, repetitions)
+    lines = output.getvalue().splitlines(keepends=True)
+    for participant, permutations, swap_side in participants:
+        transforms = [SwapSide(our_screen_resolution)] if swap_side else []
+        participant_lines = transform_lines(lines, transforms, permutations)
+        filename = os.path.join(output_dir, participant + '.csv')
+        with open(filename + '.partial', 'w') as file:
+            file.writelines(participant_lines)
+        os.replace(filename + '.partial', filename)
+
+
 def do_single_mode(mode, blocks, repetitions):
+    target_widths = list(our_target_widths_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 0,
@@ -104,8 +209,8 @@ def do_single_mode(mode, blocks, repetitions):
     print('Script.InteractionMode,' + json.dumps({
         'mode': mode,
     }))
-    random.shuffle(our_target_widths_in_pixels)
-    for target_width in our_target_widths_in_pixels:
+    random.shuffle(target_widths)
+    for target_width in target_widths:
         print('Script.TargetWidth,' + json.dumps({
             'target_width': target_width,
         }))
@@ -134,19 +239,21 @@ def do_single_mode(mode, blocks, repetitions):
 
 
 def do_multi_mode(blocks, repetitions):
+    modes = list(interaction_modes)
+    target_widths = list(our_target_widths_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 1,
         'target_distances': our_target_distances_in_pixels,
         'target_widths': our_target_widths_in_pixels,
     }))
-    random.shuffle(interaction_modes)
-    for mode in interaction_modes:
+    random.shuffle(modes)
+    for mode in modes:
         print('Script.InteractionMode,' + json.dumps({
             'mode': mode,
         }))
-        random.shuffle(our_target_widths_in_pixels)
-        for target_width in our_target_widths_in_pixels:
+        random.shuffle(target_widths)
+        for target_width in target_widths:
             print('Script.TargetWidth,' + json.dumps({
                 'target_width': target_width,
             }))
@@ -175,113 +282,208 @@ def do_multi_mode(blocks, repetitions):
 
 
 def do_latin():
-    positions = []
-    modes = []
-    lines = []
-    for line in sys.stdin:
-        if line.startswith('Script.InteractionMode'):
-            modes.append(line)
-            lines.append('mode')
-        elif line.startswith('Script.BeginBigBlock'):
-            positions.append(line)
-            lines.append('position')
-        else:
-            lines.append(line)
-    modes = modes[1:] + [modes[0]]
-    modes = modes[::-1]
-    positions = positions[1:] + [positions[0]]
-    for line in lines:
-        if line == 'mode':
-            sys.stdout.write(modes.pop())
-        elif line == 'position':
-            sys.stdout.write(positions.pop())
-        else:
-            sys.stdout.write(line)
-    return
+    sys.stdout.writelines(transform_lines(rereadable(sys.stdin), [], permutations=1))
 
 
 def do_swap_side():
-    for line in sys.stdin:
-        if line.startswith('Script.ShowTarget') or \
-           line.startswith('Script.ShowDiscardedTarget') or \
-           line.startswith('Script.ShowTargetIndicator') or \
-           line.startswith('Script.BeginBigBlock'):
-            identifier, _, data = line.partition(',')
+    sys.stdout.writelines(transform_lines(sys.stdin, [SwapSide(our_screen_resolution)]))
+
+
+def do_transform(filename, steps):
+    '''
+    Write a script with each of `steps`, a list of ('permute',),
+    ('swap-side',) or ('rescale', resolution) tuples, applied in order. The
+    resolution of the script is taken to be `our_screen_resolution` until it
+    is rescaled.
+    '''
+    resolution = our_screen_resolution
+    permutations = 0
+    transforms = []
+    for step in steps:
+        if step[0] == 'permute':
+            permutations += 1
+        elif step[0] == 'swap-side':
+            transforms.append(SwapSide(resolution))
+        elif step[0] == 'rescale':
+            transforms.append(Rescale(resolution, step[1]))
+            resolution = step[1]
+    if filename is None:
+        file = sys.stdin
+    else:
+        file = open(filename)
+    with file:
+        if permutations:
+            file = rereadable(file)
+        sys.stdout.writelines(transform_lines(file, transforms, permutations))
+
+
+def parse_resolution(value):
+    '''Parse a resolution given as WIDTHxHEIGHT, in pixels.'''
+    width, _, height = value.partition('x')
+    return (int(width), int(height))
+
+
+class SwapSide(object):
+    '''Mirror the targets and standing positions of a script to the other side of the screen.'''
+    __slots__ = 'resolution'.split()
+    identifiers = ['Script.ShowTarget',
+                   'Script.ShowDiscardedTarget',
+                   'Script.ShowTargetIndicator',
+                   'Script.BeginBigBlock']
+    def __init__(self, resolution):
+        self.resolution = resolution
+    def apply(self, identifier, data):
+        if 'x' in data:
+            data['x'] = self.resolution[0] - data['x']
+        if 'standing_x' in data:
+            data['standing_x'] = self.resolution[0] - data['standing_x']
+
+
+class Rescale(object):
+    '''
+    Scale a script from one screen resolution to another. Positions are
+    scaled along each axis, and widths and distances by the horizontal
+    factor, as the pixel density of the same screen at another resolution.
+    '''
+    __slots__ = 'x_scale y_scale'.split()
+    identifiers = ['Script.Start',
+                   'Script.TargetWidth',
+                   'Script.BeginBigBlock',
+                   'Script.BeginBlock',
+                   'Script.ShowTarget',
+                   'Script.ShowDiscardedTarget',
+                   'Script.ShowTargetIndicator']
+    def __init__(self, resolution, new_resolution):
+        self.x_scale = new_resolution[0] / resolution[0]
+        self.y_scale = new_resolution[1] / resolution[1]
+    def apply(self, identifier, data):
+        for key in ('target_widths', 'target_distances'):
+            if key in data:
+                data[key] = [value * self.x_scale for value in data[key]]
+        for key in ('x', 'standing_x', 'w', 'h', 'target_width', 'distance'):
+            if key in data:
+                data[key] = data[key] * self.x_scale
+        if 'y' in data:
+            data['y'] = data['y'] * self.y_scale
+
+
+def transform_lines(lines, transforms, permutations=0):
+    '''
+    Yield the lines of a script with its interaction modes and standing
+    positions permuted `permutations` times, as for the next participant of a
+    counterbalancing group each time, and with each of `transforms` applied
+    in order.
+
+    Only the lines of events that a transform changes are decoded, once for
+    all of the transforms. Permuting needs the mode and position lines ahead
+    of where they are written, so if there are permutations, `lines` is read
+    twice (seeking a file back to the start in between), keeping only those
+    lines from the first read. The other transforms change each line on its
+    own, so it makes no difference where in the pipeline the permutations
+    are.
+    '''
+    modes = []
+    positions = []
+    if permutations:
+        for line in lines:
+            if line.startswith('Script.InteractionMode'):
+                modes.append(line)
+            elif line.startswith('Script.BeginBigBlock'):
+                positions.append(line)
+        if hasattr(lines, 'seek'):
+            lines.seek(0)
+    # Each permutation writes the modes starting from the second and the
+    # positions starting from the first and then going backwards.
+    mode_order = permutation_order(len(modes), permutations, lambda i, n: (i + 1) % n)
+    position_order = permutation_order(len(positions), permutations, lambda i, n: -i % n)
+    transforms_by_identifier = {}
+    for transform in transforms:
+        for identifier in transform.identifiers:
+            transforms_by_identifier.setdefault(identifier, []).append(transform)
+    mode_index = position_index = 0
+    for line in lines:
+        if modes and line.startswith('Script.InteractionMode'):
+            line = modes[mode_order[mode_index]]
+            mode_index += 1
+        elif positions and line.startswith('Script.BeginBigBlock'):
+            line = positions[position_order[position_index]]
+            position_index += 1
+        identifier, _, data = line.partition(',')
+        line_transforms = transforms_by_identifier.get(identifier)
+        if line_transforms:
             data_dict = json.loads(data)
-            if 'x' in data_dict:
-                data_dict['x'] = our_screen_resolution[0] - data_dict['x']
-            if 'standing_x' in data_dict:
-                data_dict['standing_x'] = our_screen_resolution[0] - data_dict['standing_x']
-            print(identifier + ',' + json.dumps(data_dict))
-        else:
-            sys.stdout.write(line)
-    return
+            for transform in line_transforms:
+                transform.apply(identifier, data_dict)
+            line = identifier + ',' + json.dumps(data_dict) + '\n'
+        yield line
+
+
+def permutation_order(n, permutations, step):
+    '''Return which of n lines is written in each place after permuting them with `step` repeatedly.'''
+    order = list(range(n))
+    for _ in range(permutations):
+        order = [order[step(i, n)] for i in range(n)]
+    return order
+
+
+def rereadable(file):
+    '''Return `file`, or a temporary copy of it if it cannot be read twice (like a pipe).'''
+    import shutil
+    import tempfile
+    if file.seekable():
+        return file
+    copy = tempfile.TemporaryFile('w+')
+    shutil.copyfileobj(file, copy)
+    copy.seek(0)
+    return copy
 
 
 def do_radial(blocks, repetitions):
+    modes = list(interaction_modes)
+    target_widths = list(our_target_widths_in_pixels)
+    distances = list(our_target_distances_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 1,
         'target_distances': our_target_distances_in_pixels,
         'target_widths': our_target_widths_in_pixels,
     }))
-    random.shuffle(interaction_modes)
-    for mode in interaction_modes:
+    random.shuffle(modes)
+    for mode in modes:
         print('Script.InteractionMode,' + json.dumps({
             'mode': mode,
         }))
-        random.shuffle(our_target_widths_in_pixels)
-        for target_width in our_target_widths_in_pixels:
+        random.shuffle(target_widths)
+        for target_width in target_widths:
             print('Script.TargetWidth,' + json.dumps({
                 'target_width': target_width,
             }))
-            random.shuffle(our_target_distances_in_pixels)
-            for target_distance in our_target_distances_in_pixels:
+            random.shuffle(distances)
+            for target_distance in distances:
                 run_length = blocks * repetitions + 1
                 print('Script.BeginBlock,' + json.dumps({
                     'run_length': run_length,
                     'distance': target_distance,
                 }))
-                sys.stdout.flush()
-                screen_position = lambda x, y: (x + our_screen_resolution[0] * 0.5, y + our_screen_resolution[1] * 0.5)
-                target_list = []
-                while True:
-                    distance_to_cover = max(our_target_widths_in_pixels) * 1.5
-                    # Complicated trigonometry goes here
-                    cos_angle = distance_to_cover ** 2 / (2 * target_distance ** 2) - 1
-                    sin_angle = math.sqrt(1 - cos_angle ** 2)
-                    radius = math.sqrt(target_distance * target_distance / (2 * (1 - cos_angle)))
-                    rotate = lambda x, y, cos_angle, sin_angle: (x * cos_angle + y * -sin_angle,
-                                                                 x * sin_angle + y *  cos_angle)
-                    last_x, last_y = (0.0, 0.0)
-                    # Start at a random distance above the horizon, maybe?
-                    y = (target_width * 0.25) * random.choice((-1, 1))
-                    x = math.sqrt(radius ** 2 - y ** 2) * random.choice((-1, 1))
-
-                    screen_x, screen_y = screen_position(x, y)
-                    direction = 1.0
-                    for _ in range(run_length):
-                        # Position on screen from centre of screen
-                        if not target_is_onscreen_and_not_on_seam(screen_x, screen_y, target_width):
-                            # The target is offscreen -- turn around and start moving
-                            # in the other direction. Do so twice, so we don't repeat
-                            # the last position.
-                            direction = -direction
-                            x, y = rotate(x, y, cos_angle, sin_angle * direction)
-                            x, y = rotate(x, y, cos_angle, sin_angle * direction)
-                            screen_x, screen_y = screen_position(x, y)
-                            if not target_is_onscreen_and_not_on_seam(screen_x, screen_y, target_width):
-                                # Target is still not onscreen even after turning
-                                # around. We started in a bad position.
-                                # print('OFF', file=sys.stderr); sys.stderr.flush()
-                                target_list.clear()
-                                break
-                        target_list.append((screen_x, screen_y, euclidean_distance(x, y, last_x, last_y)))
-                        last_x, last_y = x, y
-                        x, y = rotate(x, y, cos_angle, sin_angle * direction)
-                        screen_x, screen_y = screen_position(x, y)
-                    else:
-                        break
+                distance_to_cover = max(our_target_widths_in_pixels) * 1.5
+                # Complicated trigonometry goes here
+                cos_angle = distance_to_cover ** 2 / (2 * target_distance ** 2) - 1
+                sin_angle = math.sqrt(1 - cos_angle ** 2)
+                radius = math.sqrt(target_distance * target_distance / (2 * (1 - cos_angle)))
+                # Start at a random distance above the horizon, maybe? There are
+                # only four starting positions, and a run is determined by its
+                # start, so pick among the starts whose runs stay onscreen.
+                target_lists = []
+                for y_sign, x_sign in itertools.product((-1, 1), (-1, 1)):
+                    y = (target_width * 0.25) * y_sign
+                    x = math.sqrt(radius ** 2 - y ** 2) * x_sign
+                    target_list = radial_run(x, y, cos_angle, sin_angle, run_length, target_width)
+                    if target_list is not None:
+                        target_lists.append(target_list)
+                if not target_lists:
+                    raise ValueError('no radial run of width {} at distance {} stays onscreen'.format(
+                        target_width, target_distance))
+                target_list = random.choice(target_lists)
                 iter_target_list = iter(target_list)
                 x, y, d = next(iter_target_list)
                 print('Script.ShowDiscardedTarget,' + json.dumps({
@@ -299,37 +501,44 @@ def do_radial(blocks, repetitions):
                         'h': target_width,
                         'distance': d,
                     }))
-                sys.stdout.flush()
 
 
 def do_vertical(blocks, repetitions):
+    modes = list(interaction_modes)
+    target_widths = list(our_target_widths_in_pixels)
+    distances = list(our_target_distances_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 1,
         'target_distances': our_target_distances_in_pixels,
         'target_widths': our_target_widths_in_pixels,
     }))
-    random.shuffle(interaction_modes)
-    for mode in interaction_modes:
+    random.shuffle(modes)
+    for mode in modes:
         print('Script.InteractionMode,' + json.dumps({
             'mode': mode,
         }))
-        random.shuffle(our_target_widths_in_pixels)
-        for target_width in our_target_widths_in_pixels:
+        random.shuffle(target_widths)
+        for target_width in target_widths:
             print('Script.TargetWidth,' + json.dumps({
                 'target_width': target_width,
             }))
-            random.shuffle(our_target_distances_in_pixels)
-            for target_distance in our_target_distances_in_pixels:
+            random.shuffle(distances)
+            for target_distance in distances:
                 run_length = blocks * repetitions + 1
                 print('Script.BeginBlock,' + json.dumps({
                     'run_length': run_length,
                     'distance': target_distance,
                 }))
-                sys.stdout.flush()
+                # Only vertical deltas that keep both columns of the run off the
+                # vertical seams are drawn; the rows are still checked as the
+                # run is laid out.
+                v_delta_intervals = vertical_run_deltas(target_width, target_distance,
+                                                        (our_screen_resolution[1] - target_width * 1.1) / 12,
+                                                        (our_screen_resolution[1] - target_width * 1.1) / 3)
                 target_list = []
-                while True:
-                    v_delta = (our_screen_resolution[1] - target_width * 1.1) * random.uniform(1/12, 1/3)
+                for _ in range(max_attempts if v_delta_intervals else 0):
+                    v_delta = sample_intervals(v_delta_intervals)
                     h_delta = math.sqrt(target_distance ** 2.0 - v_delta ** 2.0)
 
                     last_x, last_y = (0.0, 0.0)
@@ -358,6 +567,9 @@ def do_vertical(blocks, repetitions):
                         h_direction = -h_direction
                     else:
                         break
+                else:
+                    raise ValueError('no vertical run of width {} at distance {} stays onscreen'.format(
+                        target_width, target_distance))
                 iter_target_list = iter(target_list)
                 x, y, d = next(iter_target_list)
                 print('Script.ShowDiscardedTarget,' + json.dumps({
@@ -375,34 +587,35 @@ def do_vertical(blocks, repetitions):
                         'h': target_width,
                         'distance': d,
                     }))
-                sys.stdout.flush()
 
 
 def do_rectangular(blocks, repetitions):
+    modes = list(interaction_modes)
+    target_widths = list(our_target_widths_in_pixels)
+    distances = list(our_target_distances_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 1,
         'target_distances': our_target_distances_in_pixels,
         'target_widths': our_target_widths_in_pixels,
     }))
-    random.shuffle(interaction_modes)
-    for mode in interaction_modes:
+    random.shuffle(modes)
+    for mode in modes:
         print('Script.InteractionMode,' + json.dumps({
             'mode': mode,
         }))
-        random.shuffle(our_target_widths_in_pixels)
-        for target_width in our_target_widths_in_pixels:
+        random.shuffle(target_widths)
+        for target_width in target_widths:
             print('Script.TargetWidth,' + json.dumps({
                 'target_width': target_width,
             }))
-            random.shuffle(our_target_distances_in_pixels)
-            for target_distance in our_target_distances_in_pixels:
+            random.shuffle(distances)
+            for target_distance in distances:
                 run_length = ((blocks * repetitions) & ~1) + 1
                 print('Script.BeginBlock,' + json.dumps({
                     'run_length': run_length,
                     'distance': target_distance,
                 }))
-                sys.stdout.flush()
 
                 verticals = (run_length // 3) & ~1
                 vertical_distance = min(our_target_distances_in_pixels)
@@ -436,31 +649,33 @@ def do_rectangular(blocks, repetitions):
                         'h': target_width,
                         'distance': euclidean_distance(x, y, last_x, last_y),
                     }))
-                sys.stdout.flush()
 
 
 def do_strict_rectangular(blocks, repetitions):
+    modes = list(interaction_modes)
+    target_widths = list(our_target_widths_in_pixels)
+    distances = list(our_target_distances_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 1,
         'target_distances': our_target_distances_in_pixels,
         'target_widths': our_target_widths_in_pixels,
     }))
-    random.shuffle(interaction_modes)
-    for mode in interaction_modes:
+    random.shuffle(modes)
+    for mode in modes:
         print('Script.InteractionMode,' + json.dumps({
             'mode': mode,
         }))
-        our_target_distances_in_pixels.sort();
-        minimum_distance, rest_of_distances = our_target_distances_in_pixels[0], our_target_distances_in_pixels[1:];
+        distances.sort();
+        minimum_distance, rest_of_distances = distances[0], distances[1:];
         # For the first run, do the longest distance first, as that will
         # encourage people to use the distance interaction technique from
         # the outset.
         rest_of_distances = sorted(rest_of_distances)[::-1]
         widths_and_distances = []
         for i in range(blocks):
-            random.shuffle(our_target_widths_in_pixels)
-            for width in our_target_widths_in_pixels:
+            random.shuffle(target_widths)
+            for width in target_widths:
                 for distance in rest_of_distances:
                     widths_and_distances.append((width, distance))
                 # For the rest of the runs, use a random order for distances.
@@ -481,7 +696,6 @@ def do_strict_rectangular(blocks, repetitions):
                 'run_length': len(movements) + 1,
                 'distance': target_distance,
             }))
-            sys.stdout.flush()
 
             for i, (dx, dy) in enumerate(((1, 1), (1, -1), (-1, 1), (-1, -1))):
                 print('Script.ShowTargetIndicator,' + json.dumps({
@@ -516,23 +730,25 @@ def do_strict_rectangular(blocks, repetitions):
                 print('Script.HideTargetIndicator,' + json.dumps({
                     'id': i
                 }))
-            sys.stdout.flush()
 
 
 def do_aligned_rectangular(blocks, repetitions):
+    modes = list(interaction_modes)
+    target_widths = list(our_target_widths_in_pixels)
+    distances = list(our_target_distances_in_pixels)
     target_distances = our_target_distances_in_pixels * repetitions
     print('Script.Start,' + json.dumps({
         'multiple_modes': 1,
         'target_distances': our_target_distances_in_pixels,
         'target_widths': our_target_widths_in_pixels,
     }))
-    random.shuffle(interaction_modes)
-    for mode in interaction_modes:
+    random.shuffle(modes)
+    for mode in modes:
         print('Script.InteractionMode,' + json.dumps({
             'mode': mode,
         }))
-        our_target_distances_in_pixels.sort();
-        minimum_distance, rest_of_distances = our_target_distances_in_pixels[0], our_target_distances_in_pixels[1:];
+        distances.sort();
+        minimum_distance, rest_of_distances = distances[0], distances[1:];
         widths_and_distances = []
         standing_position_index = 0
         for i in range(blocks):
@@ -544,14 +760,14 @@ def do_aligned_rectangular(blocks, repetitions):
                 rest_of_distances = sorted(rest_of_distances)[::-1]
             else:
                 random.shuffle(rest_of_distances)
-            random.shuffle(our_target_widths_in_pixels)
-            for width in our_target_widths_in_pixels:
+            random.shuffle(target_widths)
+            for width in target_widths:
                 for distance in rest_of_distances:
                     widths_and_distances.append((width, distance, our_standing_positions[standing_position_index]))
                 random.shuffle(rest_of_distances)
             standing_position_index = (standing_position_index + 1) % len(our_standing_positions)
         for wd_i, (target_width, target_distance, standing_position) in enumerate(widths_and_distances):
-            if wd_i % (len(rest_of_distances) * len(our_target_widths_in_pixels)) == 0:
+            if wd_i % (len(rest_of_distances) * len(target_widths)) == 0:
                 print('Script.BeginBigBlock,' + json.dumps({
                     'standing_x': standing_position
                 }))
@@ -573,7 +789,6 @@ def do_aligned_rectangular(blocks, repetitions):
                 'run_length': len(index_changes) + 1,
                 'distance': target_distance,
             }))
-            sys.stdout.flush()
 
             for i, (x, y) in enumerate(target_positions):
                 print('Script.ShowTargetIndicator,' + json.dumps({
@@ -610,7 +825,6 @@ def do_aligned_rectangular(blocks, repetitions):
                 print('Script.HideTargetIndicator,' + json.dumps({
                     'id': i
                 }))
-            sys.stdout.flush()
 
 
 def euclidean_distance(x1, y1, x2, y2):
@@ -618,7 +832,7 @@ def euclidean_distance(x1, y1, x2, y2):
 
 
 def target_is_onscreen_and_not_on_seam(x, y, w):
-    return target_is_onscreen(x, y, w) and not target_is_on_seam(x, y, w)
+    return target_feasibility(w).contains(x, y)
 
 
 def target_is_onscreen(x, y, w):
@@ -633,7 +847,209 @@ def target_is_on_seam(x, y, w):
            any(y - w < seam and y + w > seam for seam in our_screen_horizontal_seams)
 
 
+def targets_are_onscreen_and_not_on_seam(xs, ys, w):
+    '''The same test as `target_is_onscreen_and_not_on_seam`, on NumPy arrays of positions.'''
+    return target_feasibility(w).contains_array(xs, ys)
+
+
+class TargetFeasibility(object):
+    '''
+    Where the centre of a target of width `w` can be placed. A target has to
+    be onscreen and off the seams on each axis separately, so each axis is a
+    sorted list of disjoint (low, high) intervals: the open interval in which
+    the target is onscreen, less the open bands around each seam that the
+    target would overlap. Testing a position is then a search among a handful
+    of intervals per axis.
+    '''
+    __slots__ = 'w x_intervals y_intervals x_lows y_lows x_highs y_highs x_onscreen y_onscreen'.split()
+    def __init__(self, w):
+        self.w = w
+        self.x_onscreen = (our_screen_border + w / 2, our_screen_resolution[0] - our_screen_border - w / 2)
+        self.y_onscreen = (our_screen_border + w / 2, our_screen_resolution[1] - our_screen_border - w / 2)
+        self.x_intervals = subtract_bands([self.x_onscreen], [(seam - w, seam + w)
+                                                               for seam in our_screen_vertical_seams])
+        self.y_intervals = subtract_bands([self.y_onscreen], [(seam - w, seam + w)
+                                                               for seam in our_screen_horizontal_seams])
+        self.x_lows = [low for low, high in self.x_intervals]
+        self.x_highs = [high for low, high in self.x_intervals]
+        self.y_lows = [low for low, high in self.y_intervals]
+        self.y_highs = [high for low, high in self.y_intervals]
+    def contains(self, x, y):
+        # The onscreen bounds are open, while the edges of a seam band are not
+        # on the seam.
+        if not (self.x_onscreen[0] < x < self.x_onscreen[1] and self.y_onscreen[0] < y < self.y_onscreen[1]):
+            return False
+        i = bisect.bisect_right(self.x_lows, x) - 1
+        j = bisect.bisect_right(self.y_lows, y) - 1
+        return i >= 0 and x <= self.x_highs[i] and j >= 0 and y <= self.y_highs[j]
+    def contains_array(self, xs, ys):
+        import numpy
+        valid = (xs > self.x_onscreen[0]) & (xs < self.x_onscreen[1]) & \
+                (ys > self.y_onscreen[0]) & (ys < self.y_onscreen[1])
+        for values, lows, highs in ((xs, self.x_lows, self.x_highs), (ys, self.y_lows, self.y_highs)):
+            if not lows:
+                return numpy.zeros(numpy.shape(values), dtype=bool)
+            indices = numpy.searchsorted(lows, values, side='right') - 1
+            valid &= (indices >= 0) & (values <= numpy.take(highs, numpy.maximum(indices, 0)))
+        return valid
+    def admits_distance(self, distance):
+        '''
+        Return whether two targets can be placed `distance` apart. Where a
+        target can be placed is a union of rectangles, and the distances
+        between the points of two rectangles form an interval, so this checks
+        whether the distance is in the interval of any pair of rectangles.
+        '''
+        rectangles = list(itertools.product(self.x_intervals, self.y_intervals))
+        for (first_x, first_y), (second_x, second_y) in itertools.product(rectangles, repeat=2):
+            nearest = math.hypot(max(0, second_x[0] - first_x[1], first_x[0] - second_x[1]),
+                                 max(0, second_y[0] - first_y[1], first_y[0] - second_y[1]))
+            furthest = math.hypot(max(second_x[1] - first_x[0], first_x[1] - second_x[0]),
+                                  max(second_y[1] - first_y[0], first_y[1] - second_y[0]))
+            if nearest <= distance < furthest:
+                return True
+        return False
+    def sample(self):
+        '''Return a position drawn uniformly from where the target can be placed.'''
+        return sample_intervals(self.x_intervals), sample_intervals(self.y_intervals)
+
+
+target_feasibilities = {}
+
+
+def target_feasibility(w):
+    '''Return the `TargetFeasibility` of width `w`, computed once per width.'''
+    if w not in target_feasibilities:
+        target_feasibilities[w] = TargetFeasibility(w)
+    return target_feasibilities[w]
+
+
+def subtract_bands(intervals, bands):
+    '''Remove each (low, high) band from a sorted list of disjoint (low, high) intervals.'''
+    intervals = [(low, high) for low, high in intervals if low < high]
+    for band_low, band_high in bands:
+        remaining = []
+        for low, high in intervals:
+            if band_high <= low or band_low >= high:
+                remaining.append((low, high))
+                continue
+            if low < band_low:
+                remaining.append((low, band_low))
+            if band_high < high:
+                remaining.append((band_high, high))
+        intervals = remaining
+    return intervals
+
+
+def intersect_intervals(first, second):
+    '''Return the intersection of two sorted lists of disjoint (low, high) intervals.'''
+    intersection = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        low = max(first[i][0], second[j][0])
+        high = min(first[i][1], second[j][1])
+        if low < high:
+            intersection.append((low, high))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return intersection
+
+
+def sample_intervals(intervals):
+    '''Return a value drawn uniformly from a list of (low, high) intervals.'''
+    if not intervals:
+        raise ValueError('cannot sample from an empty set of intervals')
+    offset = random.uniform(0, sum(high - low for low, high in intervals))
+    for low, high in intervals:
+        if offset <= high - low:
+            return low + offset
+        offset -= high - low
+    return intervals[-1][1]
+
+
+def vertical_run_deltas(w, target_distance, low, high):
+    '''
+    Return the vertical deltas between `low` and `high` for which both columns
+    of a vertical run, half the horizontal delta either side of the centre of
+    the screen, are onscreen and off the vertical seams, as (low, high)
+    intervals.
+    '''
+    centre = our_screen_resolution[0] * 0.5
+    x_intervals = target_feasibility(w).x_intervals
+    # The horizontal deltas that put each column in a feasible interval.
+    right = [(2 * (x_low - centre), 2 * (x_high - centre)) for x_low, x_high in x_intervals]
+    left = [(2 * (centre - x_high), 2 * (centre - x_low)) for x_low, x_high in x_intervals[::-1]]
+    h_intervals = intersect_intervals(intersect_intervals(right, left), [(0, target_distance)])
+    # The vertical delta falls as the horizontal delta rises.
+    v_intervals = [(math.sqrt(target_distance ** 2 - h_high ** 2), math.sqrt(target_distance ** 2 - h_low ** 2))
+                   for h_low, h_high in h_intervals[::-1]]
+    return intersect_intervals(v_intervals, [(low, high)])
+
+
+def radial_run(x, y, cos_angle, sin_angle, run_length, target_width):
+    '''
+    Lay out a radial run from (x, y), relative to the centre of the screen,
+    rotating by the given angle and turning around at the edges. Return the
+    list of (x, y, distance) screen positions, or None if the run cannot stay
+    onscreen from this start.
+    '''
+    screen_position = lambda x, y: (x + our_screen_resolution[0] * 0.5, y + our_screen_resolution[1] * 0.5)
+    rotate = lambda x, y, cos_angle, sin_angle: (x * cos_angle + y * -sin_angle,
+                                                 x * sin_angle + y *  cos_angle)
+    target_list = []
+    last_x, last_y = (0.0, 0.0)
+    screen_x, screen_y = screen_position(x, y)
+    direction = 1.0
+    for _ in range(run_length):
+        # Position on screen from centre of screen
+        if not target_is_onscreen_and_not_on_seam(screen_x, screen_y, target_width):
+            # The target is offscreen -- turn around and start moving
+            # in the other direction. Do so twice, so we don't repeat
+            # the last position.
+            direction = -direction
+            x, y = rotate(x, y, cos_angle, sin_angle * direction)
+            x, y = rotate(x, y, cos_angle, sin_angle * direction)
+            screen_x, screen_y = screen_position(x, y)
+            if not target_is_onscreen_and_not_on_seam(screen_x, screen_y, target_width):
+                # Target is still not onscreen even after turning
+                # around. We started in a bad position.
+                return None
+        target_list.append((screen_x, screen_y, euclidean_distance(x, y, last_x, last_y)))
+        last_x, last_y = x, y
+        x, y = rotate(x, y, cos_angle, sin_angle * direction)
+        screen_x, screen_y = screen_position(x, y)
+    return target_list
+
+
+def angle_candidate_tables():
+    '''Return the sines and cosines of `angle_candidates` (in degrees) as NumPy arrays, computed once.'''
+    global angle_candidate_sines, angle_candidate_cosines
+    if angle_candidate_sines is None:
+        import numpy
+        angle_radians = numpy.array(angle_candidates, dtype=float) / 180.0 * math.pi
+        angle_candidate_sines = numpy.sin(angle_radians)
+        angle_candidate_cosines = numpy.cos(angle_radians)
+    return angle_candidate_sines, angle_candidate_cosines
+
+
 def generate_width_block(w, target_distances):
+    '''
+    Return a list of (x, y, distance) target positions, starting at a random
+    position and then moving by each of the target distances in turn (the
+    list is shuffled in place). Each move is in a direction chosen uniformly
+    among the angle candidates that leave the target onscreen and off the
+    seams; every candidate is tested at once. If no candidate fits some
+    distance, the block is started over from a new position in a new order.
+    A ValueError is raised up front if two targets can never be placed one
+    of the distances apart, as the block would be started over forever.
+    '''
+    import numpy
+    feasibility = target_feasibility(w)
+    for distance in sorted(set(target_distances)):
+        if not feasibility.admits_distance(distance):
+            raise ValueError('targets of width {} cannot be placed {} apart'.format(w, distance))
+    angle_sines, angle_cosines = angle_candidate_tables()
     while True:
         target_positions = list()
         initial_target_position_x = random.randrange(int(our_screen_border + w),
@@ -644,27 +1060,20 @@ def generate_width_block(w, target_distances):
         random.shuffle(target_distances)
         for distance in target_distances:
             last_target_x, last_target_y, _ = target_positions[-1]
-            random.shuffle(angle_candidates)
-            for angle_candidate in angle_candidates:
-                angle_radians = angle_candidate / 180.0 * math.pi
-                angle_sin = math.sin(angle_radians)
-                angle_cos = math.cos(angle_radians)
-                new_target_position_x = last_target_x + angle_sin * distance
-                new_target_position_y = last_target_y + angle_cos * distance
-                if target_is_onscreen_and_not_on_seam(new_target_position_x, new_target_position_y, w):
-                    target_positions.append((new_target_position_x, new_target_position_y, distance))
-                    break
-                else:
-                    continue
-            else:
-                # We got to the end of the angle candidates without hitting a
-                # break, so no angle candidate was valid. This target distance
-                # cannot be fulfilled.
+            new_target_positions_x = last_target_x + angle_sines * distance
+            new_target_positions_y = last_target_y + angle_cosines * distance
+            valid = numpy.flatnonzero(targets_are_onscreen_and_not_on_seam(new_target_positions_x,
+                                                                           new_target_positions_y, w))
+            if len(valid) == 0:
+                # No angle candidate was valid. This target distance cannot
+                # be fulfilled.
                 break
+            index = random.choice(valid)
+            target_positions.append((float(new_target_positions_x[index]),
+                                     float(new_target_positions_y[index]),
+                                     distance))
         else:
-            # We got to the end of the target distances without breaking out of
-            # the loop. This means every target distance was achieved. We have
-            # a valid width block.
+            # Every target distance was achieved. We have a valid width block.
             return target_positions
 
 
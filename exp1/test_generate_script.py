@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+'''
+Tests that width blocks are generated for every seed at the default widths
+and distances, and that only distances no two targets can be apart fail.
+'''
+
+import io
+import math
+import random
+import unittest
+import contextlib
+
+import generate_script
+
+
+class GenerateWidthBlockTest(unittest.TestCase):
+    def test_default_widths_for_many_seeds(self):
+        for seed in range(100):
+            for w in generate_script.our_target_widths_in_pixels:
+                random.seed(seed)
+                distances = generate_script.our_target_distances_in_pixels * 3
+                block = generate_script.generate_width_block(w, distances)
+                self.assertEqual(len(block), len(distances) + 1)
+                for (last_x, last_y, _), (x, y, distance) in zip(block, block[1:]):
+                    self.assertAlmostEqual(math.hypot(x - last_x, y - last_y), distance, places=6)
+                    self.assertTrue(generate_script.target_is_onscreen_and_not_on_seam(x, y, w))
+
+    def test_random_scripts_for_many_seeds(self):
+        for seed in range(10):
+            random.seed(seed)
+            with contextlib.redirect_stdout(io.StringIO()):
+                generate_script.generate('random', None, 4, 3)
+
+    def test_infeasible_distance(self):
+        w = generate_script.our_target_widths_in_pixels[-1]
+        feasibility = generate_script.target_feasibility(w)
+        for distance in generate_script.our_target_distances_in_pixels:
+            self.assertTrue(feasibility.admits_distance(distance))
+        self.assertFalse(feasibility.admits_distance(generate_script.our_screen_resolution[0]))
+        with self.assertRaises(ValueError):
+            generate_script.generate_width_block(w, [generate_script.our_screen_resolution[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+
+'''
+Keeps parsed trials resident in memory so that notebooks and scripts can
+share them instead of each reading and decoding the same logs again.
+
+The daemon reads each log once, through Trial, the first time it is asked
+for, and keeps three tables of it in shared memory: its events, its kill
+data and its touch data, as from logfile_to_csv.py. Each table is a block
+of columns, one NumPy array after another, which a client maps straight
+into NumPy without copying them. Strings are kept as codes into a list of
+the values they stand for, with None as code 0. Every table has a Time_ms
+column, the time since the start of the trial, so that a request can ask
+for only the rows of a window of time.
+
+Requests are served over a Unix socket, one JSON object per line each way.
+When the tables kept are over the memory limit, whole trials are dropped,
+least recently used first; a client that still has the tables of a dropped
+trial can keep using them, as the memory is only freed once they are all
+closed. The trial of a table just answered is pinned until the client that
+asked makes its next request or goes, so that it cannot be freed before the
+client has mapped it, and each request tells a client which of the tables it
+has mapped were dropped, so that it unmaps them once they are unused. A log
+that has changed since it was read is read again.
+
+    python analysis_daemon.py serve --memory-limit 4096 &
+    python analysis_daemon.py query LOG kills --start-ms 60000 --end-ms 120000
+
+From Python:
+
+    from analysis_daemon import AnalysisClient
+    with AnalysisClient() as client:
+        kills = client.kills(log)
+        kills['EnemyLiveTime_ms'].mean()
+'''
+
+import os
+import csv
+import sys
+import json
+import socket
+import tempfile
+import threading
+import collections
+import socketserver
+from multiprocessing import shared_memory
+
+import numpy
+
+from logfile_to_csv import Trial, TrialState, ScriptRegistry, kill_rows, touch_rows, kill_row_keys, touch_row_keys
+
+
+default_socket = os.path.join(tempfile.gettempdir(), 'hybrid-touch-analysis-{}.sock'.format(os.getuid()))
+
+# The columns of the events table: the fields most events have, decoded
+# from their JSON; the other fields are not kept.
+event_row_keys = ['Time_ms',
+                  'LineNumber',
+                  'Identifier',
+                  'Id',
+                  'Participant',
+                  'X',
+                  'Y']
+
+tables = ['events', 'kills', 'touches']
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Keep parsed trials in shared memory for analysis.')
+    parser.add_argument('--socket', type=str, default=default_socket, help='the Unix socket the daemon listens '
+            'on (default: {})'.format(default_socket))
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='run the daemon')
+    serve_parser.add_argument('--memory-limit', type=float, default=2048, help='the most memory in MB the '
+            'tables kept may use before trials are dropped (default: 2048)')
+    serve_parser.add_argument('--script', type=str, default=None, help='the script that all trials were run '
+            'from (default: the script named in each log, looked for in the data folder of the game)')
+    query_parser = commands.add_parser('query', help='write a table of a log as csv')
+    query_parser.add_argument('log', type=str, help='the log to query')
+    query_parser.add_argument('table', type=str, choices=tables, help='the table to write')
+    query_parser.add_argument('--start-ms', type=float, default=None, help='only write the rows from this time '
+            'since the start of the trial')
+    query_parser.add_argument('--end-ms', type=float, default=None, help='only write the rows before this time '
+            'since the start of the trial')
+    commands.add_parser('status', help='list the trials kept and the memory they use')
+    commands.add_parser('stop', help='stop the daemon')
+    arguments = parser.parse_args()
+
+    if arguments.command == 'serve':
+        serve(arguments.socket, TrialCache(ScriptRegistry(arguments.script), arguments.memory_limit * 1024 * 1024))
+        return 0
+    with AnalysisClient(arguments.socket) as client:
+        if arguments.command == 'query':
+            columns = client.table(arguments.log, arguments.table, arguments.start_ms, arguments.end_ms)
+            writer = csv.writer(sys.stdout)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*(column.tolist() for column in columns.values())))
+        elif arguments.command == 'status':
+            json.dump(client.status(), sys.stdout, indent=1)
+            print()
+        elif arguments.command == 'stop':
+            client.stop()
+    return 0
+
+
+class ResidentTrial(object):
+    '''The shared tables of a log, and the size and modification time of the log when it was read.'''
+    __slots__ = '''
+        filename
+        size
+        mtime
+        blocks
+        layouts
+        nbytes
+        pins
+        dropped
+    '''.split()
+
+
+class TrialCache(object):
+    '''
+    The trials kept by the daemon, from least to most recently used, which
+    keeps the memory of their tables within `memory_limit` bytes by
+    dropping the least recently used. The most recently used trial is kept
+    even if it is over the limit by itself. A dropped trial that is pinned
+    is only freed once it is unpinned.
+    '''
+    def __init__(self, scripts, memory_limit):
+        self.scripts = scripts
+        self.memory_limit = memory_limit
+        self.trials = collections.OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.RLock()
+    def get(self, filename):
+        '''Return the resident trial of a log, reading it first if it is not kept or has changed.'''
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        with self.lock:
+            resident = self.trials.get(filename)
+            if resident is not None and (resident.size, resident.mtime) == (stat.st_size, stat.st_mtime_ns):
+                self.trials.move_to_end(filename)
+                return resident
+            if resident is not None:
+                self.drop(filename)
+            resident = ResidentTrial()
+            resident.filename = filename
+            resident.size = stat.st_size
+            resident.mtime = stat.st_mtime_ns
+            resident.blocks = {}
+            resident.layouts = {}
+            resident.nbytes = 0
+            resident.pins = 0
+            resident.dropped = False
+            try:
+                for table, columns in read_tables(filename, self.scripts).items():
+                    block, layout = share_table(columns)
+                    resident.blocks[table] = block
+                    resident.layouts[table] = layout
+                    resident.nbytes += block.size
+            except:
+                release(resident)
+                raise
+            self.trials[filename] = resident
+            self.nbytes += resident.nbytes
+            while self.nbytes > self.memory_limit and len(self.trials) > 1:
+                self.drop(next(iter(self.trials)))
+            return resident
+    def table(self, filename, table, start_ms=None, end_ms=None, pins=None):
+        '''
+        Return the layout of a table of a log, with the `start` and `stop`
+        of its rows from `start_ms` up to `end_ms` since the trial started.
+        The trial is pinned and added to `pins`, unless it is None, to be
+        unpinned by `unpin` once the table has been mapped.
+        '''
+        with self.lock:
+            resident = self.get(filename)
+            if pins is not None:
+                resident.pins += 1
+                pins.append(resident)
+            layout = dict(resident.layouts[table])
+            start, stop = 0, layout['length']
+            if start_ms is not None or end_ms is not None:
+                # The rows of every table are in time order.
+                time_column = next(column for column in layout['columns'] if column['name'] == 'Time_ms')
+                times = numpy.ndarray((layout['length'],), dtype=time_column['dtype'],
+                                      buffer=resident.blocks[table].buf, offset=time_column['offset'])
+                if start_ms is not None:
+                    start = int(numpy.searchsorted(times, start_ms, side='left'))
+                if end_ms is not None:
+                    stop = int(numpy.searchsorted(times, end_ms, side='left'))
+                # The block cannot be closed while a view of it exists.
+                del times
+            layout['start'] = start
+            layout['stop'] = max(start, stop)
+            return layout
+    def drop(self, filename):
+        resident = self.trials.pop(filename)
+        self.nbytes -= resident.nbytes
+        resident.dropped = True
+        if not resident.pins:
+            release(resident)
+    def unpin(self, pins):
+        '''Unpin the trials of `pins`, and free those that were dropped while they were pinned.'''
+        with self.lock:
+            while pins:
+                resident = pins.pop()
+                resident.pins -= 1
+                if resident.dropped and not resident.pins:
+                    release(resident)
+    def dropped_blocks(self, names):
+        '''Return those of the block `names` that are not of a trial kept.'''
+        with self.lock:
+            kept = set(block.name for resident in self.trials.values() for block in resident.blocks.values())
+            return [name for name in names if name not in kept]
+    def status(self):
+        with self.lock:
+            return {'memory_limit': self.memory_limit,
+                    'nbytes': self.nbytes,
+                    'trials': [{'log': resident.filename, 'nbytes': resident.nbytes,
+                                'rows': {table: layout['length'] for table, layout in resident.layouts.items()}}
+                               for resident in self.trials.values()]}
+    def close(self):
+        with self.lock:
+            while self.trials:
+                self.drop(next(iter(self.trials)))
+
+
+def release(resident):
+    '''Free the shared memory of a trial, once the clients using it have closed it.'''
+    for block in resident.blocks.values():
+        block.close()
+        block.unlink()
+
+
+def read_tables(filename, scripts):
+    '''
+    Read a log once and return its events, kills and touches tables, each
+    a dictionary from column name to a NumPy array.
+    '''
+    trial = Trial(filename, ignore=set())
+    start_timestamp = trial.last_timestamp
+    state = TrialState(trial)
+    kills = list(kill_rows(0, trial, state, scripts.waves(trial)))
+    touches = list(touch_rows(0, trial, state))
+    events = trial.events
+
+    event_rows = []
+    kill_times = []
+    touch_times = []
+    for event in events:
+        data = event.data
+        event_id = data.get('id')
+        event_rows.append((event.timestamp - start_timestamp, event.line_number, event.identifier,
+                           event_id if isinstance(event_id, int) else -1, data.get('participant'),
+                           data.get('x'), data.get('y')))
+        # The kill and touch rows follow these events, in order.
+        if event.identifier == 'Trial.EnemyHit':
+            kill_times.append(event.timestamp - start_timestamp)
+        elif event.identifier == 'Input.RawTouchMove':
+            touch_times.append(event.timestamp - start_timestamp)
+    assert len(kill_times) == len(kills) and len(touch_times) == len(touches)
+
+    return {'events': table_columns(event_row_keys, event_rows),
+            'kills': table_columns(['Time_ms'] + kill_row_keys[1:],
+                                   [[time] + row_data[1:] for time, row_data in zip(kill_times, kills)]),
+            'touches': table_columns(['Time_ms'] + touch_row_keys[1:],
+                                     [[time] + row_data[1:] for time, row_data in zip(touch_times, touches)])}
+
+
+def table_columns(row_keys, rows):
+    '''
+    Turn rows into a dictionary of NumPy columns. A column of whole numbers
+    is int64, unless it has a None; other numbers are float64, with NaN for
+    None; and a column with strings is a tuple of an int32 array of codes
+    and the list of the strings they stand for, with None first.
+    '''
+    columns = collections.OrderedDict()
+    for key, values in zip(row_keys, zip(*rows) if rows else [()] * len(row_keys)):
+        if any(isinstance(value, str) for value in values):
+            categories = [None] + sorted(set(value for value in values if value is not None))
+            codes = {category: code for code, category in enumerate(categories)}
+            columns[key] = (numpy.array([codes[value] for value in values], dtype=numpy.int32), categories)
+        elif values and all(isinstance(value, int) for value in values):
+            columns[key] = numpy.array(values, dtype=numpy.int64)
+        else:
+            columns[key] = numpy.array([numpy.nan if value is None else value for value in values],
+                                       dtype=numpy.float64)
+    return columns
+
+
+def share_table(columns):
+    '''
+    Copy the columns of a table into a new block of shared memory, one after
+    another, and return the block and the layout a client needs to map it.
+    '''
+    layout = {'length': None, 'columns': []}
+    offset = 0
+    arrays = []
+    for key, column in columns.items():
+        array, categories = column if isinstance(column, tuple) else (column, None)
+        layout['length'] = len(array)
+        # Every column starts on an 8 byte boundary.
+        offset = (offset + 7) // 8 * 8
+        layout['columns'].append({'name': key, 'dtype': array.dtype.str, 'offset': offset,
+                                  'categories': categories})
+        arrays.append((offset, array))
+        offset += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    layout['block'] = block.name
+    for offset, array in arrays:
+        numpy.ndarray(array.shape, dtype=array.dtype, buffer=block.buf, offset=offset)[:] = array
+    return block, layout
+
+
+def serve(socket_path, cache):
+    '''Answer requests on `socket_path` until a stop request, dropping every trial kept at the end.'''
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # The trials pinned by the last request, which the client has
+            # mapped once it makes another.
+            pins = []
+            try:
+                for line in self.rfile:
+                    cache.unpin(pins)
+                    try:
+                        response = answer(cache, json.loads(line), pins)
+                    except Exception as error:
+                        response = {'error': '{}: {}'.format(type(error).__name__, error)}
+                    self.wfile.write(json.dumps(response).encode() + b'\n')
+                    if response.get('stopping'):
+                        threading.Thread(target=self.server.shutdown).start()
+                        return
+            finally:
+                cache.unpin(pins)
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler)
+    server.daemon_threads = True
+    try:
+        print("Serving on", socket_path, file=sys.stderr)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cache.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def answer(cache, request, pins=None):
+    '''
+    Answer a single request. `table` requests name a `log` and one of
+    `tables`, and may give a `start_ms` and `end_ms`; they are answered with
+    the layout of the table and the range of its rows in that window, which
+    pins its trial to `pins`. They may also list the blocks the client has
+    `mapped`, of which those that have been dropped are answered as
+    `dropped`.
+    '''
+    if request['op'] == 'table':
+        if request['table'] not in tables:
+            raise ValueError('no such table: {}'.format(request['table']))
+        layout = cache.table(request['log'], request['table'], request.get('start_ms'), request.get('end_ms'),
+                             pins)
+        layout['dropped'] = cache.dropped_blocks(request.get('mapped', []))
+        return layout
+    if request['op'] == 'status':
+        return cache.status()
+    if request['op'] == 'stop':
+        return {'stopping': True}
+    raise ValueError('no such request: {}'.format(request['op']))
+
+
+class AnalysisClient(object):
+    '''
+    A connection to the daemon. Tables are returned as ordered dictionaries
+    from column name to a NumPy array; numeric columns are read-only views of
+    the shared memory, and string columns are object arrays decoded from their
+    codes. The shared memory of a trial stays mapped until the daemon has
+    dropped it, or the client is closed, and its views are no longer used.
+    '''
+    def __init__(self, socket_path=default_socket):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_path)
+        self.file = self.connection.makefile('rwb')
+        self.blocks = {}
+    def request(self, request):
+        self.file.write(json.dumps(request).encode() + b'\n')
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+    def table(self, log, table, start_ms=None, end_ms=None):
+        '''Return a table of a log, or only its rows from `start_ms` up to `end_ms` since the trial started.'''
+        layout = self.request({'op': 'table', 'log': os.path.abspath(log), 'table': table,
+                               'start_ms': start_ms, 'end_ms': end_ms, 'mapped': list(self.blocks)})
+        for name in layout['dropped']:
+            self.unmap(name)
+        block = self.blocks.get(layout['block'])
+        if block is None:
+            block = self.blocks[layout['block']] = attach_block(layout['block'])
+        columns = collections.OrderedDict()
+        for column in layout['columns']:
+            # Unlike an ndarray made on the buffer, these keep the block from
+            # being unmapped while they are in use.
+            array = numpy.frombuffer(block.buf, dtype=column['dtype'], count=layout['length'],
+                                     offset=column['offset'])[layout['start']:layout['stop']]
+            if column['categories'] is not None:
+                array = numpy.array(column['categories'], dtype=object)[array]
+            columns[column['name']] = array
+        return columns
+    def events(self, log, start_ms=None, end_ms=None):
+        return self.table(log, 'events', start_ms, end_ms)
+    def kills(self, log, start_ms=None, end_ms=None):
+        return self.table(log, 'kills', start_ms, end_ms)
+    def touches(self, log, start_ms=None, end_ms=None):
+        return self.table(log, 'touches', start_ms, end_ms)
+    def status(self):
+        return self.request({'op': 'status'})
+    def stop(self):
+        self.request({'op': 'stop'})
+    def unmap(self, name):
+        '''Unmap a block the daemon has dropped, once the columns of it are no longer used.'''
+        detach_block(self.blocks.pop(name))
+    def close(self):
+        self.file.close()
+        self.connection.close()
+        for block in self.blocks.values():
+            detach_block(block)
+        self.blocks.clear()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_block(name):
+    '''
+    Map a block of shared memory made by the daemon. The daemon frees it,
+    so it must not be freed by this process's resource tracker when the
+    process exits.
+    '''
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching always registers the block.
+        from multiprocessing import resource_tracker
+        block = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+def detach_block(block):
+    '''
+    Unmap a block of shared memory, or if columns of it are still in use,
+    leave it to be unmapped with the last of them, which hold the mapping.
+    '''
+    try:
+        block.close()
+    except BufferError:
+        block._mmap = None
+        block.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
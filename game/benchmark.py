@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+'''
+Benchmarks the kill and touch data export of logfile_to_csv.py, and checks
+that its output has not changed.
+
+Each log of the corpus is exported by running logfile_to_csv.py on it, one
+at a time, in a process of its own, so that whatever main() does is timed
+and checked. The wall time is the fastest of a few runs. One more run with
+--stats breaks the export down into decoding the events, handling them
+(passing them through the trial state and building the rows) and writing
+the rows, and records the peak resident memory where the platform reports it; the
+time to read the bytes of the log is timed separately. Only the wall time
+and the peak memory are checked for regressions. The csv written is
+compared with a golden copy kept from an earlier run.
+
+By default the corpus is simulated by simulate.py from the game's script,
+at several session lengths, with fixed seeds, so that it is the same on
+every machine; it is only simulated once and then kept. A directory of
+real logs can be benchmarked instead.
+
+Every run is appended to a JSON history. A run fails, with exit status 1, if
+any output differs from its golden copy, or if any export is slower or uses
+more memory than the median of the last few runs by more than a threshold,
+on top of the usual spread of those runs.
+'''
+
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import tempfile
+import subprocess
+import datetime
+import statistics
+
+
+result_row_keys = ['Corpus',
+                   'Log',
+                   'Mode',
+                   'Bytes',
+                   'Events',
+                   'Rows',
+                   'Read_s',
+                   'Decode_s',
+                   'State_s',
+                   'Write_s',
+                   'Wall_s',
+                   'EventsPerSecond',
+                   'RowsPerSecond',
+                   'PeakRSS_MB',
+                   'Golden',
+                   'Regression']
+
+# The metrics that are checked for regressions; all of them are worse when higher.
+# The stages come from a single run with --stats, which is too noisy to check,
+# and are only there to tell where the time went.
+checked_metrics = ['Wall_s', 'PeakRSS_MB']
+
+# Stages shorter than this are too noisy to be checked.
+minimum_checked_time = 0.05
+
+# A metric may be worse than its median by this many median absolute
+# deviations of the previous runs, on top of the threshold.
+noise_deviations = 3
+
+converter = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logfile_to_csv.py')
+
+corpus_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script', 'script.csv')
+corpus_start = datetime.datetime(2019, 10, 1, 10, 0, 0)
+corpus_seed = 'benchmark'
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the kill and touch data export and check its output.')
+    parser.add_argument('--logs', type=str, default=None, help='benchmark the logs of this directory instead of '
+            'the simulated corpus')
+    parser.add_argument('--durations', type=float, nargs='+', default=[0, 600, 1800], help='the lengths in '
+            'seconds of the simulated sessions of the corpus, where 0 plays the script once (default: 0 600 1800)')
+    parser.add_argument('--corpus-dir', type=str, default=os.path.join('benchmark', 'corpus'), help='the '
+            'directory in which the simulated corpus is kept (default: benchmark/corpus)')
+    parser.add_argument('--golden-dir', type=str, default=os.path.join('benchmark', 'golden'), help='the '
+            'directory in which the golden copies of the output are kept (default: benchmark/golden)')
+    parser.add_argument('--update-golden', action='store_true', help='replace the golden copies with the '
+            'output of this run')
+    parser.add_argument('--history', type=str, default=os.path.join('benchmark', 'history.json'), help='the '
+            'JSON file the runs are recorded in (default: benchmark/history.json)')
+    parser.add_argument('--label', type=str, default=None, help='a label to record with this run, such as '
+            'the commit being benchmarked')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the fraction by which a metric may be '
+            'worse than its median over the previous runs before the run fails (default: 0.1)')
+    parser.add_argument('--baseline-runs', type=int, default=5, help='the number of previous runs the metrics '
+            'are compared with (default: 5)')
+    parser.add_argument('--repeat', type=int, default=3, help='export each log this many times and keep the '
+            'fastest wall time (default: 3)')
+    parser.add_argument('--modes', type=str, nargs='+', default=['kill', 'touch'], choices=['kill', 'touch'],
+            help='the exports to benchmark (default: kill touch)')
+    parser.add_argument('--script', type=str, default=None, help='the script that all trials were run from '
+            '(default: the script named in each log)')
+    parser.add_argument('--output-dir', type=str, default=os.path.join('benchmark', 'output'), help='the '
+            'directory the output of this run is written to (default: benchmark/output)')
+    arguments = parser.parse_args()
+
+    if arguments.logs is not None:
+        corpora = [(os.path.basename(os.path.normpath(arguments.logs)), arguments.logs)]
+    else:
+        corpora = [(corpus_name(duration), simulate_corpus(duration, arguments.corpus_dir))
+                   for duration in arguments.durations]
+
+    jobs = []
+    for corpus, directory in corpora:
+        for filename in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+            for mode in arguments.modes:
+                output = os.path.join(arguments.output_dir, corpus, output_name(filename, mode))
+                jobs.append((corpus, filename, mode, output, arguments.script, arguments.repeat))
+    results = [benchmark_export(job) for job in jobs]
+
+    history = read_history(arguments.history)
+    baselines = baseline_metrics(history[-arguments.baseline_runs:] if arguments.baseline_runs > 0 else [])
+    failed = False
+    writer = csv.writer(sys.stdout)
+    writer.writerow(result_row_keys)
+    for job, result in zip(jobs, results):
+        corpus, filename, mode, output = job[:4]
+        golden = os.path.join(arguments.golden_dir, corpus, output_name(filename, mode))
+        result['Golden'] = check_golden(output, golden, arguments.update_golden)
+        result['Regression'] = ' '.join(regressions(result, baselines.get(result_key(result), {}),
+                                                    arguments.threshold))
+        failed = failed or result['Golden'] not in ('match', 'updated') or bool(result['Regression'])
+        writer.writerow([result[key] for key in result_row_keys])
+
+    history.append({'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'label': arguments.label,
+                    'results': results})
+    write_history(arguments.history, history)
+    return 1 if failed else 0
+
+
+def corpus_name(duration):
+    return 'once' if not duration else '{:g}s'.format(duration)
+
+
+def output_name(filename, mode):
+    return os.path.splitext(os.path.basename(filename))[0] + '.' + mode + '.csv'
+
+
+def simulate_corpus(duration, corpus_dir):
+    '''
+    Return the directory of the simulated corpus of sessions lasting
+    `duration` seconds, simulating it first if it is not there yet.
+    '''
+    directory = os.path.join(corpus_dir, corpus_name(duration))
+    if glob.glob(os.path.join(directory, '*.csv')):
+        return directory
+    import simulate
+    settings = simulate.Settings()
+    settings.participants = simulate.default_participants
+    settings.frame_rate = 60.0
+    settings.duration = duration or None
+    settings.kill_time = 0.8
+    settings.block_break = 10.0
+    settings.screen = (7680, 2160)
+    settings.trial_scale = 1.0
+    settings.cooperative = False
+    settings.movable_workspaces = False
+    with open(corpus_script) as file:
+        script = [simulate.parse_script_line(line) for line in file if line.strip()]
+    os.makedirs(directory, exist_ok=True)
+    # The simulator seeds the random module, so it is run in a worker
+    # process of its own.
+    from multiprocessing import Pool
+    with Pool(1) as pool:
+        pool.map(simulate.simulate_log, [(script, settings, corpus_start, directory,
+                                          '{}:{}'.format(corpus_seed, corpus_name(duration)))])
+    return directory
+
+
+def benchmark_export(job):
+    '''
+    Export a single log with logfile_to_csv.py, and return the fastest wall
+    time of `repeat` runs, with the stages, counts and peak memory of a run
+    with --stats.
+    '''
+    corpus, filename, mode, output, script, repeat = job
+    command = [sys.executable, converter, filename, '--kill-data-csv' if mode == 'kill' else '--touch-data-csv']
+    if script is not None:
+        command += ['--script', script]
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    read_time = None
+    wall_time = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        with open(filename, 'rb') as file:
+            for line in file:
+                pass
+        elapsed = time.perf_counter() - started
+        read_time = elapsed if read_time is None else min(read_time, elapsed)
+
+        started = time.perf_counter()
+        with open(output, 'wb') as file:
+            subprocess.run(command, stdout=file, check=True)
+        elapsed = time.perf_counter() - started
+        wall_time = elapsed if wall_time is None else min(wall_time, elapsed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        stats_filename = os.path.join(directory, 'stats.csv')
+        subprocess.run(command + ['--stats', stats_filename], stdout=subprocess.DEVNULL, check=True)
+        with open(stats_filename, newline='') as file:
+            totals = [row for row in csv.DictReader(file) if row['EventType'] == 'All'][-1]
+
+    result = {key: None for key in result_row_keys}
+    result['Corpus'] = corpus
+    result['Log'] = os.path.basename(filename)
+    result['Mode'] = mode
+    result['Bytes'] = os.path.getsize(filename)
+    result['Events'] = int(totals['Count'])
+    result['Rows'] = int(totals['Rows'])
+    result['Read_s'] = read_time
+    result['Decode_s'] = float(totals['Decode_s'])
+    result['State_s'] = float(totals['Handler_s'])
+    result['Write_s'] = float(totals['Write_s'])
+    result['Wall_s'] = wall_time
+    result['EventsPerSecond'] = result['Events'] / wall_time if wall_time > 0 else None
+    result['RowsPerSecond'] = result['Rows'] / wall_time if wall_time > 0 else None
+    # Only reported where the resource module is available.
+    result['PeakRSS_MB'] = float(totals['PeakRSS_MB']) if totals['PeakRSS_MB'] else None
+    return result
+
+
+def check_golden(output, golden, update):
+    '''
+    Compare an output csv with its golden copy, returning 'match', 'missing'
+    or where it first differs; with `update`, the golden copy is replaced
+    instead and 'updated' is returned.
+    '''
+    if update:
+        os.makedirs(os.path.dirname(golden), exist_ok=True)
+        with open(output, 'rb') as source, open(golden + '.partial', 'wb') as destination:
+            for chunk in iter(lambda: source.read(1 << 20), b''):
+                destination.write(chunk)
+        os.replace(golden + '.partial', golden)
+        return 'updated'
+    if not os.path.exists(golden):
+        return 'missing'
+    with open(output, 'rb') as file, open(golden, 'rb') as golden_file:
+        line_number = 0
+        for line_number, (line, golden_line) in enumerate(zip(file, golden_file), 1):
+            if line != golden_line:
+                return 'differs at line {}'.format(line_number)
+        if file.readline() or golden_file.readline():
+            return 'differs in length after line {}'.format(line_number)
+    return 'match'
+
+
+def result_key(result):
+    return result['Corpus'], result['Log'], result['Mode']
+
+
+def read_history(filename):
+    try:
+        with open(filename) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return []
+
+
+def write_history(filename, history):
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename + '.partial', 'w') as file:
+        json.dump(history, file, indent=1)
+    os.replace(filename + '.partial', filename)
+
+
+def baseline_metrics(runs):
+    '''
+    Return the median and the median absolute deviation of each checked
+    metric over `runs`, by corpus, log and mode.
+    '''
+    values = {}
+    for run in runs:
+        for result in run['results']:
+            for metric in checked_metrics:
+                if result.get(metric) is not None:
+                    values.setdefault(result_key(result), {}).setdefault(metric, []).append(result[metric])
+    baselines = {}
+    for key, metrics in values.items():
+        for metric, metric_values in metrics.items():
+            median = statistics.median(metric_values)
+            deviation = statistics.median(abs(value - median) for value in metric_values)
+            baselines.setdefault(key, {})[metric] = (median, deviation)
+    return baselines
+
+
+def regressions(result, baseline, threshold):
+    '''
+    Return the metrics of a result that are worse than their baseline median
+    by more than `threshold`, plus `noise_deviations` times their deviation.
+    '''
+    worse = []
+    for metric, (median, deviation) in baseline.items():
+        if result.get(metric) is None:
+            continue
+        if metric.endswith('_s') and max(median, result[metric]) < minimum_checked_time:
+            continue
+        if result[metric] > median * (1 + threshold) + noise_deviations * deviation:
+            worse.append(metric)
+    return worse
+
+
+if __name__ == '__main__':
+    sys.exit(main())
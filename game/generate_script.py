@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import copy
 import math
 import json
 import random
 import itertools
+import contextlib
 
 original_screen_size = (500, 180) # centimetres
 original_screen_resolution = (4730, 1730)
@@ -53,9 +56,68 @@ def main():
     parser.add_argument('--flank-enemy-spawn-rate', help='number of enemy spawns per side per second',
             type=float, default=1.0)
     parser.add_argument('--randomness', help='random permutation amount', type=float, default=2.0)
+    parser.add_argument('--stress', help='generate the waves with NumPy, for stress scripts with thousands of '
+            'enemies per wave', action='store_true')
+    parser.add_argument('--seed', help='seed the random number generator, so the same script is generated again '
+            '(with --roster, the base seed of the roster)')
+    parser.add_argument('--roster', help='generate a script for each session listed in this file, one per line, '
+            'instead of printing a single script')
+    parser.add_argument('--output-dir', help='the directory in which <session>.csv is written for each session '
+            'of the roster', default='.')
+    parser.add_argument('--processes', help='the number of worker processes used for the roster '
+            '(default: one per CPU)', type=int, default=None)
     arguments = parser.parse_args()
+    # The batch options are not part of the script's arguments.
+    roster, output_dir, processes = (vars(arguments).pop(key) for key in ('roster', 'output_dir', 'processes'))
 
-    do_trial(arguments)
+    if roster is None:
+        if arguments.seed is not None:
+            random.seed(arguments.seed)
+        generate(arguments)
+        return
+    if arguments.seed is None:
+        arguments.seed = str(random.SystemRandom().randrange(2 ** 32))
+        print('Using seed', arguments.seed, file=sys.stderr)
+    with open(roster) as file:
+        sessions = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    do_batch(arguments, sessions, output_dir, processes)
+
+
+def do_batch(arguments, sessions, output_dir, processes=None):
+    '''
+    Generate a script for each session into `output_dir`. Each script is
+    generated in a worker process, from the module's random number generator
+    seeded with the base seed and the session's name, so the files do not
+    depend on the number of processes or the order of the roster.
+    '''
+    from multiprocessing import Pool
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for session in sessions:
+        session_arguments = copy.copy(arguments)
+        session_arguments.seed = '{}:{}'.format(arguments.seed, session)
+        jobs.append((session_arguments, os.path.join(output_dir, session + '.csv')))
+    if processes == 1 or len(jobs) <= 1:
+        list(map(generate_batch_script, jobs))
+    else:
+        with Pool(processes) as pool:
+            pool.map(generate_batch_script, jobs)
+
+
+def generate_batch_script(job):
+    arguments, filename = job
+    random.seed(arguments.seed)
+    with open(filename + '.partial', 'w') as file:
+        with contextlib.redirect_stdout(file):
+            generate(arguments)
+    os.replace(filename + '.partial', filename)
+
+
+def generate(arguments):
+    if arguments.stress:
+        do_stress_trial(arguments)
+    else:
+        do_trial(arguments)
 
 
 def do_trial(arguments):
@@ -152,6 +214,128 @@ def do_trial(arguments):
     print('Script.End,{}')
 
 
+def do_stress_trial(arguments, chunk_size=65536):
+    '''
+    Create a single trial like `do_trial`, with the waves built as NumPy
+    arrays in linear time and written in bulk, so that scripts with
+    thousands of enemies per wave can be generated quickly.
+
+    Each wave has the same mix of types as in `do_trial`: the main and
+    opposite types in two runs, in a random order, with the flank enemies
+    inserted at random positions, and the angles reversed at random. The
+    adjacent swaps of `shuffle` are replaced by moving each enemy and angle
+    by a normally distributed number of places with the same spread.
+    Generation is seeded from the module's random number generator.
+    '''
+    import numpy
+    rng = numpy.random.default_rng(random.getrandbits(128))
+    enemy_count = arguments.enemies + arguments.sub_enemies + arguments.flank_enemies
+    left_angles = (numpy.arange(enemy_count) - enemy_count * 0.5) / enemy_count * arguments.spawn_angle
+    angle_variance = arguments.spawn_angle / enemy_count
+    angles = {'Side.Left': left_angles, 'Side.Right': left_angles + 180.0}
+    enemy_type_list = list(zip(enemy_types, enemy_types[1:] + enemy_types[:1])) +\
+                      list(zip(enemy_types[1:] + enemy_types[:1], enemy_types))
+    total_waves = arguments.repetitions * len(enemy_types)
+    enemy_type_list_cursor = 0
+    # The enemies of a side are coded by role: 0 for the main type, 1 for the
+    # opposite type and 2 for the flank type.
+    role_speeds = [(arguments.enemy_speed, arguments.enemy_spawn_rate),
+                   (arguments.sub_enemy_speed, arguments.sub_enemy_spawn_rate),
+                   (arguments.flank_enemy_speed, arguments.flank_enemy_spawn_rate)]
+    print('Script.Start,' + json.dumps({
+        'enemy_types': enemy_types,
+        'arguments': vars(arguments),
+    }))
+    for block_index in range(arguments.blocks):
+        print('Script.BeginBlock,' + json.dumps({
+            'index': block_index,
+        }))
+        for wave_index in range(total_waves):
+            type_a, type_b = enemy_type_list[enemy_type_list_cursor]
+            type_c = enemy_type_list[enemy_type_list_cursor]
+            for i in range(1, len(enemy_type_list)):
+                type_c = enemy_type_list[(enemy_type_list_cursor + i) % len(enemy_type_list)][0]
+                if type_c not in {type_a, type_b}:
+                    break
+            print('Script.BeginWave,' + json.dumps({
+                'left_type': type_a,
+                'right_type': type_b,
+                'flank_type': type_c,
+            }))
+            enemy_type_list_cursor = (enemy_type_list_cursor + 1) % len(enemy_type_list);
+            sides = []
+            for side, main_type, sub_type in (('Side.Left', type_a, type_b), ('Side.Right', type_b, type_a)):
+                runs = [numpy.zeros(arguments.enemies, dtype=numpy.int8),
+                        numpy.ones(arguments.sub_enemies, dtype=numpy.int8)]
+                if rng.random() < 0.5:
+                    runs.reverse()
+                roles = local_shuffle(numpy.concatenate(runs), arguments.randomness, rng)
+                roles = interleave_array(roles, numpy.full(arguments.flank_enemies, 2, dtype=numpy.int8), rng)
+                if rng.random() < 0.5:
+                    angles[side] = angles[side][::-1]
+                angles[side] = local_shuffle(angles[side], arguments.randomness, rng)
+                spawn_angles = angles[side] + (rng.random(enemy_count) * 2.0 - 1.0) * angle_variance
+                # Everything but the angle is fixed by the role, so each line
+                # is a prefix and suffix around the angle.
+                prefixes = []
+                suffixes = []
+                for type, (speed, spawn_rate) in zip((main_type, sub_type, type_c), role_speeds):
+                    line = 'Script.SpawnEnemy,' + json.dumps({
+                        'side': side,
+                        'speed': speed,
+                        'angle': 0.0,
+                        'spawnTime': 1.0 / spawn_rate,
+                        'type': type,
+                    }) + '\n'
+                    prefix, _, suffix = line.partition('"angle": 0.0')
+                    prefixes.append(prefix + '"angle": ')
+                    suffixes.append(suffix)
+                sides.append((roles.tolist(), spawn_angles.tolist(), prefixes, suffixes))
+            (left_roles, left_spawn_angles, left_prefixes, left_suffixes), \
+                    (right_roles, right_spawn_angles, right_prefixes, right_suffixes) = sides
+            for start in range(0, enemy_count, chunk_size):
+                stop = min(start + chunk_size, enemy_count)
+                sys.stdout.write(''.join(
+                    left_prefixes[left_role] + repr(left_angle) + left_suffixes[left_role] +
+                    right_prefixes[right_role] + repr(right_angle) + right_suffixes[right_role]
+                    for left_role, left_angle, right_role, right_angle in zip(
+                        left_roles[start:stop], left_spawn_angles[start:stop],
+                        right_roles[start:stop], right_spawn_angles[start:stop])))
+            print('Script.EndWave,' + json.dumps({
+                'left_type': type_a,
+                'right_type': type_b,
+                'flank_type': type_c,
+            }))
+        print('Script.EndBlock,' + json.dumps({
+            'index': block_index,
+        }))
+    print('Script.End,{}')
+
+
+def local_shuffle(array, randomness, rng):
+    '''Return a copy of the array with each element moved by about as many places as `shuffle` moves it.'''
+    import numpy
+    # Each element takes part in about 2 * randomness of the adjacent swaps,
+    # a random walk of that many steps. The keys are nearly sorted already,
+    # so the stable sort takes about linear time.
+    keys = numpy.arange(len(array)) + rng.normal(0.0, math.sqrt(2.0 * randomness), len(array))
+    return array[numpy.argsort(keys, kind='stable')]
+
+
+def interleave_array(array, insert, rng):
+    '''
+    Return the array with the values of `insert` at random positions, as
+    `interleave` places them, in linear time.
+    '''
+    import numpy
+    result = numpy.empty(len(array) + len(insert), dtype=array.dtype)
+    inserted = numpy.zeros(len(result), dtype=bool)
+    inserted[rng.choice(len(result), len(insert), replace=False)] = True
+    result[inserted] = rng.permutation(insert)
+    result[~inserted] = array
+    return result
+
+
 def shuffle(list, randomness):
     '''Shuffle the given list by an amount proportional to the given randomness value.
     A value of 1.0 means that there will be one swapping of adjacent elements per number
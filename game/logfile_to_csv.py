@@ -15,6 +15,7 @@ import sys
 import glob
 import json
 import math
+import time
 import datetime
 import itertools
 import collections
@@ -34,9 +35,9 @@ datetime_re = re.compile(r'(?P<year>\d+)-(?P<month>\d+)-(?P<day>\d+) (?P<hour>\d
 
 # These events are not yielded or stored. For performance reasons -- these
 # aren't that helpful to analysis and they take up the majority of the log
-# file.
-ignore_events = {'Hybrid.DeadZoneChanged',
-                 'Input.RawTouchDown',
+# file. Dead zone events are never yielded either; they are summarized by
+# the trial's DeadZoneTrack as the file is read.
+ignore_events = {'Input.RawTouchDown',
                  'Input.RawTouchUp',
                  'Input.RawTouchMove',
                  'Input.TouchDown',
@@ -51,6 +52,249 @@ class Cursor(object):
     __slots__ = 'participant x y spawn_x spawn_y spawn_time distance_travelled'.split()
 class Workspace(object):
     __slots__ = 'participant x y'.split()
+class WeaponUse(object):
+    __slots__ = '''
+        weapon
+        participant
+        block_index
+        wave_index
+        start_time
+        end_time
+        end_reason
+        previous_weapon
+        previous_end_time
+        enemy_appearance_time
+        kill_count
+        path
+        last_point
+    '''.split()
+class DeadZone(object):
+    __slots__ = '''
+        id
+        block_index
+        wave_index
+        spawn_time
+        kill_time
+        end_time
+        end_reason
+        spawn_x
+        spawn_y
+        last_change
+        kill_x
+        kill_y
+        spawn_radius
+        radius
+        min_radius
+        max_radius
+        radius_sum
+        change_count
+    '''.split()
+
+
+class KillState(object):
+    '''The position of `kill_rows` in a trial, so that it can be continued later.'''
+    __slots__ = '''
+        within_wave_index
+        cannon_blast_id
+        last_cannon_blast_timestamp
+        black_hole_encircle_id
+        last_black_hole_encircle_timestamp
+        wave_number
+        resumed
+        reported_waves
+        left_type
+        right_type
+        flank_type
+    '''.split()
+    def __init__(self):
+        self.within_wave_index = -1
+        self.cannon_blast_id = -1
+        self.last_cannon_blast_timestamp = None
+        self.black_hole_encircle_id = -1
+        self.last_black_hole_encircle_timestamp = None
+        self.wave_number = 0
+        self.resumed = False
+        self.reported_waves = set()
+        self.left_type = self.right_type = self.flank_type = None
+class KillGrouping(object):
+    '''
+    How `group_kills` clusters co-temporal kills: within `window` ms of each
+    other, within `radius` cm of each other if it is not None, and by the
+    same participant if `per_participant`.
+    '''
+    __slots__ = '''
+        window
+        radius
+        per_participant
+    '''.split()
+    def __init__(self, window=1, radius=None, per_participant=False):
+        self.window = window
+        self.radius = radius
+        self.per_participant = per_participant
+    def label(self):
+        '''Return a label telling this grouping apart from others, which is empty for the default.'''
+        label = '' if self.window == 1 else '-w{}'.format(self.window)
+        if self.radius is not None:
+            label += '-r{}'.format(self.radius)
+        if self.per_participant:
+            label += '-p'
+        return label
+class TrialCheckpoint(object):
+    '''
+    Everything needed to continue converting a trial from where an earlier run
+    stopped. The file is read again from `offset`, the start of line
+    `line_number + 1`.
+    '''
+    __slots__ = '''
+        trial_index
+        offset
+        line_number
+        timestamp
+        state
+        dead_zones
+        kills
+    '''.split()
+
+
+kill_row_keys = ['RowIndex',
+                 'TrialIndex',
+                 'EnemyId',
+                 'EnemyType',
+                 'EnemyScriptType',
+                 'EnemyX_cm',
+                 'EnemyY_cm',
+                 'EnemyLiveTime_ms',
+                 'EnemyDistanceTravelled_cm',
+                 'BlockIndex',
+                 'WaveIndex',
+                 'WithinWaveIndex',
+                 'ParticipantIdKilled',
+                 'RealParticipantIdKilled',
+                 'ParticipantOnSameSideIndicator',
+                 'UsedCursorIndicator',
+                 'CursorMoveDistanceTravelled_cm',
+                 'CursorMoveDisplacement_cm',
+                 'EnemyDistanceFromWorkspaceCentre_cm',
+                 'EnemyDistanceFromCursorSpawn_cm',
+                 'CannonBlastId',
+                 'BlackHoleEncircleId',
+                 'CooperativeIndicator']
+
+# Appended to the kill data by --touch-attribution.
+touch_attribution_row_keys = ['StrokeId',
+                              'StrokeLeadTime_ms',
+                              'TouchToEnemyDistance_cm']
+
+# The touch events that --touch-attribution decodes for the kill data.
+raw_touch_events = {'Input.RawTouchDown', 'Input.RawTouchMove', 'Input.RawTouchUp'}
+
+touch_row_keys = ['RowIndex', 'TrialIndex', 'ParticipantId', 'RealParticipantId', 'TouchX_cm', 'TouchY_cm', 'Heat_ms',
+                  'RelativeModeIndicator', 'CooperativeModeIndicator']
+
+touch_heatmap_row_keys = ['ParticipantId', 'RealParticipantId', 'RelativeModeIndicator', 'CooperativeModeIndicator',
+                          'BinX_cm', 'BinY_cm', 'TouchCount', 'Heat_ms']
+
+dead_zone_row_keys = ['RowIndex',
+                      'TrialIndex',
+                      'DeadZoneId',
+                      'BlockIndex',
+                      'WaveIndex',
+                      'SpawnTime_ms',
+                      'ActiveTime_ms',
+                      'Lifetime_ms',
+                      'EndReason',
+                      'SpawnX_cm',
+                      'SpawnY_cm',
+                      'KillX_cm',
+                      'KillY_cm',
+                      'SpawnRadius_cm',
+                      'MinRadius_cm',
+                      'MeanRadius_cm',
+                      'MaxRadius_cm',
+                      'FinalRadius_cm',
+                      'ChangeCount']
+
+weapon_timeline_row_keys = ['RowIndex',
+                            'TrialIndex',
+                            'ParticipantId',
+                            'RealParticipantId',
+                            'Weapon',
+                            'BlockIndex',
+                            'WaveIndex',
+                            'StartTime_ms',
+                            'Duration_ms',
+                            'EndReason',
+                            'PreviousWeapon',
+                            'SwitchGap_ms',
+                            'EnemyAppearanceToSwitch_ms',
+                            'KillCount',
+                            'PathPointCount',
+                            'WeaponPath']
+
+kill_group_row_keys = ['RowIndex',
+                       'TrialIndex',
+                       'GroupType',
+                       'GroupId',
+                       'RealParticipantId',
+                       'KillCount',
+                       'StartTime_ms',
+                       'Duration_ms',
+                       'CentreX_cm',
+                       'CentreY_cm',
+                       'Spread_cm']
+
+trajectory_row_keys = ['RowIndex',
+                       'TrialIndex',
+                       'ObjectType',
+                       'ObjectId',
+                       'EnemyType',
+                       'ParticipantId',
+                       'RealParticipantId',
+                       'StartTime_ms',
+                       'EndTime_ms',
+                       'EndReason',
+                       'StartX_cm',
+                       'StartY_cm',
+                       'EndX_cm',
+                       'EndY_cm',
+                       'RawPointCount',
+                       'PointCount',
+                       'Path']
+
+# Each trial has a row per event type, then an 'All' row with its totals.
+stats_row_keys = ['Log',
+                  'Exporter',
+                  'EventType',
+                  'Count',
+                  'Decode_s',
+                  'Handler_s',
+                  'Write_s',
+                  'BytesRead',
+                  'Rows',
+                  'PeakRSS_MB']
+
+# The kills of these enemy types are grouped, as a single cannon blast or black
+# hole encircle can kill several enemies at once: the enemy type, the group
+# type (and kill data column, with Id appended), and the `KillState` slots of
+# the last group id and the timestamp of its last kill.
+grouped_enemy_types = [('Enemy.Cannon', 'CannonBlast', 'cannon_blast_id', 'last_cannon_blast_timestamp'),
+                       ('Enemy.BlackHole', 'BlackHoleEncircle', 'black_hole_encircle_id',
+                        'last_black_hole_encircle_timestamp')]
+
+# Weapons are active for a participant in these states.
+active_weapon_states = {'WeaponState.ActiveHoldover', 'WeaponState.Active', 'WeaponState.ActiveInUse'}
+
+# The kill data columns that are summarized by --summary.
+summary_value_keys = ['EnemyLiveTime_ms',
+                      'EnemyDistanceTravelled_cm',
+                      'UsedCursorIndicator',
+                      'CursorMoveDistanceTravelled_cm',
+                      'CursorMoveDisplacement_cm',
+                      'EnemyDistanceFromWorkspaceCentre_cm',
+                      'EnemyDistanceFromCursorSpawn_cm']
+
+static_workspace_mid_gutter_px = 580
+movable_workspace_radius_px = 512
 
 
 def main():
@@ -60,316 +304,1532 @@ def main():
             '(or a single file)')
     parser.add_argument('--kill-data-csv', action='store_true', help='create a csv of enemy data for all trials')
     parser.add_argument('--touch-data-csv', action='store_true', help='create a csv of touch data for all trials')
+    parser.add_argument('--dead-zone-csv', action='store_true', help='create a csv of dead zone episodes for all '
+            'trials')
+    parser.add_argument('--touch-attribution', action='store_true', help='add the touch stroke each kill '
+            'followed, the time since that stroke started, and the distance from its last touch to the enemy, to '
+            'the kill data (this decodes raw touch events, and cannot be used with --checkpoint-dir)')
+    parser.add_argument('--attribution-window', type=int, default=1000, help='the most time in ms between a '
+            'kill and the last touch of the stroke it is attributed to (default: 1000)')
+    parser.add_argument('--kill-group-csv', action='store_true', help='create a csv of the cannon blasts and '
+            'black hole encircles of all trials, with their kill count, duration, centre and spread')
+    parser.add_argument('--kill-group-window', type=int, default=1, help='the most time in ms between kills of '
+            'the same cannon blast or black hole encircle (default: 1)')
+    parser.add_argument('--kill-group-radius', type=float, default=None, help='the most distance in cm between '
+            'kills of the same cannon blast or black hole encircle (default: no limit)')
+    parser.add_argument('--kill-group-per-participant', action='store_true', help='only group the kills of the '
+            'same participant into a cannon blast or black hole encircle')
+    parser.add_argument('--weapon-timeline-csv', action='store_true', help='create a csv of the intervals in which '
+            'each participant held each weapon, for all trials')
+    parser.add_argument('--weapon-path-interval', type=int, default=100, help='the minimum time in ms between '
+            'the points kept from a weapon path (default: 100)')
+    parser.add_argument('--trajectory-csv', action='store_true', help='create a csv of simplified enemy and '
+            'cursor paths for all trials')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='the maximum distance in cm between a '
+            'simplified trajectory and the recorded positions (default: 0.5)')
+    parser.add_argument('--touch-heatmap', action='store_true', help='create a csv of binned touch counts and heat '
+            'per participant, mode and cooperation condition, summed over all trials')
+    parser.add_argument('--bin-size', type=float, default=1.0, help='the width and height of a touch heatmap bin '
+            'in cm (default: 1.0)')
+    parser.add_argument('--summary', action='store_true', help='create a csv of the count, mean, standard '
+            'deviation, minimum and maximum of the kill data, per group')
+    parser.add_argument('--group-by', type=str, default='TrialIndex', help='comma-separated kill data columns to '
+            'group the summary by (default: TrialIndex)')
+    parser.add_argument('--checkpoint-dir', type=str, default=None, help='a directory in which to keep the kill '
+            'or touch data of each trial and the state at its end, so that a later run only converts new trials and '
+            'the new part of resumed logs')
+    parser.add_argument('--script', type=str, default=None, help='the script that all trials were run from '
+            '(default: the script named in each log, looked for in the data folder of the game)')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes used for '
+            'per-trial aggregation (default: one per CPU)')
+    parser.add_argument('--stats', type=str, default=None, metavar='FILENAME', help='write the count, decoding '
+            'time and handling time of each event type, and the time spent writing rows, bytes read, rows written '
+            'and peak memory, of each trial to a csv (only for the exports written a trial at a time)')
+    parser.add_argument('--progress', action='store_true', help='show the progress of the conversion on stderr '
+            '(only for the exports written a trial at a time)')
+    parser.add_argument('--profile-dir', type=str, default=None, help='a directory in which to write a '
+            'cProfile stats file for each trial (only for the exports written a trial at a time)')
+    parser.add_argument('--bad-trials', type=str, default='abort', choices=['abort', 'skip', 'quarantine'],
+            help='what to do with a trial that scan_logs.py finds problems in, or whose conversion fails: abort '
+            'the conversion, skip the trial, or skip it and move it to the quarantine directory together with a '
+            'csv of its problems (default: abort). Unless aborting, logs are scanned before they are converted, '
+            'and the rows of each trial are only written once it has been converted. The TrialIndex of the '
+            'other trials is unchanged, leaving a gap where a bad trial was')
+    parser.add_argument('--quarantine-dir', type=str, default=None, help='the directory bad trials are moved '
+            'to (default: a directory named quarantine next to the logs)')
     arguments = parser.parse_args()
 
+    if os.path.isdir(arguments.directory[0]):
+        filenames = sorted(glob.glob(os.path.join(arguments.directory[0], '*.csv')))
+        quarantine_dir = os.path.join(arguments.directory[0], 'quarantine')
+    else:
+        filenames = [arguments.directory[0]]
+        quarantine_dir = os.path.join(os.path.dirname(arguments.directory[0]), 'quarantine')
+    if arguments.touch_attribution and (not arguments.kill_data_csv or arguments.touch_data_csv or
+                                        arguments.checkpoint_dir is not None):
+        parser.error('--touch-attribution needs --kill-data-csv, without --touch-data-csv or --checkpoint-dir')
+    # Each of these writes a csv of its own, so no other export can be written with it.
+    separate_exports = [option for option, given in [('--touch-heatmap', arguments.touch_heatmap),
+                                                     ('--summary', arguments.summary),
+                                                     ('--kill-group-csv', arguments.kill_group_csv),
+                                                     ('--weapon-timeline-csv', arguments.weapon_timeline_csv),
+                                                     ('--trajectory-csv', arguments.trajectory_csv),
+                                                     ('--dead-zone-csv', arguments.dead_zone_csv)] if given]
+    if separate_exports and (len(separate_exports) > 1 or arguments.kill_data_csv or arguments.touch_data_csv):
+        parser.error('{} cannot be used with any other export'.format(separate_exports[0]))
+    if arguments.quarantine_dir is not None:
+        quarantine_dir = arguments.quarantine_dir
+    bad_trials = BadTrials(arguments.bad_trials, quarantine_dir)
+    # Trials keep their index among all of the logs, so that a bad trial
+    # being set aside leaves a gap rather than renumbering those after it.
+    trial_indices = {filename: trial_index for trial_index, filename in enumerate(filenames)}
+    if arguments.bad_trials != 'abort':
+        # The touch exports decode every event, the weapon timeline decodes
+        # WeaponMoved, and touch attribution decodes raw touch events.
+        touch = (arguments.touch_data_csv or arguments.touch_heatmap or arguments.weapon_timeline_csv or
+                 arguments.touch_attribution)
+        filenames = bad_trials.scan(filenames, touch, arguments.processes)
+    indexed_filenames = [(trial_indices[filename], filename) for filename in filenames]
+
     writer = csv.writer(sys.stdout)
+    scripts = ScriptRegistry(arguments.script)
+    grouping = KillGrouping(arguments.kill_group_window, arguments.kill_group_radius,
+                            arguments.kill_group_per_participant)
+    if arguments.touch_heatmap:
+        writer.writerow(touch_heatmap_row_keys)
+        jobs = [(filename, arguments.bin_size) for filename in filenames]
+        heatmaps = {}
+        for trial_heatmaps in bad_trials.map_trials(trial_touch_heatmap, jobs, filenames, arguments.processes):
+            merge_touch_heatmaps(heatmaps, trial_heatmaps)
+        for row in touch_heatmap_rows(heatmaps, arguments.bin_size):
+            writer.writerow(row)
+        return
+    if arguments.summary:
+        group_keys = [key.strip() for key in arguments.group_by.split(',') if key.strip()]
+        for key in group_keys:
+            if key not in kill_row_keys or key == 'RowIndex':
+                parser.error('cannot group by {}'.format(key))
+        writer.writerow(summary_row_keys(group_keys))
+        jobs = [(trial_index, filename, group_keys, scripts, grouping) for trial_index, filename in indexed_filenames]
+        summaries = {}
+        for trial_summaries in bad_trials.map_trials(trial_kill_summary, jobs, filenames, arguments.processes):
+            merge_kill_summaries(summaries, trial_summaries)
+        for row in kill_summary_rows(summaries):
+            writer.writerow(row)
+        return
+
+    if arguments.kill_group_csv:
+        writer.writerow(kill_group_row_keys)
+        jobs = [(trial_index, filename, grouping) for trial_index, filename in indexed_filenames]
+        row_index = -1
+        for group_rows in bad_trials.map_trials(trial_kill_groups, jobs, filenames, arguments.processes):
+            for row_data in group_rows:
+                row_index += 1
+                row_data[0] = row_index
+                writer.writerow(row_data)
+        return
+
+    instrumentation = Instrumentation(filenames, arguments.stats, arguments.progress, arguments.profile_dir)
+    if arguments.weapon_timeline_csv:
+        writer.writerow(weapon_timeline_row_keys)
+        # WeaponMoved is only decoded for this export.
+        write_trial_rows(writer, indexed_filenames,
+                         lambda trial_index, trial: weapon_timeline_rows(trial_index, trial,
+                                                                         arguments.weapon_path_interval),
+                         'weapon_timeline', ignore_events - {'Trial.WeaponMoved'}, instrumentation, bad_trials)
+        return
+    if arguments.trajectory_csv:
+        writer.writerow(trajectory_row_keys)
+        write_trial_rows(writer, indexed_filenames,
+                         lambda trial_index, trial: trajectory_rows(trial_index, trial, arguments.tolerance),
+                         'trajectory', ignore_events, instrumentation, bad_trials)
+        return
+    if arguments.dead_zone_csv:
+        writer.writerow(dead_zone_row_keys)
+        write_trial_rows(writer, indexed_filenames, dead_zone_rows, 'dead_zone', ignore_events, instrumentation,
+                         bad_trials)
+        return
+
     row_keys = []
+    exporter = None
     if arguments.kill_data_csv:
-        row_keys = ['RowIndex',
-                    'TrialIndex',
-                    'EnemyId',
-                    'EnemyType',
-                    'EnemyScriptType',
-                    'EnemyX_cm',
-                    'EnemyY_cm',
-                    'EnemyLiveTime_ms',
-                    'EnemyDistanceTravelled_cm',
-                    'BlockIndex',
-                    'WaveIndex',
-                    'WithinWaveIndex',
-                    'ParticipantIdKilled',
-                    'RealParticipantIdKilled',
-                    'ParticipantOnSameSideIndicator',
-                    'UsedCursorIndicator',
-                    'CursorMoveDistanceTravelled_cm',
-                    'CursorMoveDisplacement_cm',
-                    'EnemyDistanceFromWorkspaceCentre_cm',
-                    'EnemyDistanceFromCursorSpawn_cm',
-                    'CannonBlastId',
-                    'BlackHoleEncircleId',
-                    'CooperativeIndicator']
-    global ignore_events
+        row_keys = kill_row_keys
+        exporter = 'kill'
+    if arguments.touch_attribution:
+        row_keys = kill_row_keys + touch_attribution_row_keys
     if arguments.touch_data_csv:
-        row_keys = ['RowIndex', 'TrialIndex', 'ParticipantId', 'RealParticipantId', 'TouchX_cm', 'TouchY_cm', 'Heat_ms',
-                'RelativeModeIndicator', 'CooperativeModeIndicator']
-        ignore_events = {}
+        row_keys = touch_row_keys
+        exporter = 'touch'
     writer.writerow(row_keys)
     row_index = -1
+
+    if arguments.checkpoint_dir is not None:
+        os.makedirs(arguments.checkpoint_dir, exist_ok=True)
+        for trial_index, filename in indexed_filenames:
+            stats = instrumentation.start(filename, exporter)
+            first_row_index = row_index
+            rows = checkpointed_rows(trial_index, filename, arguments.checkpoint_dir, scripts,
+                                     arguments.touch_data_csv, stats, grouping)
+            write_row = writer.writerow if stats is None else stats.timed_write(writer.writerow)
+            for row_data in bad_trials.rows(rows, filename):
+                row_index += 1
+                row_data[0] = row_index
+                write_row(row_data)
+            instrumentation.finish(stats, row_index - first_row_index)
+        instrumentation.close()
+        return
+
+    ignore = ignore_events
+    if arguments.touch_data_csv:
+        ignore = set()
+    elif arguments.touch_attribution:
+        ignore = ignore_events - raw_touch_events
     trials = list()
-    if os.path.isdir(arguments.directory[0]):
-        for filename in sorted(glob.glob(os.path.join(arguments.directory[0], '*.csv'))):
-            trials.append(Trial(filename))
+    for filename in filenames:
+        trials.append(Trial(filename, ignore=ignore, stats=instrumentation.trial_stats(filename, exporter)))
+    for (trial_index, _), trial in zip(indexed_filenames, trials):
+        instrumentation.start_trial(trial.stats)
+        first_row_index = row_index
+        rows = trial_rows(trial_index, trial, scripts, arguments.kill_data_csv, arguments.touch_data_csv, grouping,
+                          arguments.attribution_window if arguments.touch_attribution else None)
+        write_row = writer.writerow if trial.stats is None else trial.stats.timed_write(writer.writerow)
+        for row_data in bad_trials.rows(rows, trial.filename, trial):
+            row_index += 1
+            row_data[0] = row_index
+            write_row(row_data)
+        instrumentation.finish(trial.stats, row_index - first_row_index)
+    instrumentation.close()
+
+
+def write_trial_rows(writer, indexed_filenames, rows, exporter, ignore, instrumentation, bad_trials):
+    '''
+    Read each trial of `indexed_filenames`, a list of (TrialIndex, filename),
+    with the events of `ignore` left out, and write the rows of
+    `rows(trial_index, trial)` with their RowIndex filled in, timed as
+    `exporter` by `instrumentation`.
+    '''
+    row_index = -1
+    for trial_index, filename in indexed_filenames:
+        stats = instrumentation.start(filename, exporter)
+        first_row_index = row_index
+        trial = Trial(filename, ignore=ignore, stats=stats)
+        write_row = writer.writerow if stats is None else stats.timed_write(writer.writerow)
+        for row_data in bad_trials.rows(rows(trial_index, trial), filename, trial):
+            row_index += 1
+            row_data[0] = row_index
+            write_row(row_data)
+        instrumentation.finish(stats, row_index - first_row_index)
+    instrumentation.close()
+
+
+class TrialState(object):
+    '''
+    The workspaces, cursors, enemies and touch codings of a trial, as of the
+    last event passed to `update`.
+    '''
+    __slots__ = '''
+        participant_id_by_identifier
+        cursors
+        workspaces
+        enemies
+        hackish_participant_id_counter
+        true_participant_id_counter
+        block_index
+        wave_index
+        touch_coding
+        touch_id_next_unique_index
+        movable_workspaces
+    '''.split()
+    def __init__(self, trial):
+        self.participant_id_by_identifier = {}
+        self.cursors = {}
+        self.workspaces = {}
+        self.enemies = {}
+        self.hackish_participant_id_counter = -1
+        self.true_participant_id_counter = -1
+        self.block_index = -1
+        self.wave_index = -1
+        self.touch_coding = {}
+        self.touch_id_next_unique_index = {}
+        self.movable_workspaces = bool(trial.attributes.get('movableWorkspaces', False))
+    def in_workspace_px(self, workspace, x, y):
+        if self.movable_workspaces:
+            dx = workspace.x - x * pixel_to_real
+            dy = workspace.y - y * pixel_to_real
+            r = movable_workspace_radius_px * pixel_to_real
+            return dx * dx + dy * dy <= r * r
+        else:
+            if workspace.x < screen_size[0] / 2:
+                return x < screen_resolution[0] / 2 - static_workspace_mid_gutter_px / 2
+            else:
+                return x > screen_resolution[0] / 2 + static_workspace_mid_gutter_px / 2
+    def code_touch(self, touch_key, x, y):
+        for participant, workspace in self.workspaces.items():
+            if self.in_workspace_px(workspace, x, y):
+                self.touch_coding[touch_key] = participant
+                break
+    def update(self, event):
+        if event.identifier == 'Trial.DamageTakenChanged':
+            # We originally didn't record which participant corresponded to which workspace.
+            # But we can still recover this data using the DamageTakenChanged events, which
+            # iterated over the workspaces from left-to-right.
+            participant = event.data['participant']
+            if participant not in self.participant_id_by_identifier:
+                self.hackish_participant_id_counter += 1
+                self.participant_id_by_identifier[participant] = self.hackish_participant_id_counter
+                workspace = Workspace()
+                workspace.participant = participant
+                workspace.x = screen_size[0] * 0.25 * (1 + self.hackish_participant_id_counter * 2)
+                workspace.y = screen_size[1] * 0.5
+                self.workspaces[participant] = workspace
+        elif event.identifier == 'Trial.WorkspaceInitialized':
+            # This overrides the DamageTakenChanged workspace hack.
+            self.true_participant_id_counter += 1
+            self.participant_id_by_identifier[event.data['participant']] = self.true_participant_id_counter
+            workspace = Workspace()
+            workspace.participant = event.data['participant']
+            workspace.x = event.data['x'] * pixel_to_real
+            workspace.y = event.data['y'] * pixel_to_real
+            self.workspaces[event.data['participant']] = workspace
+        elif event.identifier == 'Trial.WorkspaceMoved':
+            workspace = self.workspaces[event.data['participant']]
+            workspace.x = event.data['x'] * pixel_to_real
+            workspace.y = event.data['y'] * pixel_to_real
+        elif event.identifier == 'Hybrid.CursorSpawned':
+            assert event.data['participant'] not in self.cursors
+            cursor = Cursor()
+            cursor.participant = event.data['participant']
+            cursor.x = event.data['x'] * pixel_to_real
+            cursor.y = event.data['y'] * pixel_to_real
+            cursor.spawn_time = event.timestamp
+            cursor.spawn_x = cursor.x
+            cursor.spawn_y = cursor.y
+            cursor.distance_travelled = 0
+            self.cursors[event.data['participant']] = cursor
+        elif event.identifier == 'Hybrid.CursorMoved':
+            cursor = self.cursors[event.data['participant']]
+            cursor.distance_travelled += distance(cursor.x - event.data['x'] * pixel_to_real,
+                                                  cursor.y - event.data['y'] * pixel_to_real)
+            cursor.x = event.data['x'] * pixel_to_real
+            cursor.y = event.data['y'] * pixel_to_real
+        elif event.identifier == 'Hybrid.CursorDespawned':
+            assert event.data['participant'] in self.cursors
+            del self.cursors[event.data['participant']]
+        elif event.identifier == 'Trial.BeginBlock':
+            self.block_index += 1
+        elif event.identifier == 'Trial.BeginWave':
+            self.wave_index = event.data['waveNumber']
+        elif event.identifier == 'Trial.EnemySpawned':
+            assert event.data['id'] not in self.enemies
+            enemy = Enemy()
+            enemy.id = event.data['id']
+            enemy.x = event.data['x'] * pixel_to_real
+            enemy.y = event.data['y'] * pixel_to_real
+            enemy.radius = event.data['r'] * pixel_to_real
+            enemy.type = event.data['type']
+            enemy.spawn_x = enemy.x
+            enemy.spawn_y = enemy.y
+            enemy.spawn_time = event.timestamp
+            enemy.distance_travelled = 0
+            self.enemies[enemy.id] = enemy
+        elif event.identifier == 'Trial.EnemyMoved':
+            # Enemy movement is still triggered after enemies are killed,
+            # because they are removed lazily at the end of the frame. So
+            # we will see one extra EnemyMoved event after an enemy has
+            # been hit.
+            if event.data['id'] not in self.enemies:
+                return
+            enemy = self.enemies[event.data['id']]
+            enemy.distance_travelled += distance(enemy.x - event.data['x'] * pixel_to_real,
+                                                 enemy.y - event.data['y'] * pixel_to_real)
+            enemy.x = event.data['x'] * pixel_to_real
+            enemy.y = event.data['y'] * pixel_to_real
+        elif event.identifier == 'Trial.EnemyHit':
+            assert event.data['id'] in self.enemies
+            del self.enemies[event.data['id']]
+        elif event.identifier == 'Trial.EnemyCollide':
+            assert event.data['id'] in self.enemies
+            del self.enemies[event.data['id']]
+        elif event.identifier == 'Trial.Resumed':
+            # Nothing on screen survives a crash, and the resumed program
+            # starts numbering enemies from zero again.
+            self.enemies.clear()
+            self.cursors.clear()
+        elif event.identifier == 'Input.RawTouchDown':
+            if event.data['id'] in self.touch_id_next_unique_index:
+                self.touch_id_next_unique_index[event.data['id']] += 1
+            else:
+                self.touch_id_next_unique_index[event.data['id']] = 0
+            uid = self.touch_id_next_unique_index[event.data['id']]
+            self.code_touch((event.data['id'], uid), event.data['x'], event.data['y'])
+        elif event.identifier == 'Input.RawTouchMove':
+            uid = self.touch_id_next_unique_index[event.data['id']]
+            if (event.data['id'], uid) not in self.touch_coding:
+                self.code_touch((event.data['id'], uid), event.data['x'], event.data['y'])
+
+
+def trial_rows(trial_index, trial, scripts, kill=True, touch=False, grouping=None, attribution_window=None):
+    '''
+    Yield the kill rows of a trial, if `kill`, with its kills grouped by
+    `grouping`, and then its touch rows, if `touch`. Unless
+    `attribution_window` is None, the kill rows are extended with the
+    `touch_attribution_row_keys` of `attribute_kills`, for which the trial
+    must have been read with its raw touch events.
+    '''
+    state = TrialState(trial)
+    if kill and attribution_window is not None:
+        rows = list(kill_rows(trial_index, trial, state, scripts.waves(trial), grouping=grouping))
+        for row_data, attribution in zip(rows, attribute_kills(trial, state, attribution_window)):
+            row_data.extend(attribution)
+        yield from rows
+    elif kill:
+        yield from kill_rows(trial_index, trial, state, scripts.waves(trial), grouping=grouping)
     else:
-        trials.append(Trial(arguments.directory[0]))
-
-    static_workspace_mid_gutter_px = 580
-    movable_workspace_radius_px = 512
-
-    for (trial_index, trial) in enumerate(trials):
-        cooperative = None
-        script_path = next(value for identifier, value in trial.iter_attributes() if identifier == 'script')
-        block_index = -1
-        wave_index = -1
-        within_wave_index = -1
-        participant_id_by_identifier = {}
-        cursors = {}
-        workspaces = {}
-        enemies = {}
-        hackish_participant_id_counter = -1
-        true_participant_id_counter = -1
-        cannon_blast_id = -1
-        last_cannon_blast_timestamp = None
-        black_hole_encircle_id = -1
-        last_black_hole_encircle_timestamp = None
-        touch_coding = {}
-        touch_id_next_unique_index = {}
-
-        if trial.attributes.get('movableWorkspaces', False):
-            def in_workspace_px(workspace, x, y):
-                dx = workspace.x - x * pixel_to_real
-                dy = workspace.y - y * pixel_to_real
-                r = movable_workspace_radius_px * pixel_to_real
-                return dx * dx + dy * dy <= r * r
+        replay(trial, state)
+    if touch:
+        # We make two passes over the data, so that we can code touches that
+        # are only coded after they've moved somewhat.
+        yield from touch_rows(trial_index, trial, state)
+
+
+def replay(trial, state):
+    '''Pass every event of a trial through `state`.'''
+    for event in trial.events:
+        try:
+            state.update(event)
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+
+
+def kill_rows(trial_index, trial, state, waves, kills=None, grouping=None):
+    '''
+    Replay the events of a trial through `state`, yielding a row of
+    `kill_row_keys` for each enemy that was hit. `waves` is the wave table of
+    the trial's script, from `ScriptRegistry.waves`. The RowIndex column is
+    left for the caller to fill in. `kills` is updated as the trial is read,
+    so that the rows can be continued from the same point by a later call.
+
+    Cannon blasts and black hole encircles are found by `group_kills`, with
+    `grouping` (by default, kills no more than a millisecond apart), once
+    all of the kills have been read, so the rows are only yielded then. A
+    group is continued from an earlier call by time alone.
+
+    Logged waves that cannot be matched to the script, and hits on enemies of
+    a type the script wave does not contain, are reported on stderr; the
+    EnemyScriptType of kills in a wave missing from the script is left empty.
+    '''
+    kills = KillState() if kills is None else kills
+    grouping = KillGrouping() if grouping is None else grouping
+    cooperative = bool(trial.attributes['cooperative'])
+    rows = []
+    grouped_kills = {enemy_type: [] for enemy_type, _, _, _ in grouped_enemy_types}
+    left_type, right_type, flank_type = kills.left_type, kills.right_type, kills.flank_type
+
+    def report(event, message):
+        print("In file", trial.filename, "line", event.line_number, end=': ', file=sys.stderr)
+        print(message, file=sys.stderr)
+
+    for event in trial.events:
+        try:
+            if event.identifier == 'Trial.BeginWave':
+                kills.within_wave_index = -1
+                # Wave numbers count from one and are not reset, and a
+                # resumed program counts the waves it skipped.
+                wave_number = event.data['waveNumber']
+                if wave_number != kills.wave_number + 1 and not kills.resumed:
+                    report(event, 'wave {} follows wave {}'.format(wave_number, kills.wave_number))
+                kills.wave_number = wave_number
+                kills.resumed = False
+                if 1 <= wave_number <= len(waves):
+                    left_type, right_type, flank_type = waves[wave_number - 1]
+                else:
+                    report(event, 'wave {} is not in the script, which has {} waves'.format(
+                        wave_number, len(waves)))
+                    left_type = right_type = flank_type = None
+                kills.left_type, kills.right_type, kills.flank_type = left_type, right_type, flank_type
+            elif event.identifier == 'Trial.Resumed':
+                kills.resumed = True
+            elif event.identifier == 'Trial.EnemyHit':
+                if left_type is not None and event.data['type'] not in (left_type, right_type, flank_type) and \
+                   kills.wave_number not in kills.reported_waves:
+                    kills.reported_waves.add(kills.wave_number)
+                    report(event, '{} is not one of the enemy types of script wave {}'.format(
+                        event.data['type'], kills.wave_number))
+                assert event.data['id'] in state.enemies
+                row_data = [None] * len(kill_row_keys)
+                kills.within_wave_index += 1
+                workspace = state.workspaces[event.data['participant']]
+                enemy = state.enemies[event.data['id']]
+                cursor = state.cursors.get(event.data['participant'], None)
+                row_data[kill_row_keys.index('TrialIndex')] = trial_index
+                row_data[kill_row_keys.index('EnemyId')] = enemy.id
+                row_data[kill_row_keys.index('EnemyType')] = enemy.type
+                row_data[kill_row_keys.index('EnemyScriptType')] = None if left_type is None else 'Main'\
+                        if (event.data['type'] == left_type and event.data['x'] < screen_resolution[0] * 0.5)\
+                        or (event.data['type'] == right_type and event.data['x'] >= screen_resolution[0] * 0.5)\
+                        else 'Sub'\
+                        if (event.data['type'] == right_type and event.data['x'] < screen_resolution[0] * 0.5)\
+                        or (event.data['type'] == left_type and event.data['x'] >= screen_resolution[0] * 0.5)\
+                        else 'Flank'
+                row_data[kill_row_keys.index('EnemyX_cm')] = event.data['x'] * pixel_to_real
+                row_data[kill_row_keys.index('EnemyY_cm')] = event.data['y'] * pixel_to_real
+                row_data[kill_row_keys.index('EnemyLiveTime_ms')] = event.timestamp - enemy.spawn_time
+                row_data[kill_row_keys.index('EnemyDistanceTravelled_cm')] = enemy.distance_travelled
+                row_data[kill_row_keys.index('BlockIndex')] = state.block_index
+                row_data[kill_row_keys.index('WaveIndex')] = state.wave_index
+                row_data[kill_row_keys.index('WithinWaveIndex')] = kills.within_wave_index
+                row_data[kill_row_keys.index('ParticipantIdKilled')] = \
+                    state.participant_id_by_identifier[event.data['participant']]
+                row_data[kill_row_keys.index('RealParticipantIdKilled')] = event.data['participant']
+                row_data[kill_row_keys.index('ParticipantOnSameSideIndicator')] = int(not (
+                    (workspace.x                     < (screen_size[0] * 0.5)) ^ # XOR
+                    (event.data['x'] * pixel_to_real < (screen_size[0] * 0.5))))
+                row_data[kill_row_keys.index('UsedCursorIndicator')] = int(cursor is not None)
+                row_data[kill_row_keys.index('CursorMoveDistanceTravelled_cm')] = (cursor.distance_travelled
+                        if cursor is not None else 0)
+                row_data[kill_row_keys.index('CursorMoveDisplacement_cm')] = (
+                        distance(cursor.x - cursor.spawn_x, cursor.y - cursor.spawn_y)
+                        if cursor is not None else 0)
+                row_data[kill_row_keys.index('EnemyDistanceFromWorkspaceCentre_cm')] = distance(
+                        enemy.x - workspace.x, enemy.y - workspace.y)
+                row_data[kill_row_keys.index('EnemyDistanceFromCursorSpawn_cm')] = (distance(
+                        enemy.x - cursor.x, enemy.y - cursor.y)
+                        if cursor is not None else 0)
+                # The group ids are filled in once all kills have been read.
+                row_data[kill_row_keys.index('CannonBlastId')] = 0
+                row_data[kill_row_keys.index('BlackHoleEncircleId')] = 0
+                row_data[kill_row_keys.index('CooperativeIndicator')] = int(cooperative)
+                if event.data['type'] in grouped_kills:
+                    grouped_kills[event.data['type']].append((row_data, event.timestamp, event.data['participant'],
+                            event.data['x'] * pixel_to_real, event.data['y'] * pixel_to_real))
+                rows.append(row_data)
+            state.update(event)
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+
+    for enemy_type, group_type, id_slot, timestamp_slot in grouped_enemy_types:
+        if not grouped_kills[enemy_type]:
+            continue
+        import numpy
+        type_rows, timestamps, participants, xs, ys = zip(*grouped_kills[enemy_type])
+        group_ids = group_kills(numpy.array(timestamps), numpy.array(participants), numpy.array(xs),
+                                numpy.array(ys), grouping)
+        # The first group continues the last one of an earlier call if it
+        # follows closely enough.
+        last_timestamp = getattr(kills, timestamp_slot)
+        if last_timestamp is not None and timestamps[0] - last_timestamp <= grouping.window:
+            first_group_id = getattr(kills, id_slot)
+        else:
+            first_group_id = getattr(kills, id_slot) + 1
+        column = kill_row_keys.index(group_type + 'Id')
+        for row_data, group_id in zip(type_rows, group_ids.tolist()):
+            row_data[column] = first_group_id + group_id
+        setattr(kills, id_slot, first_group_id + int(group_ids.max()))
+        setattr(kills, timestamp_slot, timestamps[-1])
+    yield from rows
+
+
+def group_kills(timestamps, participants, xs, ys, grouping):
+    '''
+    Cluster co-temporal kills, given as NumPy arrays in the order they were
+    logged, and return a NumPy array of their group ids, numbered from zero
+    in the order of the first kill of each group. The kills are sorted by
+    time (by participant and then time, if `grouping.per_participant`), and
+    each joins the group of the kill before it if it is no more than
+    `grouping.window` ms later and, if `grouping.radius` is not None, no
+    further than that from it.
+    '''
+    import numpy
+    if len(timestamps) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    if grouping.per_participant:
+        participant_codes = numpy.unique(participants, return_inverse=True)[1].ravel()
+        order = numpy.lexsort((timestamps, participant_codes))
+    else:
+        order = numpy.argsort(timestamps, kind='stable')
+    linked = numpy.diff(timestamps[order]) <= grouping.window
+    if grouping.per_participant:
+        linked &= numpy.diff(participant_codes[order]) == 0
+    if grouping.radius is not None:
+        dx = numpy.diff(xs[order])
+        dy = numpy.diff(ys[order])
+        linked &= dx * dx + dy * dy <= grouping.radius * grouping.radius
+    starts = numpy.concatenate(([True], ~linked))
+    sorted_group_ids = numpy.cumsum(starts) - 1
+    # Sorted by participant, groups are numbered again by their first kill.
+    first_kills = order[starts]
+    renumbered = numpy.empty(len(first_kills), dtype=numpy.int64)
+    renumbered[numpy.argsort(first_kills, kind='stable')] = numpy.arange(len(first_kills))
+    group_ids = numpy.empty(len(timestamps), dtype=numpy.int64)
+    group_ids[order] = renumbered[sorted_group_ids]
+    return group_ids
+
+
+def kill_group_summaries(group_ids, timestamps, participants, xs, ys):
+    '''
+    Summarize each group of kills from `group_kills` at once. Returns a list
+    with a tuple of (kill count, first timestamp, duration in ms, centre x,
+    centre y, spread, participant) for each group id in order. The spread is
+    the root mean square distance of the kills from their centre, and the
+    participant is None if more than one participant made the kills.
+    '''
+    import numpy
+    if len(group_ids) == 0:
+        return []
+    group_count = int(group_ids.max()) + 1
+    counts = numpy.bincount(group_ids, minlength=group_count)
+    starts = numpy.full(group_count, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+    numpy.minimum.at(starts, group_ids, timestamps)
+    ends = numpy.full(group_count, numpy.iinfo(numpy.int64).min, dtype=numpy.int64)
+    numpy.maximum.at(ends, group_ids, timestamps)
+    centre_xs = numpy.bincount(group_ids, weights=xs, minlength=group_count) / counts
+    centre_ys = numpy.bincount(group_ids, weights=ys, minlength=group_count) / counts
+    squared_distances = (xs - centre_xs[group_ids]) ** 2 + (ys - centre_ys[group_ids]) ** 2
+    spreads = numpy.sqrt(numpy.bincount(group_ids, weights=squared_distances, minlength=group_count) / counts)
+    names, codes = numpy.unique(participants, return_inverse=True)
+    codes = codes.ravel()
+    lowest = numpy.full(group_count, len(names), dtype=numpy.int64)
+    numpy.minimum.at(lowest, group_ids, codes)
+    highest = numpy.full(group_count, -1, dtype=numpy.int64)
+    numpy.maximum.at(highest, group_ids, codes)
+    group_participants = [str(names[low]) if low == high else None
+                          for low, high in zip(lowest.tolist(), highest.tolist())]
+    return list(zip(counts.tolist(), starts.tolist(), (ends - starts).tolist(), centre_xs.tolist(),
+                    centre_ys.tolist(), spreads.tolist(), group_participants))
+
+
+def checkpointed_rows(trial_index, filename, directory, scripts, touch=False, stats=None, grouping=None):
+    '''
+    Yield the kill rows of a trial, with its kills grouped by `grouping` (or
+    its touch rows, if `touch`), keeping
+    them in `directory` together with a completion marker holding the state
+    at the end of the trial. A log that is unchanged since its marker was
+    written is not read again. A kill data log that has grown since, because
+    the session was resumed, is read from where the marker left off. Touch
+    rows depend on the final state of the whole trial, so a grown log is
+    converted again from the start for touch data. `stats`, if any, are
+    those of the `Trial` read.
+    '''
+    import pickle
+    grouping = KillGrouping() if grouping is None else grouping
+    name = os.path.join(directory, os.path.basename(filename) + ('.touch' if touch else '.kill' + grouping.label()))
+    rows_filename = name + '.csv'
+    marker_filename = name + '.done'
+    checkpoint = None
+    if os.path.exists(marker_filename):
+        with open(marker_filename, 'rb') as file:
+            checkpoint = pickle.load(file)
+        if checkpoint.trial_index != trial_index:
+            checkpoint = None
+    size = os.path.getsize(filename)
+    if checkpoint is not None and checkpoint.offset == size:
+        with open(rows_filename, newline='') as file:
+            yield from csv.reader(file)
+        return
+    if os.path.exists(marker_filename):
+        os.remove(marker_filename)
+
+    trial = Trial(filename, ignore=set() if touch else ignore_events, stats=stats)
+    if checkpoint is not None and not touch and checkpoint.offset < size:
+        with open(rows_filename, newline='') as file:
+            yield from csv.reader(file)
+        trial.seek(checkpoint.offset, checkpoint.line_number, checkpoint.timestamp, checkpoint.dead_zones)
+        state = checkpoint.state
+        kills = checkpoint.kills
+        rows_mode = 'a'
+    else:
+        state = TrialState(trial)
+        kills = KillState()
+        rows_mode = 'w'
+    with open(rows_filename, rows_mode, newline='') as file:
+        rows_writer = csv.writer(file)
+        if touch:
+            replay(trial, state)
+            rows = touch_rows(trial_index, trial, state)
         else:
-            def in_workspace_px(workspace, x, y):
-                if workspace.x < screen_size[0] / 2:
-                    return x < screen_resolution[0] / 2 - static_workspace_mid_gutter_px / 2
+            rows = kill_rows(trial_index, trial, state, scripts.waves(trial), kills, grouping)
+        for row_data in rows:
+            rows_writer.writerow(row_data)
+            yield row_data
+    for event in trial:
+        pass
+
+    checkpoint = TrialCheckpoint()
+    checkpoint.trial_index = trial_index
+    checkpoint.offset = trial.offset
+    checkpoint.line_number = trial.line_number
+    checkpoint.timestamp = trial.last_timestamp
+    checkpoint.state = state
+    checkpoint.dead_zones = trial.dead_zones
+    checkpoint.kills = kills
+    with open(marker_filename + '.partial', 'wb') as file:
+        pickle.dump(checkpoint, file)
+    os.replace(marker_filename + '.partial', marker_filename)
+
+
+def touch_samples(trial, state):
+    '''
+    Yield a (participant, x, y, heat, relative) tuple for every raw touch move
+    in the trial, where x and y are in pixels. `state` must be the final state
+    of a pass over the trial, so that touches which are only coded after
+    they've moved somewhat are still attributed to their participant.
+    '''
+    touch_id_current_unique_index = {}
+    touch_time = {}
+    cursors = set()
+    for event in trial.events:
+        try:
+            if event.identifier == 'Input.RawTouchDown':
+                if event.data['id'] in touch_id_current_unique_index:
+                    touch_id_current_unique_index[event.data['id']] += 1
                 else:
-                    return x > screen_resolution[0] / 2 + static_workspace_mid_gutter_px / 2
-        cooperative = bool(trial.attributes['cooperative'])
-
-        waves_from_script = (json.loads(data) for (event, separator, data) in
-                (line.partition(',') for line in open('script/script.csv', 'r')) if event == 'Script.BeginWave')
-
-        for event_index, event in enumerate(trial.events):
-            try:
-                if event.identifier == 'Trial.DamageTakenChanged':
-                    # We originally didn't record which participant corresponded to which workspace.
-                    # But we can still recover this data using the DamageTakenChanged events, which
-                    # iterated over the workspaces from left-to-right.
-                    participant = event.data['participant']
-                    if participant not in participant_id_by_identifier:
-                        hackish_participant_id_counter += 1
-                        participant_id_by_identifier[participant] = hackish_participant_id_counter
-                        workspace = Workspace()
-                        workspace.participant = participant
-                        workspace.x = screen_size[0] * 0.25 * (1 + hackish_participant_id_counter * 2)
-                        workspace.y = screen_size[1] * 0.5
-                        workspaces[participant] = workspace
-                elif event.identifier == 'Trial.WorkspaceInitialized':
-                    # This overrides the DamageTakenChanged workspace hack.
-                    true_participant_id_counter += 1
-                    participant_id_by_identifier[event.data['participant']] = true_participant_id_counter
-                    workspace = Workspace()
-                    workspace.participant = event.data['participant']
-                    workspace.x = event.data['x'] * pixel_to_real
-                    workspace.y = event.data['y'] * pixel_to_real
-                    workspaces[event.data['participant']] = workspace
-                elif event.identifier == 'Trial.WorkspaceMoved':
-                    workspace = workspaces[event.data['participant']]
-                    workspace.x = event.data['x'] * pixel_to_real
-                    workspace.y = event.data['y'] * pixel_to_real
-                elif event.identifier == 'Hybrid.CursorSpawned':
-                    assert event.data['participant'] not in cursors
-                    cursor = Cursor()
-                    cursor.participant = event.data['participant']
-                    cursor.x = event.data['x'] * pixel_to_real
-                    cursor.y = event.data['y'] * pixel_to_real
-                    cursor.spawn_time = event.timestamp
-                    cursor.spawn_x = cursor.x
-                    cursor.spawn_y = cursor.y
-                    cursor.distance_travelled = 0
-                    cursors[event.data['participant']] = cursor
-                elif event.identifier == 'Hybrid.CursorMoved':
-                    cursor = cursors[event.data['participant']]
-                    cursor.distance_travelled += distance(cursor.x - event.data['x'] * pixel_to_real,
-                                                          cursor.y - event.data['y'] * pixel_to_real)
-                    cursor.x = event.data['x'] * pixel_to_real
-                    cursor.y = event.data['y'] * pixel_to_real
-                elif event.identifier == 'Hybrid.CursorDespawned':
-                    assert event.data['participant'] in cursors
-                    del cursors[event.data['participant']]
-                elif event.identifier == 'Trial.BeginBlock':
-                    block_index += 1
-                elif event.identifier == 'Trial.BeginWave':
-                    wave_index = event.data['waveNumber']
-                    within_wave_index = -1
-                    data = next(waves_from_script)
-                    left_type = data['left_type']
-                    right_type = data['right_type']
-                    flank_type = data['flank_type']
-                elif event.identifier == 'Trial.EnemySpawned':
-                    assert event.data['id'] not in enemies
-                    enemy = Enemy()
-                    enemy.id = event.data['id']
-                    enemy.x = event.data['x'] * pixel_to_real
-                    enemy.y = event.data['y'] * pixel_to_real
-                    enemy.radius = event.data['r'] * pixel_to_real
-                    enemy.type = event.data['type']
-                    enemy.spawn_x = enemy.x
-                    enemy.spawn_y = enemy.y
-                    enemy.spawn_time = event.timestamp
-                    enemy.distance_travelled = 0
-                    enemies[enemy.id] = enemy
-                elif event.identifier == 'Trial.EnemyMoved':
-                    # Enemy movement is still triggered after enemies are killed,
-                    # because they are removed lazily at the end of the frame. So
-                    # we will see one extra EnemyMoved event after an enemy has
-                    # been hit.
-                    if event.data['id'] not in enemies:
-                        continue
-                    enemy = enemies[event.data['id']]
-                    enemy.distance_travelled += distance(enemy.x - event.data['x'] * pixel_to_real,
-                                                         enemy.y - event.data['y'] * pixel_to_real)
-                    enemy.x = event.data['x'] * pixel_to_real
-                    enemy.y = event.data['y'] * pixel_to_real
-                elif event.identifier == 'Trial.EnemyHit':
-                    assert event.data['id'] in enemies
-                    if arguments.kill_data_csv:
-                        row_data = [None] * len(row_keys)
-                        row_index += 1
-                        within_wave_index += 1
-                        workspace = workspaces[event.data['participant']]
-                        enemy = enemies[event.data['id']]
-                        cursor = cursors.get(event.data['participant'], None)
-                        # We assume that there won't be more than a
-                        # single millisecond between concurrent enemy eliminations
-                        # in a single defeat event.
-                        if event.data['type'] == 'Enemy.Cannon':
-                            if event.timestamp != last_cannon_blast_timestamp and \
-                               event.timestamp - 1 != last_cannon_blast_timestamp:
-                                cannon_blast_id += 1
-                            last_cannon_blast_timestamp = event.timestamp
-                        if event.data['type'] == 'Enemy.BlackHole':
-                            if event.timestamp != last_black_hole_encircle_timestamp and \
-                               event.timestamp - 1 != last_black_hole_encircle_timestamp:
-                                black_hole_encircle_id += 1
-                            last_black_hole_encircle_timestamp = event.timestamp
-                        row_data[row_keys.index('RowIndex')] = row_index
-                        row_data[row_keys.index('TrialIndex')] = trial_index
-                        row_data[row_keys.index('EnemyId')] = enemy.id
-                        row_data[row_keys.index('EnemyType')] = enemy.type
-                        row_data[row_keys.index('EnemyScriptType')] = 'Main'\
-                                if (event.data['type'] == left_type and event.data['x'] < screen_resolution[0] * 0.5)\
-                                or (event.data['type'] == right_type and event.data['x'] >= screen_resolution[0] * 0.5)\
-                                else 'Sub'\
-                                if (event.data['type'] == right_type and event.data['x'] < screen_resolution[0] * 0.5)\
-                                or (event.data['type'] == left_type and event.data['x'] >= screen_resolution[0] * 0.5)\
-                                else 'Flank'
-                        row_data[row_keys.index('EnemyX_cm')] = event.data['x'] * pixel_to_real
-                        row_data[row_keys.index('EnemyY_cm')] = event.data['y'] * pixel_to_real
-                        row_data[row_keys.index('EnemyLiveTime_ms')] = event.timestamp - enemy.spawn_time
-                        row_data[row_keys.index('EnemyDistanceTravelled_cm')] = enemy.distance_travelled
-                        row_data[row_keys.index('BlockIndex')] = block_index
-                        row_data[row_keys.index('WaveIndex')] = wave_index
-                        row_data[row_keys.index('WithinWaveIndex')] = within_wave_index
-                        row_data[row_keys.index('ParticipantIdKilled')] = \
-                            participant_id_by_identifier[event.data['participant']]
-                        row_data[row_keys.index('RealParticipantIdKilled')] = event.data['participant']
-                        row_data[row_keys.index('ParticipantOnSameSideIndicator')] = int(not (
-                            (workspace.x                     < (screen_size[0] * 0.5)) ^ # XOR
-                            (event.data['x'] * pixel_to_real < (screen_size[0] * 0.5))))
-                        row_data[row_keys.index('UsedCursorIndicator')] = int(cursor is not None)
-                        row_data[row_keys.index('CursorMoveDistanceTravelled_cm')] = (cursor.distance_travelled
-                                if cursor is not None else 0)
-                        row_data[row_keys.index('CursorMoveDisplacement_cm')] = (
-                                distance(cursor.x - cursor.spawn_x, cursor.y - cursor.spawn_y)
-                                if cursor is not None else 0)
-                        row_data[row_keys.index('EnemyDistanceFromWorkspaceCentre_cm')] = distance(
-                                enemy.x - workspace.x, enemy.y - workspace.y)
-                        row_data[row_keys.index('EnemyDistanceFromCursorSpawn_cm')] = (distance(
-                                enemy.x - cursor.x, enemy.y - cursor.y)
-                                if cursor is not None else 0)
-                        row_data[row_keys.index('CannonBlastId')] = (cannon_blast_id
-                                if event.data['type'] == 'Enemy.Cannon' else 0)
-                        row_data[row_keys.index('BlackHoleEncircleId')] = (black_hole_encircle_id
-                                if event.data['type'] == 'Enemy.BlackHole' else 0)
-                        row_data[row_keys.index('CooperativeIndicator')] = int(cooperative)
-                        writer.writerow(row_data)
-                    del enemies[event.data['id']]
-                elif event.identifier == 'Trial.EnemyCollide':
-                    assert event.data['id'] in enemies
-                    del enemies[event.data['id']]
-                elif event.identifier == 'Input.RawTouchDown':
-                    if event.data['id'] in touch_id_next_unique_index:
-                        touch_id_next_unique_index[event.data['id']] += 1
+                    touch_id_current_unique_index[event.data['id']] = 0
+                uid = touch_id_current_unique_index[event.data['id']]
+                touch_time[event.data['id'], uid] = event.timestamp
+            elif event.identifier == 'Input.RawTouchMove':
+                uid = touch_id_current_unique_index[event.data['id']]
+                participant = state.touch_coding.get((event.data['id'], uid), None)
+                heat = event.timestamp - touch_time[event.data['id'], uid]
+                touch_time[event.data['id'], uid] = event.timestamp
+                yield participant, event.data['x'], event.data['y'], heat, participant in cursors
+            elif event.identifier == 'Hybrid.CursorSpawned':
+                assert event.data['participant'] not in cursors
+                cursors.add(event.data['participant'])
+            elif event.identifier == 'Hybrid.CursorDespawned':
+                assert event.data['participant'] in cursors
+                cursors.remove(event.data['participant'])
+            elif event.identifier == 'Trial.Resumed':
+                # The cursors of the crashed session are never despawned.
+                cursors.clear()
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+
+
+def streamed_touch_samples(trial, state):
+    '''
+    Replay a trial through `state` once, yielding the samples of
+    `touch_samples` without keeping its events. A touch that is not yet
+    coded has its samples held back until it is, or until it is replaced
+    by a new touch with the same id or the trial ends, when they are
+    yielded uncoded; so samples are not yielded in order.
+    '''
+    touch_id_current_unique_index = {}
+    touch_time = {}
+    # Rebuilt when a cursor comes or goes, so that held samples can keep it.
+    cursors = frozenset()
+    uncoded = {}
+    for event in trial:
+        try:
+            state.update(event)
+            if event.identifier == 'Input.RawTouchDown':
+                if event.data['id'] in touch_id_current_unique_index:
+                    uid = touch_id_current_unique_index[event.data['id']]
+                    for x, y, heat, _ in uncoded.pop((event.data['id'], uid), ()):
+                        yield None, x, y, heat, False
+                    touch_id_current_unique_index[event.data['id']] += 1
+                else:
+                    touch_id_current_unique_index[event.data['id']] = 0
+                uid = touch_id_current_unique_index[event.data['id']]
+                touch_time[event.data['id'], uid] = event.timestamp
+            elif event.identifier == 'Input.RawTouchMove':
+                touch_key = (event.data['id'], touch_id_current_unique_index[event.data['id']])
+                participant = state.touch_coding.get(touch_key, None)
+                heat = event.timestamp - touch_time[touch_key]
+                touch_time[touch_key] = event.timestamp
+                if participant is None:
+                    uncoded.setdefault(touch_key, []).append((event.data['x'], event.data['y'], heat, cursors))
+                    continue
+                for x, y, held_heat, held_cursors in uncoded.pop(touch_key, ()):
+                    yield participant, x, y, held_heat, participant in held_cursors
+                yield participant, event.data['x'], event.data['y'], heat, participant in cursors
+            elif event.identifier == 'Hybrid.CursorSpawned':
+                assert event.data['participant'] not in cursors
+                cursors = cursors | {event.data['participant']}
+            elif event.identifier == 'Hybrid.CursorDespawned':
+                assert event.data['participant'] in cursors
+                cursors = cursors - {event.data['participant']}
+            elif event.identifier == 'Trial.Resumed':
+                cursors = frozenset()
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+    for samples in uncoded.values():
+        for x, y, heat, _ in samples:
+            yield None, x, y, heat, False
+
+
+def touch_rows(trial_index, trial, state):
+    '''
+    Yield a row of `touch_row_keys` for each raw touch move in a trial, given
+    its final state. The RowIndex column is left for the caller to fill in.
+    '''
+    cooperative = bool(trial.attributes['cooperative'])
+    for participant, x, y, heat, relative in touch_samples(trial, state):
+        row_data = [None] * len(touch_row_keys)
+        participant_id = state.participant_id_by_identifier.get(participant, -1)
+        row_data[touch_row_keys.index('TrialIndex')] = trial_index
+        row_data[touch_row_keys.index('ParticipantId')] = participant_id
+        row_data[touch_row_keys.index('RealParticipantId')] = participant
+        row_data[touch_row_keys.index('TouchX_cm')] = x * pixel_to_real
+        row_data[touch_row_keys.index('TouchY_cm')] = y * pixel_to_real
+        row_data[touch_row_keys.index('Heat_ms')] = heat
+        row_data[touch_row_keys.index('RelativeModeIndicator')] = int(relative)
+        row_data[touch_row_keys.index('CooperativeModeIndicator')] = int(cooperative)
+        yield row_data
+
+
+def attribute_kills(trial, state, window):
+    '''
+    Link each kill of a trial, in the order of its rows, to the touch stroke
+    of the participant who made it that was touching last before it, if it
+    was no more than `window` ms before. Returns a list with a tuple of
+    `touch_attribution_row_keys` values for each kill, or Nones if it is not
+    linked to a stroke. Strokes are numbered from zero by the raw touch down
+    that starts them, the lead time is from that touch down to the kill, and
+    the distance is from the last touch position of the stroke before the
+    kill to the enemy. `state` must be the final state of a pass over the
+    trial with its raw touch events, which attributes strokes to
+    participants.
+
+    The raw touch samples are gathered into arrays, and each participant's
+    kills are found among that participant's samples with a binary search,
+    so the time taken grows with the number of events rather than with
+    kills times touches.
+    '''
+    import numpy
+    touch_id_current_unique_index = {}
+    stroke_ids = {}
+    stroke_keys = []
+    stroke_starts = []
+    sample_times = []
+    sample_strokes = []
+    sample_xs = []
+    sample_ys = []
+    kill_times = []
+    kill_participants = []
+    kill_xs = []
+    kill_ys = []
+    for event in trial.events:
+        try:
+            if event.identifier in raw_touch_events:
+                if event.identifier == 'Input.RawTouchDown':
+                    if event.data['id'] in touch_id_current_unique_index:
+                        touch_id_current_unique_index[event.data['id']] += 1
                     else:
-                        touch_id_next_unique_index[event.data['id']] = 0
-                    uid = touch_id_next_unique_index[event.data['id']]
-                    for participant, workspace in workspaces.items():
-                        if in_workspace_px(workspace, event.data['x'], event.data['y']):
-                            touch_coding[event.data['id'], uid] = participant
-                            break
-                elif event.identifier == 'Input.RawTouchMove':
-                    uid = touch_id_next_unique_index[event.data['id']]
-                    if (event.data['id'], uid) not in touch_coding:
-                        for participant, workspace in workspaces.items():
-                            if in_workspace_px(workspace, event.data['x'], event.data['y']):
-                                touch_coding[event.data['id'], uid] = participant
-                                break
-
-            except:
-                print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
-                raise
-            sys.stdout.flush()
-
-        participant_from_id = {x: y for (y, x) in participant_id_by_identifier.items()}
-        if arguments.touch_data_csv:
-            # We make two passes over the data, so that we can code touches that
-            # are only coded after they've moved somewhat.
-            touch_id_current_unique_index = {}
-            touch_time = {}
-            cursors = {}
-            for event_index, event in enumerate(trial.events):
-                try:
-                    if event.identifier == 'Input.RawTouchDown':
-                        if event.data['id'] in touch_id_current_unique_index:
-                            touch_id_current_unique_index[event.data['id']] += 1
-                        else:
-                            touch_id_current_unique_index[event.data['id']] = 0
-                        uid = touch_id_current_unique_index[event.data['id']]
-                        touch_time[event.data['id'], uid] = event.timestamp
-                    elif event.identifier == 'Input.RawTouchMove':
-                        uid = touch_id_current_unique_index[event.data['id']]
-                        participant = touch_coding.get((event.data['id'], uid), None)
-                        heat = event.timestamp - touch_time[event.data['id'], uid]
-                        touch_time[event.data['id'], uid] = event.timestamp
-                        row_data = [None] * len(row_keys)
-                        row_index += 1
-                        participant_id = participant_id_by_identifier.get(participant, -1)
-                        row_data[row_keys.index('RowIndex')] = row_index
-                        row_data[row_keys.index('TrialIndex')] = trial_index
-                        row_data[row_keys.index('ParticipantId')] = participant_id
-                        row_data[row_keys.index('RealParticipantId')] = participant
-                        row_data[row_keys.index('TouchX_cm')] = event.data['x'] * pixel_to_real
-                        row_data[row_keys.index('TouchY_cm')] = event.data['y'] * pixel_to_real
-                        row_data[row_keys.index('Heat_ms')] = heat
-                        row_data[row_keys.index('RelativeModeIndicator')] = int(participant in cursors)
-                        row_data[row_keys.index('CooperativeModeIndicator')] = int(cooperative)
-                        writer.writerow(row_data)
-                    elif event.identifier == 'Hybrid.CursorSpawned':
-                        assert event.data['participant'] not in cursors
-                        cursor = Cursor()
-                        cursor.participant = event.data['participant']
-                        cursor.x = event.data['x'] * pixel_to_real
-                        cursor.y = event.data['y'] * pixel_to_real
-                        cursor.spawn_time = event.timestamp
-                        cursor.spawn_x = cursor.x
-                        cursor.spawn_y = cursor.y
-                        cursor.distance_travelled = 0
-                        cursors[event.data['participant']] = cursor
-                    elif event.identifier == 'Hybrid.CursorMoved':
-                        cursor = cursors[event.data['participant']]
-                        cursor.distance_travelled += distance(cursor.x - event.data['x'] * pixel_to_real,
-                                                              cursor.y - event.data['y'] * pixel_to_real)
-                        cursor.x = event.data['x'] * pixel_to_real
-                        cursor.y = event.data['y'] * pixel_to_real
-                    elif event.identifier == 'Hybrid.CursorDespawned':
-                        assert event.data['participant'] in cursors
-                        del cursors[event.data['participant']]
-                except:
-                    print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
-                    raise
+                        touch_id_current_unique_index[event.data['id']] = 0
+                    uid = touch_id_current_unique_index[event.data['id']]
+                    stroke_ids[event.data['id'], uid] = len(stroke_keys)
+                    stroke_keys.append((event.data['id'], uid))
+                    stroke_starts.append(event.timestamp)
+                uid = touch_id_current_unique_index[event.data['id']]
+                sample_times.append(event.timestamp)
+                sample_strokes.append(stroke_ids[event.data['id'], uid])
+                sample_xs.append(event.data['x'] * pixel_to_real)
+                sample_ys.append(event.data['y'] * pixel_to_real)
+            elif event.identifier == 'Trial.EnemyHit':
+                kill_times.append(event.timestamp)
+                kill_participants.append(event.data['participant'])
+                kill_xs.append(event.data['x'] * pixel_to_real)
+                kill_ys.append(event.data['y'] * pixel_to_real)
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+
+    attributions = [(None,) * len(touch_attribution_row_keys)] * len(kill_times)
+    if not kill_times or not sample_times:
+        return attributions
+    sample_times = numpy.array(sample_times, dtype=numpy.int64)
+    sample_strokes = numpy.array(sample_strokes, dtype=numpy.int64)
+    sample_xs = numpy.array(sample_xs)
+    sample_ys = numpy.array(sample_ys)
+    kill_times = numpy.array(kill_times, dtype=numpy.int64)
+    kill_participants = numpy.array(kill_participants, dtype=object)
+    kill_xs = numpy.array(kill_xs)
+    kill_ys = numpy.array(kill_ys)
+    stroke_starts = numpy.array(stroke_starts, dtype=numpy.int64)
+    stroke_participants = numpy.array([state.touch_coding.get(key) for key in stroke_keys], dtype=object)
+    sample_participants = stroke_participants[sample_strokes]
+    for participant in set(kill_participants.tolist()):
+        # The samples of a participant are in time order, as the log is.
+        samples = numpy.flatnonzero(sample_participants == participant)
+        kills = numpy.flatnonzero(kill_participants == participant)
+        if len(samples) == 0:
+            continue
+        last = numpy.searchsorted(sample_times[samples], kill_times[kills], side='right') - 1
+        linked = last >= 0
+        kills = kills[linked]
+        last = samples[last[linked]]
+        linked = kill_times[kills] - sample_times[last] <= window
+        kills = kills[linked]
+        last = last[linked]
+        strokes = sample_strokes[last]
+        lead_times = kill_times[kills] - stroke_starts[strokes]
+        distances = numpy.hypot(kill_xs[kills] - sample_xs[last], kill_ys[kills] - sample_ys[last])
+        for kill, stroke, lead_time, touch_distance in zip(kills.tolist(), strokes.tolist(), lead_times.tolist(),
+                                                           distances.tolist()):
+            attributions[kill] = (stroke, lead_time, touch_distance)
+    return attributions
+
+
+def weapon_timeline_rows(trial_index, trial, path_interval):
+    '''
+    Read a trial to the end, yielding a row of `weapon_timeline_row_keys` for
+    each interval in which a participant had a weapon active, ordered by the
+    start of the interval. Weapon paths are downsampled to at most one point
+    per `path_interval` ms, plus the last point of the interval. The RowIndex
+    column is left for the caller to fill in.
+    '''
+    state = TrialState(trial)
+    start_timestamp = trial.last_timestamp
+    uses = []
+    open_uses = {}
+    last_use_by_participant = {}
+    # The game logs EnemySpawned for a whole wave when the wave is read from
+    # the script, so an enemy appears on screen when it first moves.
+    appeared_enemies = set()
+    last_enemy_appearance = {}
+    def end_use(use, timestamp, reason):
+        use.end_time = timestamp
+        use.end_reason = reason
+        if use.last_point is not None and (not use.path or use.path[-1] is not use.last_point):
+            use.path.append(use.last_point)
+        del open_uses[use.weapon]
+        last_use_by_participant[use.participant] = use
+    for event in trial:
+        try:
+            if event.identifier == 'Trial.WeaponChanged':
+                weapon = event.data['weapon']
+                participant = event.data['participant']
+                use = open_uses.get(weapon)
+                active = event.data['state'] in active_weapon_states and participant != ''
+                if use is not None and (not active or use.participant != participant):
+                    end_use(use, event.timestamp, 'Taken' if active else 'Deactivated')
+                    use = None
+                if active and use is None:
+                    use = WeaponUse()
+                    use.weapon = weapon
+                    use.participant = participant
+                    use.block_index = state.block_index
+                    use.wave_index = state.wave_index
+                    use.start_time = event.timestamp
+                    previous = last_use_by_participant.get(participant)
+                    use.previous_weapon = previous.weapon if previous is not None else None
+                    use.previous_end_time = previous.end_time if previous is not None else None
+                    use.enemy_appearance_time = last_enemy_appearance.get('Enemy.' + weapon.partition('.')[2])
+                    use.kill_count = 0
+                    use.path = []
+                    use.last_point = None
+                    open_uses[weapon] = use
+                    uses.append(use)
+            elif event.identifier == 'Trial.WeaponMoved':
+                use = open_uses.get(event.data['weapon'])
+                if use is not None:
+                    use.last_point = (event.timestamp, event.data['x'], event.data['y'])
+                    if not use.path or event.timestamp - use.path[-1][0] >= path_interval:
+                        use.path.append(use.last_point)
+            elif event.identifier == 'Trial.EnemyMoved':
+                if event.data['id'] not in appeared_enemies and event.data['id'] in state.enemies:
+                    appeared_enemies.add(event.data['id'])
+                    last_enemy_appearance[state.enemies[event.data['id']].type] = event.timestamp
+            elif event.identifier == 'Trial.EnemyHit':
+                for use in open_uses.values():
+                    if use.participant == event.data['participant'] and \
+                       'Enemy.' + use.weapon.partition('.')[2] == event.data['type']:
+                        use.kill_count += 1
+            elif event.identifier == 'Trial.Resumed':
+                for use in list(open_uses.values()):
+                    end_use(use, event.timestamp, 'Resumed')
+            state.update(event)
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+    for use in list(open_uses.values()):
+        end_use(use, trial.last_timestamp, 'Unfinished')
+
+    for use in uses:
+        row_data = [None] * len(weapon_timeline_row_keys)
+        row_data[weapon_timeline_row_keys.index('TrialIndex')] = trial_index
+        row_data[weapon_timeline_row_keys.index('ParticipantId')] = \
+            state.participant_id_by_identifier.get(use.participant, -1)
+        row_data[weapon_timeline_row_keys.index('RealParticipantId')] = use.participant
+        row_data[weapon_timeline_row_keys.index('Weapon')] = use.weapon
+        row_data[weapon_timeline_row_keys.index('BlockIndex')] = use.block_index
+        row_data[weapon_timeline_row_keys.index('WaveIndex')] = use.wave_index
+        row_data[weapon_timeline_row_keys.index('StartTime_ms')] = use.start_time - start_timestamp
+        row_data[weapon_timeline_row_keys.index('Duration_ms')] = use.end_time - use.start_time
+        row_data[weapon_timeline_row_keys.index('EndReason')] = use.end_reason
+        row_data[weapon_timeline_row_keys.index('PreviousWeapon')] = use.previous_weapon
+        row_data[weapon_timeline_row_keys.index('SwitchGap_ms')] = (use.start_time - use.previous_end_time
+                if use.previous_end_time is not None else None)
+        row_data[weapon_timeline_row_keys.index('EnemyAppearanceToSwitch_ms')] = (
+                use.start_time - use.enemy_appearance_time
+                if use.enemy_appearance_time is not None else None)
+        row_data[weapon_timeline_row_keys.index('KillCount')] = use.kill_count
+        row_data[weapon_timeline_row_keys.index('PathPointCount')] = len(use.path)
+        row_data[weapon_timeline_row_keys.index('WeaponPath')] = format_path(
+                (timestamp - start_timestamp, x * pixel_to_real, y * pixel_to_real)
+                for timestamp, x, y in use.path)
+        yield row_data
+
+
+def trajectory_rows(trial_index, trial, tolerance):
+    '''
+    Read a trial to the end, yielding a row of `trajectory_row_keys` for the
+    path of each enemy from spawn to hit, collision or despawn, and for each
+    cursor from spawn to despawn. Paths are simplified with `simplify_path`
+    as soon as they end, so only the paths of live objects are kept in
+    memory. The RowIndex column is left for the caller to fill in.
+    '''
+    state = TrialState(trial)
+    start_timestamp = trial.last_timestamp
+    enemy_paths = {}
+    cursor_paths = {}
+    cursor_count = 0
+    def end_path(object_type, object_id, enemy_type, participant, path, reason):
+        times, xs, ys = zip(*path)
+        kept = simplify_path(xs, ys, tolerance)
+        row_data = [None] * len(trajectory_row_keys)
+        row_data[trajectory_row_keys.index('TrialIndex')] = trial_index
+        row_data[trajectory_row_keys.index('ObjectType')] = object_type
+        row_data[trajectory_row_keys.index('ObjectId')] = object_id
+        row_data[trajectory_row_keys.index('EnemyType')] = enemy_type
+        row_data[trajectory_row_keys.index('ParticipantId')] = (
+                state.participant_id_by_identifier.get(participant, -1) if participant is not None else None)
+        row_data[trajectory_row_keys.index('RealParticipantId')] = participant
+        row_data[trajectory_row_keys.index('StartTime_ms')] = times[0] - start_timestamp
+        row_data[trajectory_row_keys.index('EndTime_ms')] = times[-1] - start_timestamp
+        row_data[trajectory_row_keys.index('EndReason')] = reason
+        row_data[trajectory_row_keys.index('StartX_cm')] = xs[0]
+        row_data[trajectory_row_keys.index('StartY_cm')] = ys[0]
+        row_data[trajectory_row_keys.index('EndX_cm')] = xs[-1]
+        row_data[trajectory_row_keys.index('EndY_cm')] = ys[-1]
+        row_data[trajectory_row_keys.index('RawPointCount')] = len(path)
+        row_data[trajectory_row_keys.index('PointCount')] = len(kept)
+        row_data[trajectory_row_keys.index('Path')] = format_path(
+                (times[i] - start_timestamp, xs[i], ys[i]) for i in kept)
+        return row_data
+    for event in trial:
+        try:
+            if event.identifier == 'Trial.EnemySpawned':
+                enemy_paths[event.data['id']] = [(event.timestamp,
+                                                  event.data['x'] * pixel_to_real,
+                                                  event.data['y'] * pixel_to_real)]
+            elif event.identifier == 'Trial.EnemyMoved':
+                if event.data['id'] in state.enemies and event.data['id'] in enemy_paths:
+                    enemy_paths[event.data['id']].append((event.timestamp,
+                                                          event.data['x'] * pixel_to_real,
+                                                          event.data['y'] * pixel_to_real))
+            elif event.identifier in ('Trial.EnemyHit', 'Trial.EnemyCollide', 'Trial.EnemyDespawned'):
+                path = enemy_paths.pop(event.data['id'], None)
+                if path is not None:
+                    enemy = state.enemies.get(event.data['id'])
+                    if event.identifier == 'Trial.EnemyHit':
+                        path.append((event.timestamp, event.data['x'] * pixel_to_real,
+                                     event.data['y'] * pixel_to_real))
+                    yield end_path('Enemy', event.data['id'], enemy.type if enemy is not None else None,
+                                   event.data.get('participant'), path, event.identifier.partition('.')[2])
+            elif event.identifier == 'Hybrid.CursorSpawned':
+                cursor_count += 1
+                cursor_paths[event.data['participant']] = (cursor_count, [(event.timestamp,
+                                                                           event.data['x'] * pixel_to_real,
+                                                                           event.data['y'] * pixel_to_real)])
+            elif event.identifier == 'Hybrid.CursorMoved':
+                if event.data['participant'] in cursor_paths:
+                    cursor_paths[event.data['participant']][1].append((event.timestamp,
+                                                                       event.data['x'] * pixel_to_real,
+                                                                       event.data['y'] * pixel_to_real))
+            elif event.identifier == 'Hybrid.CursorDespawned':
+                if event.data['participant'] in cursor_paths:
+                    cursor_id, path = cursor_paths.pop(event.data['participant'])
+                    if path[-1][0] != event.timestamp:
+                        path.append((event.timestamp, path[-1][1], path[-1][2]))
+                    yield end_path('Cursor', cursor_id, None, event.data['participant'], path, 'CursorDespawned')
+            elif event.identifier == 'Trial.Resumed':
+                # Enemy ids start over after a crash, so the paths of the enemies
+                # from before it are ended rather than continued by new enemies.
+                for enemy_id, path in sorted(enemy_paths.items()):
+                    enemy = state.enemies.get(enemy_id)
+                    yield end_path('Enemy', enemy_id, enemy.type if enemy is not None else None, None, path,
+                                   'Resumed')
+                enemy_paths.clear()
+                for participant, (cursor_id, path) in sorted(cursor_paths.items()):
+                    yield end_path('Cursor', cursor_id, None, participant, path, 'Resumed')
+                cursor_paths.clear()
+            state.update(event)
+        except:
+            print("In file", trial.filename, "line", event.line_number, file=sys.stderr)
+            raise
+    for enemy_id, path in sorted(enemy_paths.items()):
+        enemy = state.enemies.get(enemy_id)
+        yield end_path('Enemy', enemy_id, enemy.type if enemy is not None else None, None, path, 'Unfinished')
+    for participant, (cursor_id, path) in sorted(cursor_paths.items()):
+        yield end_path('Cursor', cursor_id, None, participant, path, 'Unfinished')
+
+
+def simplify_path(xs, ys, tolerance):
+    '''
+    Simplify a polyline with the Ramer-Douglas-Peucker algorithm, returning
+    the indices of the points to keep. The first and last points are always
+    kept, and no dropped point is further than `tolerance` from the segment
+    of the simplified polyline that replaces it. The distances for each
+    segment are computed as arrays.
+    '''
+    import numpy
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    if len(xs) <= 2:
+        return numpy.arange(len(xs))
+    keep = numpy.zeros(len(xs), dtype=bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, len(xs) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        dx = xs[last] - xs[first]
+        dy = ys[last] - ys[first]
+        px = xs[first + 1:last] - xs[first]
+        py = ys[first + 1:last] - ys[first]
+        length_squared = dx * dx + dy * dy
+        if length_squared > 0.0:
+            # Distance to the segment rather than the line through it, so that
+            # points which double back past an endpoint are not lost.
+            along = numpy.clip((px * dx + py * dy) / length_squared, 0.0, 1.0)
+            px = px - along * dx
+            py = py - along * dy
+        distances = px * px + py * py
+        farthest = int(numpy.argmax(distances))
+        if distances[farthest] > tolerance * tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            segments.append((first, middle))
+            segments.append((middle, last))
+    return numpy.flatnonzero(keep)
+
+
+def format_path(points):
+    '''
+    Encode a sequence of (time, x, y) points as a single csv field, with
+    the points separated by spaces and their coordinates by colons.
+    '''
+    return ' '.join('{}:{:.2f}:{:.2f}'.format(t, x, y) for t, x, y in points)
+
+
+def dead_zone_rows(trial_index, trial):
+    '''
+    Read a trial to the end, and yield a row of `dead_zone_row_keys` for each
+    of its dead zone episodes. The RowIndex column is left for the caller to
+    fill in.
+    '''
+    for event in trial:
+        pass
+    for dead_zone in trial.dead_zones.finish(trial.last_timestamp):
+        row_data = [None] * len(dead_zone_row_keys)
+        row_data[dead_zone_row_keys.index('TrialIndex')] = trial_index
+        row_data[dead_zone_row_keys.index('DeadZoneId')] = dead_zone.id
+        row_data[dead_zone_row_keys.index('BlockIndex')] = dead_zone.block_index
+        row_data[dead_zone_row_keys.index('WaveIndex')] = dead_zone.wave_index
+        row_data[dead_zone_row_keys.index('SpawnTime_ms')] = dead_zone.spawn_time - trial.dead_zones.start_timestamp
+        row_data[dead_zone_row_keys.index('ActiveTime_ms')] = ((dead_zone.kill_time
+                if dead_zone.kill_time is not None else dead_zone.end_time) - dead_zone.spawn_time)
+        row_data[dead_zone_row_keys.index('Lifetime_ms')] = dead_zone.end_time - dead_zone.spawn_time
+        row_data[dead_zone_row_keys.index('EndReason')] = dead_zone.end_reason
+        row_data[dead_zone_row_keys.index('SpawnX_cm')] = dead_zone.spawn_x * pixel_to_real
+        row_data[dead_zone_row_keys.index('SpawnY_cm')] = dead_zone.spawn_y * pixel_to_real
+        row_data[dead_zone_row_keys.index('KillX_cm')] = (dead_zone.kill_x * pixel_to_real
+                if dead_zone.kill_x is not None else None)
+        row_data[dead_zone_row_keys.index('KillY_cm')] = (dead_zone.kill_y * pixel_to_real
+                if dead_zone.kill_y is not None else None)
+        row_data[dead_zone_row_keys.index('SpawnRadius_cm')] = dead_zone.spawn_radius * pixel_to_real
+        row_data[dead_zone_row_keys.index('MinRadius_cm')] = dead_zone.min_radius * pixel_to_real
+        row_data[dead_zone_row_keys.index('MeanRadius_cm')] = (dead_zone.radius_sum * pixel_to_real /
+                (dead_zone.change_count + 1))
+        row_data[dead_zone_row_keys.index('MaxRadius_cm')] = dead_zone.max_radius * pixel_to_real
+        row_data[dead_zone_row_keys.index('FinalRadius_cm')] = dead_zone.radius * pixel_to_real
+        row_data[dead_zone_row_keys.index('ChangeCount')] = dead_zone.change_count
+        yield row_data
+
+
+class TrialStats(object):
+    '''
+    The event counts and timings of a trial, for --stats, --progress and
+    --profile-dir. A `Trial` given stats times the production of each event,
+    which covers reading and decoding its line and skipping any ignored
+    lines before it, and the time until the next event is asked for, which
+    is spent handling it. Its `events` are timed the same way on every pass.
+    Rows written with `timed_write` while an event is being handled are
+    timed as writing instead. Trials without stats are not slowed down at
+    all.
+    '''
+    __slots__ = '''
+        filename
+        exporter
+        counts
+        decode_time
+        handler_time
+        write_time
+        bytes_read
+        rows
+        peak_rss
+        progress
+        profiler
+    '''.split()
+    def __init__(self, filename, exporter, progress=None):
+        self.filename = filename
+        self.exporter = exporter
+        self.counts = collections.Counter()
+        self.decode_time = collections.Counter()
+        self.handler_time = collections.Counter()
+        self.write_time = 0.0
+        self.bytes_read = 0
+        self.rows = 0
+        self.peak_rss = None
+        self.progress = progress
+        self.profiler = None
+    def timed_events(self, trial, producer):
+        clock = time.perf_counter
+        counts = self.counts
+        decode_time = self.decode_time
+        handler_time = self.handler_time
+        progress = self.progress
+        started = clock()
+        first = True
+        for event in producer:
+            produced = clock()
+            counts[event.identifier] += 1
+            decode_time[event.identifier] += produced - started
+            self.bytes_read = trial.offset
+            if progress is not None and produced >= progress.next_report:
+                progress.report(self.filename, trial.offset, sum(counts.values()), produced)
+            write_time = self.write_time
+            yield event
+            started = clock()
+            # The first event is read by the Trial itself, maybe long before
+            # the rest are asked for.
+            if not first:
+                handler_time[event.identifier] += started - produced - (self.write_time - write_time)
+            first = False
+    def timed_handling(self, events):
+        clock = time.perf_counter
+        handler_time = self.handler_time
+        for event in events:
+            write_time = self.write_time
+            started = clock()
+            yield event
+            handler_time[event.identifier] += clock() - started - (self.write_time - write_time)
+    def timed_write(self, write):
+        '''Return `write`, a function writing a row, timed as writing.'''
+        clock = time.perf_counter
+        def timed(row_data):
+            started = clock()
+            write(row_data)
+            self.write_time += clock() - started
+        return timed
+    def rows_data(self):
+        '''Return the rows of `stats_row_keys` of the trial.'''
+        rows = []
+        for identifier in sorted(self.counts):
+            row_data = [None] * len(stats_row_keys)
+            row_data[stats_row_keys.index('Log')] = os.path.basename(self.filename)
+            row_data[stats_row_keys.index('Exporter')] = self.exporter
+            row_data[stats_row_keys.index('EventType')] = identifier
+            row_data[stats_row_keys.index('Count')] = self.counts[identifier]
+            row_data[stats_row_keys.index('Decode_s')] = self.decode_time[identifier]
+            row_data[stats_row_keys.index('Handler_s')] = self.handler_time[identifier]
+            rows.append(row_data)
+        row_data = [None] * len(stats_row_keys)
+        row_data[stats_row_keys.index('Log')] = os.path.basename(self.filename)
+        row_data[stats_row_keys.index('Exporter')] = self.exporter
+        row_data[stats_row_keys.index('EventType')] = 'All'
+        row_data[stats_row_keys.index('Count')] = sum(self.counts.values())
+        row_data[stats_row_keys.index('Decode_s')] = sum(self.decode_time.values())
+        row_data[stats_row_keys.index('Handler_s')] = sum(self.handler_time.values())
+        row_data[stats_row_keys.index('Write_s')] = self.write_time
+        row_data[stats_row_keys.index('BytesRead')] = self.bytes_read
+        row_data[stats_row_keys.index('Rows')] = self.rows
+        row_data[stats_row_keys.index('PeakRSS_MB')] = self.peak_rss
+        rows.append(row_data)
+        return rows
+
+
+class Progress(object):
+    '''
+    A line on stderr showing the log being read, how much of all the logs
+    has been read by size, the rate of events and the time left, redrawn at
+    most a few times a second.
+    '''
+    __slots__ = '''
+        total_bytes
+        offsets
+        events
+        started
+        next_report
+    '''.split()
+    interval = 0.5 # seconds between redraws
+    def __init__(self, filenames):
+        self.total_bytes = sum(os.path.getsize(filename) for filename in filenames)
+        self.offsets = {}
+        self.events = {}
+        self.started = time.perf_counter()
+        self.next_report = self.started
+    def report(self, filename, offset, events, now):
+        self.offsets[filename] = offset
+        self.events[filename] = events
+        elapsed = now - self.started
+        fraction = sum(self.offsets.values()) / self.total_bytes if self.total_bytes else 1.0
+        rate = sum(self.events.values()) / elapsed if elapsed > 0 else 0.0
+        remaining = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        print('\r{}: {:5.1f}%, {:.0f} events/s, ETA {}'.format(
+                os.path.basename(filename), 100 * fraction, rate,
+                '?' if remaining is None else str(datetime.timedelta(seconds=round(remaining)))).ljust(79),
+              end='', file=sys.stderr, flush=True)
+        self.next_report = now + self.interval
+
+
+class Instrumentation(object):
+    '''
+    The --stats, --progress and --profile-dir reporting of a conversion that
+    reads a trial at a time. When none of them is asked for, `trial_stats`
+    and `start` return None, and the rest does nothing.
+    '''
+    __slots__ = '''
+        stats_filename
+        progress
+        profile_dir
+        trials
+    '''.split()
+    def __init__(self, filenames, stats_filename=None, progress=False, profile_dir=None):
+        self.stats_filename = stats_filename
+        self.progress = Progress(filenames) if progress else None
+        self.profile_dir = profile_dir
+        self.trials = []
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+    @property
+    def enabled(self):
+        return self.stats_filename is not None or self.progress is not None or self.profile_dir is not None
+    def trial_stats(self, filename, exporter):
+        if not self.enabled:
+            return None
+        stats = TrialStats(filename, exporter, self.progress)
+        self.trials.append(stats)
+        return stats
+    def start(self, filename, exporter):
+        '''Return the stats of a trial that is about to be read, and start profiling it.'''
+        stats = self.trial_stats(filename, exporter)
+        self.start_trial(stats)
+        return stats
+    def start_trial(self, stats):
+        if stats is None or self.profile_dir is None:
+            return
+        import cProfile
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+    def finish(self, stats, rows):
+        '''Record the rows written from a trial that has been read, and write its profile.'''
+        if stats is None:
+            return
+        if stats.profiler is not None:
+            stats.profiler.disable()
+            stats.profiler.dump_stats(os.path.join(self.profile_dir, '{}.{}.pstats'.format(
+                    os.path.basename(stats.filename), stats.exporter)))
+            stats.profiler = None
+        stats.rows = rows
+        try:
+            import resource
+            # The peak of the whole process so far, in kilobytes on Linux.
+            stats.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            pass
+        if self.progress is not None:
+            self.progress.report(stats.filename, stats.bytes_read, sum(stats.counts.values()),
+                                 time.perf_counter())
+    def close(self):
+        if self.progress is not None:
+            print(file=sys.stderr)
+        if self.stats_filename is not None:
+            with open(self.stats_filename, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(stats_row_keys)
+                for stats in self.trials:
+                    writer.writerows(stats.rows_data())
+
+
+class BadTrials(object):
+    '''
+    Sets aside the trials that cannot be converted. With the 'abort' action,
+    the first problem stops the conversion, as it always has. With 'skip',
+    bad trials are left out and reported on stderr, and with 'quarantine'
+    they are also moved to `quarantine_dir`, each with a csv of its problems.
+    '''
+    # The errors a malformed log makes a conversion fail with; any other
+    # error, such as a missing script, is not the fault of the trial.
+    conversion_errors = (AssertionError, KeyError, IndexError, TypeError, ValueError)
+    # The number of problems after which scanning a log stops.
+    max_problems = 100
+    def __init__(self, action, quarantine_dir):
+        self.action = action
+        self.quarantine_dir = quarantine_dir
+    def scan(self, filenames, touch, processes=None):
+        '''
+        Check the logs with scan_logs.py, in worker processes, and return
+        the filenames of those without problems, setting aside the others.
+        '''
+        from scan_logs import scan_log
+        jobs = [(filename, touch, self.max_problems) for filename in filenames]
+        good_filenames = []
+        for filename, problems in zip(filenames, map_trials(scan_log, jobs, processes)):
+            if problems:
+                self.set_aside(filename, problems)
+            else:
+                good_filenames.append(filename)
+        return good_filenames
+    def rows(self, rows, filename, trial=None):
+        '''
+        Return the rows of a trial as they are produced when aborting.
+        Otherwise, produce them all before returning them, so that none are
+        written if the conversion fails, in which case no rows are returned
+        and the trial is set aside. `trial`, if any, is closed first.
+        '''
+        if self.action == 'abort':
+            return rows
+        try:
+            return list(rows)
+        except self.conversion_errors as error:
+            # Events may have been read ahead of the one that failed, so
+            # its line is not known here.
+            problems = [(None, 'the conversion failed: {!r}'.format(error))]
+        if trial is not None:
+            trial.producer.close()
+        self.set_aside(filename, problems)
+        return []
+    def map_trials(self, function, jobs, filenames, processes=None):
+        '''
+        Yield the results of `map_trials`, leaving out those of the trials,
+        named by `filenames`, whose conversion fails, unless aborting.
+        '''
+        if self.action == 'abort':
+            yield from map_trials(function, jobs, processes)
+            return
+        guarded_jobs = [(function, job) for job in jobs]
+        for filename, (result, error) in zip(filenames, map_trials(guarded_call, guarded_jobs, processes)):
+            if error is not None:
+                self.set_aside(filename, [(None, 'the conversion failed: {}'.format(error))])
+                continue
+            yield result
+    def set_aside(self, filename, problems):
+        '''Report a bad trial and its (line number, problem) list, and quarantine it if asked to.'''
+        line_number, problem = problems[0]
+        message = '{} {}: {}'.format("Skipping" if self.action == 'skip' else "Quarantining", filename, problem)
+        if line_number is not None:
+            message += ' on line {}'.format(line_number)
+        if len(problems) > 1:
+            message += ', and {} more problems'.format(len(problems) - 1)
+        print(message, file=sys.stderr)
+        if self.action != 'quarantine':
+            return
+        import shutil
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        destination = os.path.join(self.quarantine_dir, os.path.basename(filename))
+        with open(destination + '.problems.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['LineNumber', 'Problem'])
+            writer.writerows(problems)
+        shutil.move(filename, destination)
+
+
+def map_trials(function, jobs, processes=None):
+    '''
+    Apply a picklable per-trial function to each job, in worker processes
+    unless only a single process is requested. Results are yielded in order.
+    '''
+    if processes == 1 or len(jobs) <= 1:
+        return map(function, jobs)
+    import multiprocessing
+    pool = multiprocessing.Pool(processes)
+    results = pool.imap(function, jobs)
+    pool.close()
+    return results
+
+
+def guarded_call(job):
+    '''
+    Apply a per-trial function to its job, returning its result and None,
+    or None and the conversion error it failed with.
+    '''
+    function, job = job
+    try:
+        return function(job), None
+    except BadTrials.conversion_errors as error:
+        return None, repr(error)
+
+
+def trial_touch_heatmap(job):
+    '''
+    Bin the touches of a single trial, in a single pass over its events.
+    Returns a dictionary from (ParticipantId, RealParticipantId,
+    RelativeModeIndicator, CooperativeModeIndicator) to a pair of (touch
+    count, heat) NumPy arrays with one cell per bin, row-major by y.
+    '''
+    import numpy
+    filename, bin_size = job
+    bins_x = int(math.ceil(screen_size[0] / bin_size))
+    bins_y = int(math.ceil(screen_size[1] / bin_size))
+    trial = Trial(filename, ignore=set())
+    state = TrialState(trial)
+    cooperative = int(bool(trial.attributes['cooperative']))
+    # Binned by (RealParticipantId, RelativeModeIndicator), as the
+    # ParticipantId of a participant is only known once the trial is read.
+    heatmaps = {}
+    # Samples are buffered per key and flushed into the fixed-size arrays in
+    # chunks, so that the buffers stay small however long the trial is.
+    pending = collections.defaultdict(lambda: ([], []))
+    def flush(key):
+        cells, heats = pending.pop(key)
+        if key not in heatmaps:
+            heatmaps[key] = (numpy.zeros(bins_x * bins_y, dtype=numpy.int64),
+                             numpy.zeros(bins_x * bins_y, dtype=numpy.float64))
+        counts, heat = heatmaps[key]
+        cells = numpy.array(cells, dtype=numpy.int64)
+        counts += numpy.bincount(cells, minlength=counts.size)
+        heat += numpy.bincount(cells, weights=heats, minlength=heat.size)
+    for participant, x, y, sample_heat, relative in streamed_touch_samples(trial, state):
+        key = (participant, int(relative))
+        bin_x = min(max(int(x * pixel_to_real / bin_size), 0), bins_x - 1)
+        bin_y = min(max(int(y * pixel_to_real / bin_size), 0), bins_y - 1)
+        cells, heats = pending[key]
+        cells.append(bin_y * bins_x + bin_x)
+        heats.append(sample_heat)
+        if len(cells) >= 65536:
+            flush(key)
+    for key in list(pending):
+        flush(key)
+    return {(state.participant_id_by_identifier.get(participant, -1), participant, relative, cooperative): bins
+            for (participant, relative), bins in heatmaps.items()}
+
+
+def merge_touch_heatmaps(heatmaps, other):
+    '''Add the bins of one dictionary of touch heatmaps into another.'''
+    for key, (counts, heat) in other.items():
+        if key in heatmaps:
+            heatmaps[key][0][:] += counts
+            heatmaps[key][1][:] += heat
+        else:
+            heatmaps[key] = (counts, heat)
+
+
+def touch_heatmap_rows(heatmaps, bin_size):
+    '''Yield a row of `touch_heatmap_row_keys` for each non-empty bin.'''
+    import numpy
+    bins_x = int(math.ceil(screen_size[0] / bin_size))
+    for key in sorted(heatmaps, key=lambda key: (key[0], str(key[1]), key[2], key[3])):
+        counts, heat = heatmaps[key]
+        for cell in numpy.flatnonzero(counts):
+            bin_y, bin_x = divmod(int(cell), bins_x)
+            yield list(key) + [bin_x * bin_size, bin_y * bin_size, int(counts[cell]), float(heat[cell])]
 
 
 def distance(x, y):
@@ -392,6 +1852,148 @@ def parse_datetime(string):
 Event = collections.namedtuple('Event', 'timestamp identifier data line_number')
 
 
+class DeadZoneTrack(object):
+    '''
+    Reconstructs dead zone episodes from the dead zone events of a trial as
+    the file is read. DeadZoneChanged makes up a large part of a log, so it is
+    handled from the raw line without building an Event or keeping it in
+    memory, and only its radius is decoded; the position of a dead zone is
+    decoded from its last change when it is needed.
+    '''
+    consumed_identifiers = {'Hybrid.DeadZoneSpawned',
+                            'Hybrid.DeadZoneChanged',
+                            'Hybrid.DeadZoneKilled',
+                            'Hybrid.DeadZoneDespawned'}
+    identifiers = consumed_identifiers | {'Trial.BeginBlock', 'Trial.BeginWave', 'Trial.Resumed'}
+    def __init__(self):
+        self.start_timestamp = None
+        self.block_index = -1
+        self.wave_index = -1
+        self.active = {}
+        self.episodes = []
+    def changed(self, data):
+        if not self.active:
+            return
+        try:
+            # The logger writes this event as {"id":%d,"x":%f,"y":%f,"radius":%f}.
+            dead_zone_id = int(data.partition(',')[0].rpartition(':')[2])
+            radius = float(data.rpartition(':')[2].rstrip().rstrip('}'))
+        except ValueError:
+            decoded = json.loads(data)
+            dead_zone_id = decoded['id']
+            radius = decoded['radius']
+        dead_zone = self.active.get(dead_zone_id)
+        if dead_zone is None:
+            return
+        if radius < dead_zone.min_radius:
+            dead_zone.min_radius = radius
+        if radius > dead_zone.max_radius:
+            dead_zone.max_radius = radius
+        dead_zone.radius = radius
+        dead_zone.radius_sum += radius
+        dead_zone.change_count += 1
+        dead_zone.last_change = data
+    def handle(self, timestamp, identifier, data):
+        if identifier == 'Hybrid.DeadZoneSpawned':
+            data = json.loads(data)
+            if data['id'] in self.active:
+                self.end(self.active[data['id']], timestamp, 'Respawned')
+            dead_zone = DeadZone()
+            dead_zone.id = data['id']
+            dead_zone.block_index = self.block_index
+            dead_zone.wave_index = self.wave_index
+            dead_zone.spawn_time = timestamp
+            dead_zone.kill_time = None
+            dead_zone.spawn_x = data['x']
+            dead_zone.spawn_y = data['y']
+            dead_zone.last_change = None
+            dead_zone.kill_x = dead_zone.kill_y = None
+            dead_zone.spawn_radius = dead_zone.radius = data['radius']
+            dead_zone.min_radius = dead_zone.max_radius = dead_zone.radius_sum = data['radius']
+            dead_zone.change_count = 0
+            self.active[dead_zone.id] = dead_zone
+        elif identifier == 'Hybrid.DeadZoneKilled':
+            dead_zone = self.active.get(json.loads(data)['id'])
+            if dead_zone is not None and dead_zone.kill_time is None:
+                dead_zone.kill_time = timestamp
+                dead_zone.kill_x, dead_zone.kill_y = self.position(dead_zone)
+        elif identifier == 'Hybrid.DeadZoneDespawned':
+            dead_zone = self.active.get(json.loads(data)['id'])
+            if dead_zone is not None:
+                self.end(dead_zone, timestamp, 'Despawned')
+        elif identifier == 'Trial.BeginBlock':
+            self.block_index += 1
+        elif identifier == 'Trial.BeginWave':
+            self.wave_index = json.loads(data)['waveNumber']
+        elif identifier == 'Trial.Resumed':
+            # Dead zones do not survive a crash, and the resumed program
+            # starts numbering them from zero again.
+            for dead_zone in list(self.active.values()):
+                self.end(dead_zone, timestamp, 'Resumed')
+    def end(self, dead_zone, timestamp, reason):
+        dead_zone.end_time = timestamp
+        dead_zone.end_reason = reason
+        del self.active[dead_zone.id]
+        self.episodes.append(dead_zone)
+    def finish(self, timestamp):
+        '''Close any episodes still open at the end of the file and return all episodes by spawn time.'''
+        for dead_zone in list(self.active.values()):
+            self.end(dead_zone, timestamp, 'Unfinished')
+        self.episodes.sort(key=attrgetter('spawn_time'))
+        return self.episodes
+    @staticmethod
+    def position(dead_zone):
+        if dead_zone.last_change is None:
+            return dead_zone.spawn_x, dead_zone.spawn_y
+        data = json.loads(dead_zone.last_change)
+        return data['x'], data['y']
+
+
+class ScriptRegistry(object):
+    '''
+    The scripts that trials were run from, each parsed once into a table of
+    its waves. The game loads the script named in System.Startup relative to
+    its data folder, so a relative script is looked for there first, and then
+    next to the log.
+    '''
+    def __init__(self, script=None):
+        self.script = script
+        self.wave_tables = {}
+    def resolve(self, trial):
+        if self.script is not None:
+            return self.script
+        script = trial.attributes.get('script', os.path.join('..', 'script', 'script.csv'))
+        candidates = [script] if os.path.isabs(script) else [
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', script),
+            os.path.join('data', script),
+            os.path.join(os.path.dirname(trial.filename), os.path.basename(script))]
+        candidates = [os.path.normpath(candidate) for candidate in candidates]
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return candidate
+        raise FileNotFoundError('no script {} for {}, tried {}'.format(script, trial.filename, ', '.join(candidates)))
+    def waves(self, trial):
+        '''
+        Return the waves of the script of `trial` as a list of (left type,
+        right type, flank type), where wave number n is at index n - 1.
+        '''
+        filename = self.resolve(trial)
+        if filename not in self.wave_tables:
+            self.wave_tables[filename] = read_script_waves(filename)
+        return self.wave_tables[filename]
+
+
+def read_script_waves(filename):
+    waves = []
+    with open(filename) as file:
+        for line in file:
+            event, _, data = line.partition(',')
+            if event == 'Script.BeginWave':
+                data = json.loads(data)
+                waves.append((data['left_type'], data['right_type'], data['flank_type']))
+    return waves
+
+
 class Trial(object):
     __slots__ = map(str.strip, '''
         filename
@@ -399,34 +2001,87 @@ class Trial(object):
         producer
         lazy_events
         last_timestamp
+        dead_zones
+        offset
+        line_number
+        stats
     '''.split())
-    def __init__(self, filename):
+    def __init__(self, filename, ignore=None, stats=None):
         self.filename = filename
         self.attributes = dict()
         for match in attrpair_re.finditer(filename):
             self.attributes[match.group(1).lower()] = match.group(2)
-        self.producer = Trial.event_producer(filename)
+        self.dead_zones = DeadZoneTrack()
+        self.offset = 0
+        self.line_number = 0
+        self.stats = stats
+        self.producer = self.event_producer(ignore_events if ignore is None else ignore, 0, 0)
+        if stats is not None:
+            self.producer = stats.timed_events(self, self.producer)
         first_event = next(self.producer)
         assert first_event.identifier == 'System.Startup'
         first_event.data['time'] = parse_datetime(first_event.data['time'])
         self.last_timestamp = first_event.timestamp
+        self.dead_zones.start_timestamp = first_event.timestamp
         for key, value in first_event.data.items():
             self.attributes[key] = value
-    @staticmethod
-    def event_producer(filename):
-        with open(filename) as file:
-            for index, line in enumerate(file):
-                timestamp, _, rest = line.partition(',')
+    def event_producer(self, ignore, offset, line_number):
+        '''
+        Yield the events of the file from the byte `offset`, which is the
+        start of line `line_number + 1`. After each event is yielded,
+        `self.offset` is the byte offset of the line following it, and
+        `self.line_number` is its line number; once the file is exhausted,
+        they are those of the end of the file.
+        '''
+        dead_zones = self.dead_zones
+        dead_zone_identifiers = dead_zones.identifiers
+        dead_zone_consumed_identifiers = dead_zones.consumed_identifiers
+        dead_zone_changed = dead_zones.changed
+        with open(self.filename, 'rb') as file:
+            file.seek(offset)
+            index = line_number - 1
+            for index, line in enumerate(file, line_number):
+                offset += len(line)
+                timestamp, _, rest = line.decode().partition(',')
                 identifier, _, data = rest.partition(',')
                 identifier = identifier.strip()
-                if identifier in ignore_events:
+                if identifier in dead_zone_identifiers:
+                    try:
+                        if identifier == 'Hybrid.DeadZoneChanged':
+                            dead_zone_changed(data)
+                            continue
+                        dead_zones.handle(int(timestamp), identifier, data)
+                    except ValueError:
+                        print("In file", self.filename, "line", index + 1, file=sys.stderr)
+                        raise
+                    if identifier in dead_zone_consumed_identifiers:
+                        continue
+                if identifier in ignore:
                     continue
                 try:
                     event = Event(int(timestamp), identifier, json.loads(data), index + 1)
                 except ValueError:
-                    print("In file", filename, "line", index + 1, file=sys.stderr)
+                    print("In file", self.filename, "line", index + 1, file=sys.stderr)
                     raise
+                self.offset = offset
+                self.line_number = index + 1
                 yield event
+            self.offset = offset
+            self.line_number = index + 1
+    def seek(self, offset, line_number, timestamp, dead_zones, ignore=None):
+        '''
+        Continue reading the file from a position previously recorded from
+        `offset` and the `line_number` of the last event read, given the
+        timestamp of that event and a dead zone track as of that event.
+        '''
+        self.producer.close()
+        self.dead_zones = dead_zones
+        self.last_timestamp = timestamp
+        self.offset = offset
+        self.line_number = line_number
+        self.producer = self.event_producer(ignore_events if ignore is None else ignore, offset, line_number)
+        if self.stats is not None:
+            self.producer = self.stats.timed_events(self, self.producer)
     def iter_attributes(self):
         return self.attributes.items()
     def attribute_string(self):
@@ -441,20 +2096,155 @@ class Trial(object):
     @property
     def events(self):
         try:
-            return self.lazy_events
+            events = self.lazy_events
         except AttributeError:
-            self.lazy_events = list(self)
-            return self.lazy_events
+            events = self.lazy_events = list(self)
+        if self.stats is not None:
+            return self.stats.timed_handling(events)
+        return events
+
+
+
+def trial_kill_groups(job):
+    '''
+    Find the cannon blasts and black hole encircles of a single trial, with
+    `group_kills`, and return a row of `kill_group_row_keys` for each. The
+    RowIndex column is left for the caller to fill in.
+    '''
+    import numpy
+    trial_index, filename, grouping = job
+    trial = Trial(filename)
+    start_timestamp = trial.last_timestamp
+    grouped_kills = {enemy_type: [] for enemy_type, _, _, _ in grouped_enemy_types}
+    for event in trial:
+        if event.identifier == 'Trial.EnemyHit' and event.data['type'] in grouped_kills:
+            grouped_kills[event.data['type']].append((event.timestamp, event.data['participant'],
+                    event.data['x'] * pixel_to_real, event.data['y'] * pixel_to_real))
+    rows = []
+    for enemy_type, group_type, _, _ in grouped_enemy_types:
+        if not grouped_kills[enemy_type]:
+            continue
+        timestamps, participants, xs, ys = (numpy.array(column) for column in zip(*grouped_kills[enemy_type]))
+        group_ids = group_kills(timestamps, participants, xs, ys, grouping)
+        summaries = kill_group_summaries(group_ids, timestamps, participants, xs, ys)
+        for group_id, (count, start, duration, x, y, spread, participant) in enumerate(summaries):
+            row_data = [None] * len(kill_group_row_keys)
+            row_data[kill_group_row_keys.index('TrialIndex')] = trial_index
+            row_data[kill_group_row_keys.index('GroupType')] = group_type
+            row_data[kill_group_row_keys.index('GroupId')] = group_id
+            row_data[kill_group_row_keys.index('RealParticipantId')] = participant
+            row_data[kill_group_row_keys.index('KillCount')] = count
+            row_data[kill_group_row_keys.index('StartTime_ms')] = start - start_timestamp
+            row_data[kill_group_row_keys.index('Duration_ms')] = duration
+            row_data[kill_group_row_keys.index('CentreX_cm')] = x
+            row_data[kill_group_row_keys.index('CentreY_cm')] = y
+            row_data[kill_group_row_keys.index('Spread_cm')] = spread
+            rows.append(row_data)
+    return rows
 
 
+def trial_kill_summary(job):
+    '''
+    Summarize the kill data of a single trial, whose script is found by the
+    `ScriptRegistry` of the job. Returns a dictionary from a tuple of the
+    group column values to a list of `RunningStatistics`, one per column of
+    `summary_value_keys`.
+    '''
+    trial_index, filename, group_keys, scripts, grouping = job
+    trial = Trial(filename)
+    waves = scripts.waves(trial)
+    state = TrialState(trial)
+    group_indices = [kill_row_keys.index(key) for key in group_keys]
+    value_indices = [kill_row_keys.index(key) for key in summary_value_keys]
+    summaries = {}
+    for row_data in kill_rows(trial_index, trial, state, waves, grouping=grouping):
+        group = tuple(row_data[index] for index in group_indices)
+        if group not in summaries:
+            summaries[group] = [RunningStatistics() for _ in value_indices]
+        for statistics, index in zip(summaries[group], value_indices):
+            statistics.add(row_data[index])
+    return summaries
+
+
+def merge_kill_summaries(summaries, other):
+    '''Merge one dictionary of kill summaries into another.'''
+    for group, statistics_list in other.items():
+        if group in summaries:
+            for statistics, other_statistics in zip(summaries[group], statistics_list):
+                statistics.merge(other_statistics)
+        else:
+            summaries[group] = statistics_list
+
+
+def summary_row_keys(group_keys):
+    row_keys = list(group_keys) + ['KillCount']
+    for key in summary_value_keys:
+        row_keys += ['Mean' + key, 'StdDev' + key, 'Min' + key, 'Max' + key]
+    return row_keys
+
+
+def kill_summary_rows(summaries):
+    '''
+    Yield a row of `summary_row_keys` for each group, in sorted order. A group
+    column can hold None, such as for a kill without a participant, or both
+    numbers and strings, so each value is sorted after the values of earlier
+    kinds: numbers, then strings, then None.
+    '''
+    def sort_key(group):
+        return tuple((value is None, isinstance(value, str), value if value is not None else 0) for value in group)
+    for group in sorted(summaries, key=sort_key):
+        statistics_list = summaries[group]
+        row_data = list(group) + [statistics_list[0].count]
+        for statistics in statistics_list:
+            row_data += [statistics.mean, statistics.stddev, statistics.minimum, statistics.maximum]
+        yield row_data
+
+
+class RunningStatistics(object):
+    '''
+    The count, mean, variance and range of a stream of values, computed in a
+    single pass with Welford's algorithm. Two instances can be merged exactly,
+    so values can be summarized in parallel and combined afterwards.
+    '''
+    __slots__ = 'count mean m2 minimum maximum'.split()
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+    @property
+    def stddev(self):
+        return self.variance ** 0.5
+
 
 def stddev(values):
-    values = list(values)
-    if not values:
-        return 0.0
-    mean = sum(list(values)) / len(values)
-    stddev = (sum((value - mean) ** 2 for value in values) / (len(values) - 1)) ** 0.5 if len(values) > 1 else 0
-    return stddev
+    statistics = RunningStatistics()
+    for value in values:
+        statistics.add(value)
+    return statistics.stddev
 
 
 if __name__ == '__main__':
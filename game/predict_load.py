@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+'''
+Predicts the load a game script will put on the wall before it is run: how
+many enemies will be alive at once over each wave, and how many
+Trial.EnemyMoved lines a second the log will get, which is almost all of
+the log while a wave is running.
+
+The spawn timer, spawn positions and collisions with the earth follow
+enemy.pde. Each enemy in a wave is spawned when the spawn timer has covered
+its spawnTime, moves straight towards the earth at its speed, and logs a
+Trial.EnemyMoved every frame from the one after it spawns to the one after
+it is killed or hits the earth. Participants are modelled as killing each
+live enemy at a constant rate, so the counts are expectations; with the
+default kill rate of zero, no enemy is killed and the counts are exact.
+
+Every wave is computed with NumPy arrays over its frames, so thousands of
+scripts can be checked in seconds, in parallel worker processes.
+'''
+
+import csv
+import sys
+import json
+import math
+
+import numpy
+
+
+wave_row_keys = ['Script',
+                 'WaveIndex',
+                 'LeftType',
+                 'RightType',
+                 'FlankType',
+                 'EnemyCount',
+                 'Duration_s',
+                 'PeakLiveEnemies',
+                 'PeakTime_s',
+                 'MeanLiveEnemies',
+                 'PeakLogLinesPerSecond',
+                 'MeanLogLinesPerSecond',
+                 'Overloaded']
+
+script_row_keys = ['Script',
+                   'WaveCount',
+                   'EnemyCount',
+                   'Duration_s',
+                   'PeakLiveEnemies',
+                   'PeakWaveIndex',
+                   'PeakLogLinesPerSecond',
+                   'Overloaded']
+
+timeline_row_keys = ['Script',
+                     'WaveIndex',
+                     'Time_s',
+                     'LiveEnemies',
+                     'LogLinesPerSecond']
+
+# From enemy.pde and game.pde.
+enemy_radius = 32.0
+earth_radius = 256.0 # pixels, before the trial scale
+spawn_timer_step = 0.033 # added to the spawn timer every frame
+spawn_push_step = 4.0 # pixels an enemy is pushed towards the screen at a time
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Predict the live enemies and log volume of game scripts.')
+    parser.add_argument('scripts', nargs='+', help='the scripts to check, as written by generate_script.py')
+    parser.add_argument('--kill-rate', type=float, default=0.0, help='the rate at which the participants kill '
+            'each live enemy, per second (default: 0, no enemy is killed)')
+    parser.add_argument('--frame-rate', type=float, default=60.0, help='the frame rate of the game '
+            '(default: 60, the Processing default)')
+    parser.add_argument('--screen', type=str, default='7680x2160', help='the size of the game in pixels, as '
+            'WIDTHxHEIGHT (default: 7680x2160, the wall)')
+    parser.add_argument('--trial-scale', type=float, default=1.0, help="the machine's trial scale "
+            '(default: 1.0, the wall)')
+    parser.add_argument('--max-live', type=float, default=None, help='mark waves that are predicted to have '
+            'more live enemies than this at once as overloaded; the exit status is 1 if any wave is')
+    parser.add_argument('--max-log-rate', type=float, default=None, help='mark waves that are predicted to log '
+            'more lines a second than this as overloaded; the exit status is 1 if any wave is')
+    parser.add_argument('--script-summary', action='store_true', help='write one row per script, for the '
+            'wave with the most live enemies')
+    parser.add_argument('--timeline', type=float, default=None, metavar='STEP', help='write the predicted live '
+            'enemies every STEP seconds of each wave instead of a row per wave')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes '
+            '(default: one per CPU)')
+    arguments = parser.parse_args()
+
+    model = LoadModel()
+    model.kill_rate = arguments.kill_rate
+    model.frame_rate = arguments.frame_rate
+    width, _, height = arguments.screen.partition('x')
+    model.screen = (float(width), float(height))
+    model.trial_scale = arguments.trial_scale
+    model.max_live = arguments.max_live
+    model.max_log_rate = arguments.max_log_rate
+    model.timeline_step = arguments.timeline
+
+    jobs = [(filename, model) for filename in arguments.scripts]
+    if arguments.processes == 1 or len(jobs) <= 1:
+        results = list(map(predict_script, jobs))
+    else:
+        from multiprocessing import Pool
+        with Pool(arguments.processes) as pool:
+            results = pool.map(predict_script, jobs)
+
+    writer = csv.writer(sys.stdout)
+    if arguments.timeline is not None:
+        writer.writerow(timeline_row_keys)
+    elif arguments.script_summary:
+        writer.writerow(script_row_keys)
+    else:
+        writer.writerow(wave_row_keys)
+    overloaded = False
+    for filename, wave_rows, timeline_rows in results:
+        overloaded = overloaded or any(row[wave_row_keys.index('Overloaded')] for row in wave_rows)
+        if arguments.timeline is not None:
+            writer.writerows(timeline_rows)
+        elif arguments.script_summary:
+            writer.writerow(script_row(filename, wave_rows))
+        else:
+            writer.writerows(wave_rows)
+    return 1 if overloaded else 0
+
+
+class LoadModel(object):
+    '''The machine the scripts are predicted for, and how fast the participants kill enemies.'''
+    __slots__ = '''
+        kill_rate
+        frame_rate
+        screen
+        trial_scale
+        max_live
+        max_log_rate
+        timeline_step
+    '''.split()
+
+
+class Wave(object):
+    '''The enemies of a wave, in spawn order, as arrays.'''
+    __slots__ = 'left_type right_type flank_type speeds angles spawn_times'.split()
+
+
+def read_waves(filename):
+    '''Return the `Wave`s of a script.'''
+    waves = []
+    wave = None
+    enemies = []
+    with open(filename) as file:
+        for line_number, line in enumerate(file, 1):
+            try:
+                if line.startswith('Script.SpawnEnemy,'):
+                    data = json.loads(line[len('Script.SpawnEnemy,'):])
+                    enemies.append((data['speed'], data['angle'], data['spawnTime']))
+                elif line.startswith('Script.BeginWave,'):
+                    data = json.loads(line[len('Script.BeginWave,'):])
+                    wave = Wave()
+                    wave.left_type = data['left_type']
+                    wave.right_type = data['right_type']
+                    wave.flank_type = data['flank_type']
+                    enemies = []
+                elif line.startswith('Script.EndWave,'):
+                    wave.speeds, wave.angles, wave.spawn_times = numpy.array(enemies, dtype=float).reshape(-1, 3).T
+                    waves.append(wave)
+            except:
+                print("In file", filename, "line", line_number, file=sys.stderr)
+                raise
+    return waves
+
+
+def spawn_frames(spawn_times):
+    '''
+    Return the frame, counted from 1 at the start of the wave, at the end of
+    which each enemy is spawned. The spawn timer keeps whatever is left over
+    after a spawn, so an enemy is spawned once the timer has covered the
+    spawn times of every enemy up to and including it.
+    '''
+    frames = numpy.ceil(numpy.cumsum(spawn_times) / spawn_timer_step - 1e-9)
+    return numpy.maximum(frames, 1).astype(numpy.int64)
+
+
+def collision_frames(speeds, angles, model):
+    '''
+    Return the number of frames each enemy moves after it is spawned until
+    it hits the earth. Enemies start on a circle just outside the corners of
+    the screen, and are pushed in towards it in steps until the next step
+    would put them onscreen.
+    '''
+    width, height = model.screen
+    radians = angles / 180.0 * math.pi
+    cos = numpy.abs(numpy.cos(radians))
+    sin = numpy.abs(numpy.sin(radians))
+    spawn_distance = enemy_radius + math.sqrt(width * width * 0.5 + height * height * 0.5)
+    # How far from the centre each enemy's path leaves the screen, with the
+    # margin of an enemy's radius.
+    with numpy.errstate(divide='ignore'):
+        edge_distance = numpy.minimum((width * 0.5 + enemy_radius) / cos, (height * 0.5 + enemy_radius) / sin)
+    pushes = numpy.maximum(numpy.ceil((spawn_distance - edge_distance) / spawn_push_step) - 1, 0)
+    start_distance = spawn_distance - pushes * spawn_push_step
+    # The velocity is scaled by the trial scale when the enemy is created and
+    # again each time it moves.
+    step = speeds * model.trial_scale * model.trial_scale
+    collision_distance = earth_radius * model.trial_scale + enemy_radius
+    return (numpy.floor((start_distance - collision_distance) / step) + 1).astype(numpy.int64)
+
+
+def live_enemies(spawned, removed, survival):
+    '''
+    Return the expected number of enemies moved in each frame, from frame 0,
+    where each enemy is moved from frame `spawned` + 1 to frame `removed`
+    unless it is killed first, and `survival` is the chance that a live
+    enemy is not killed in a frame.
+
+    The count obeys live[t] = survival * live[t - 1] + arrivals[t] -
+    departures[t], which is a cumulative sum once each frame is weighted by
+    survival ** -t. The weights are restarted every so many frames to keep
+    them within range.
+    '''
+    frame_count = int(removed.max()) + 2 if len(removed) else 1
+    arrivals = numpy.bincount(spawned + 1, minlength=frame_count).astype(float)
+    # An enemy leaves the count with the weight it would have had in the
+    # frame after it is removed.
+    departures = numpy.bincount(removed + 1, weights=survival ** (removed - spawned).astype(float),
+                                minlength=frame_count)
+    changes = arrivals - departures
+    if survival == 1.0:
+        return numpy.maximum(numpy.cumsum(changes), 0.0)
+    window = max(1, int(500 / -math.log(survival)))
+    live = numpy.empty(frame_count)
+    carried = 0.0
+    for start in range(0, frame_count, window):
+        powers = survival ** numpy.arange(min(window, frame_count - start), dtype=float)
+        live[start:start + len(powers)] = powers * (carried + numpy.cumsum(changes[start:start + len(powers)] /
+                                                                           powers))
+        carried = live[start + len(powers) - 1] * survival
+    return numpy.maximum(live, 0.0)
+
+
+def predict_script(job):
+    '''Return the filename, wave rows and timeline rows of a script.'''
+    filename, model = job
+    survival = math.exp(-model.kill_rate / model.frame_rate)
+    wave_rows = []
+    timeline_rows = []
+    for wave_index, wave in enumerate(read_waves(filename)):
+        spawned = spawn_frames(wave.spawn_times)
+        removed = spawned + collision_frames(wave.speeds, wave.angles, model) + 1
+        live = live_enemies(spawned, removed, survival)
+        log_rate = live * model.frame_rate
+        peak = int(live.argmax())
+        row_data = [None] * len(wave_row_keys)
+        row_data[wave_row_keys.index('Script')] = filename
+        row_data[wave_row_keys.index('WaveIndex')] = wave_index
+        row_data[wave_row_keys.index('LeftType')] = wave.left_type
+        row_data[wave_row_keys.index('RightType')] = wave.right_type
+        row_data[wave_row_keys.index('FlankType')] = wave.flank_type
+        row_data[wave_row_keys.index('EnemyCount')] = len(spawned)
+        row_data[wave_row_keys.index('Duration_s')] = removed.max(initial=0) / model.frame_rate
+        row_data[wave_row_keys.index('PeakLiveEnemies')] = live[peak]
+        row_data[wave_row_keys.index('PeakTime_s')] = peak / model.frame_rate
+        row_data[wave_row_keys.index('MeanLiveEnemies')] = live.mean()
+        row_data[wave_row_keys.index('PeakLogLinesPerSecond')] = log_rate[peak]
+        row_data[wave_row_keys.index('MeanLogLinesPerSecond')] = log_rate.mean()
+        row_data[wave_row_keys.index('Overloaded')] = int(
+                (model.max_live is not None and live[peak] > model.max_live) or
+                (model.max_log_rate is not None and log_rate[peak] > model.max_log_rate))
+        wave_rows.append(row_data)
+        if model.timeline_step is not None:
+            step = max(1, int(round(model.timeline_step * model.frame_rate)))
+            for frame in range(0, len(live), step):
+                timeline_rows.append([filename, wave_index, frame / model.frame_rate, live[frame], log_rate[frame]])
+    return filename, wave_rows, timeline_rows
+
+
+def script_row(filename, wave_rows):
+    '''Summarize the wave rows of a script by its wave with the most live enemies.'''
+    row_data = [None] * len(script_row_keys)
+    row_data[script_row_keys.index('Script')] = filename
+    peak_row = max(wave_rows, key=lambda row: row[wave_row_keys.index('PeakLiveEnemies')], default=None)
+    row_data[script_row_keys.index('WaveCount')] = len(wave_rows)
+    row_data[script_row_keys.index('EnemyCount')] = sum(row[wave_row_keys.index('EnemyCount')] for row in wave_rows)
+    row_data[script_row_keys.index('Duration_s')] = sum(row[wave_row_keys.index('Duration_s')] for row in wave_rows)
+    row_data[script_row_keys.index('Overloaded')] = int(any(row[wave_row_keys.index('Overloaded')]
+                                                            for row in wave_rows))
+    if peak_row is not None:
+        row_data[script_row_keys.index('PeakLiveEnemies')] = peak_row[wave_row_keys.index('PeakLiveEnemies')]
+        row_data[script_row_keys.index('PeakWaveIndex')] = peak_row[wave_row_keys.index('WaveIndex')]
+        row_data[script_row_keys.index('PeakLogLinesPerSecond')] = \
+                peak_row[wave_row_keys.index('PeakLogLinesPerSecond')]
+    return row_data
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+'''
+Replays a game log without the Processing sketch. The log is read once up
+front, and a copy of the trial state is kept every few seconds, so the state
+at any timestamp can be found by reading from the checkpoint before it
+rather than from the start of the file.
+
+The state is tracked with the same `TrialState` used by logfile_to_csv.py,
+with the touches and dead zones that it does not keep. All positions are in
+centimetres.
+'''
+
+import sys
+import copy
+import json
+import bisect
+
+from logfile_to_csv import Trial, TrialState, DeadZoneTrack, pixel_to_real
+
+
+class Touch(object):
+    __slots__ = 'id participant x y down_time'.split()
+
+
+class FrameDeadZones(DeadZoneTrack):
+    '''
+    The dead zones of a frame. A trial changes its dead zone track as it reads
+    the lines of the dead zones, which can be after the time of the frame when
+    the frame has read ahead, so these are left to the frame to pass in as
+    events instead.
+    '''
+    identifiers = frozenset()
+    def update(self, event):
+        if event.identifier == 'Hybrid.DeadZoneChanged':
+            self.changed(json.dumps(event.data))
+        elif event.identifier in DeadZoneTrack.identifiers:
+            self.handle(event.timestamp, event.identifier, json.dumps(event.data))
+
+
+class Frame(object):
+    '''
+    The state of a trial as of `timestamp`: the cursors and workspaces in
+    `state`, the enemies on screen from `iter_enemies`, the touches currently
+    down, and the dead zones of `dead_zones`. The trial must be read with
+    `dead_zones` as its dead zone track, so that they are left to the frame.
+    '''
+    __slots__ = 'timestamp state appeared_enemies touches dead_zones'.split()
+    def __init__(self, trial):
+        self.timestamp = trial.last_timestamp
+        self.state = TrialState(trial)
+        # The game logs EnemySpawned for a whole wave when the wave is read
+        # from the script, so an enemy appears on screen when it first moves.
+        self.appeared_enemies = set()
+        self.touches = {}
+        self.dead_zones = FrameDeadZones()
+        self.dead_zones.start_timestamp = trial.last_timestamp
+    def copy(self):
+        frame = copy.copy(self)
+        frame.state = copy.deepcopy(self.state)
+        frame.appeared_enemies = set(self.appeared_enemies)
+        frame.touches = copy.deepcopy(self.touches)
+        # Closed dead zone episodes are not part of the state.
+        frame.dead_zones = copy.copy(self.dead_zones)
+        frame.dead_zones.active = copy.deepcopy(self.dead_zones.active)
+        frame.dead_zones.episodes = []
+        return frame
+    def update(self, event):
+        if event.identifier == 'Trial.EnemyDespawned':
+            self.state.enemies.pop(event.data['id'], None)
+        elif event.identifier == 'Trial.Resumed':
+            # TrialState drops the enemies and cursors.
+            self.appeared_enemies.clear()
+            self.touches.clear()
+        self.state.update(event)
+        self.dead_zones.update(event)
+        if event.identifier == 'Trial.EnemyMoved':
+            if event.data['id'] in self.state.enemies:
+                self.appeared_enemies.add(event.data['id'])
+        elif event.identifier in ('Trial.EnemyHit', 'Trial.EnemyCollide', 'Trial.EnemyDespawned'):
+            self.appeared_enemies.discard(event.data['id'])
+        elif event.identifier == 'Input.RawTouchDown':
+            touch = Touch()
+            touch.id = event.data['id']
+            touch.participant = self.touch_participant(event.data['id'])
+            touch.x = event.data['x'] * pixel_to_real
+            touch.y = event.data['y'] * pixel_to_real
+            touch.down_time = event.timestamp
+            self.touches[touch.id] = touch
+        elif event.identifier == 'Input.RawTouchMove':
+            touch = self.touches.get(event.data['id'])
+            if touch is not None:
+                if touch.participant is None:
+                    touch.participant = self.touch_participant(event.data['id'])
+                touch.x = event.data['x'] * pixel_to_real
+                touch.y = event.data['y'] * pixel_to_real
+        elif event.identifier == 'Input.RawTouchUp':
+            self.touches.pop(event.data['id'], None)
+        self.timestamp = event.timestamp
+    def touch_participant(self, touch_id):
+        uid = self.state.touch_id_next_unique_index[touch_id]
+        return self.state.touch_coding.get((touch_id, uid))
+    def iter_enemies(self):
+        '''Yield each enemy on screen.'''
+        for enemy_id, enemy in self.state.enemies.items():
+            if enemy_id in self.appeared_enemies:
+                yield enemy
+    def iter_dead_zones(self):
+        '''Yield (id, x, y, radius) for each dead zone, as of the last logged change.'''
+        for dead_zone in self.dead_zones.active.values():
+            x, y = DeadZoneTrack.position(dead_zone)
+            yield dead_zone.id, x * pixel_to_real, y * pixel_to_real, dead_zone.radius * pixel_to_real
+
+
+class Checkpoint(object):
+    __slots__ = 'timestamp offset line_number frame'.split()
+
+
+class Replay(object):
+    '''
+    A seekable replay of a single log file. Checkpoints are kept at least
+    `interval` seconds apart, so `seek` reads at most about that much of the
+    log, and `frames` plays the log forward from any timestamp.
+
+    Timestamps are the raw millisecond timestamps of the log; `start_timestamp`
+    and `end_timestamp` are those of the first and last events.
+    '''
+    def __init__(self, filename, interval=10.0):
+        self.filename = filename
+        self.interval = interval * 1000
+        trial = Trial(filename, ignore=set())
+        self.attributes = trial.attributes
+        self.start_timestamp = trial.last_timestamp
+        self.checkpoints = []
+        frame = Frame(trial)
+        trial.seek(trial.offset, trial.line_number, trial.last_timestamp, frame.dead_zones, ignore=set())
+        self.add_checkpoint(trial, frame, 1)
+        next_checkpoint = frame.timestamp + self.interval
+        for event in trial:
+            try:
+                frame.update(event)
+            except:
+                print("In file", filename, "line", event.line_number, file=sys.stderr)
+                raise
+            if event.timestamp >= next_checkpoint:
+                self.add_checkpoint(trial, frame, event.line_number)
+                next_checkpoint = event.timestamp + self.interval
+        self.end_timestamp = trial.last_timestamp
+        self.checkpoint_timestamps = [checkpoint.timestamp for checkpoint in self.checkpoints]
+    def add_checkpoint(self, trial, frame, line_number):
+        checkpoint = Checkpoint()
+        checkpoint.timestamp = frame.timestamp
+        checkpoint.offset = trial.offset
+        checkpoint.line_number = line_number
+        checkpoint.frame = frame.copy()
+        self.checkpoints.append(checkpoint)
+    def seek(self, timestamp):
+        '''Return the frame as of the last event at or before `timestamp`.'''
+        for frame in self.frames(timestamp, timestamp):
+            return frame
+    def frames(self, start=None, stop=None, step=1000 / 60):
+        '''
+        Yield the frame every `step` milliseconds from `start` up to `stop`,
+        which default to the first and last events of the log. The same frame
+        is updated in place and yielded each time; use `Frame.copy` to keep
+        one.
+        '''
+        start = self.start_timestamp if start is None else start
+        stop = self.end_timestamp if stop is None else stop
+        index = max(bisect.bisect_right(self.checkpoint_timestamps, start) - 1, 0)
+        checkpoint = self.checkpoints[index]
+        frame = checkpoint.frame.copy()
+        trial = Trial(self.filename, ignore=set())
+        trial.seek(checkpoint.offset, checkpoint.line_number, checkpoint.timestamp, frame.dead_zones, ignore=set())
+        pending = next(trial, None)
+        timestamp = start
+        while timestamp <= stop:
+            while pending is not None and pending.timestamp <= timestamp:
+                try:
+                    frame.update(pending)
+                except:
+                    print("In file", self.filename, "line", pending.line_number, file=sys.stderr)
+                    raise
+                pending = next(trial, None)
+            frame.timestamp = timestamp
+            yield frame
+            timestamp += step
+
+
+def main():
+    import csv
+    import argparse
+    parser = argparse.ArgumentParser(description='Print the state of a trial at the given times.')
+    parser.add_argument('filename', help='the log file of the trial')
+    parser.add_argument('--at', type=float, action='append', default=[], help='a time in seconds since the start '
+            'of the trial; may be given more than once (default: the end of the trial)')
+    parser.add_argument('--interval', type=float, default=10.0, help='the number of seconds between '
+            'checkpoints (default: 10)')
+    arguments = parser.parse_args()
+
+    replay = Replay(arguments.filename, arguments.interval)
+    times = [replay.start_timestamp + time * 1000 for time in arguments.at] or [replay.end_timestamp]
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['Time_ms', 'ObjectType', 'ObjectId', 'RealParticipantId', 'X_cm', 'Y_cm', 'Radius_cm'])
+    for timestamp in times:
+        frame = replay.seek(timestamp)
+        time = timestamp - replay.start_timestamp
+        for enemy in frame.iter_enemies():
+            writer.writerow([time, enemy.type, enemy.id, None, enemy.x, enemy.y, enemy.radius])
+        for cursor in frame.state.cursors.values():
+            writer.writerow([time, 'Cursor', None, cursor.participant, cursor.x, cursor.y, None])
+        for workspace in frame.state.workspaces.values():
+            writer.writerow([time, 'Workspace', None, workspace.participant, workspace.x, workspace.y, None])
+        for touch in frame.touches.values():
+            writer.writerow([time, 'Touch', touch.id, touch.participant, touch.x, touch.y, None])
+        for dead_zone_id, x, y, radius in frame.iter_dead_zones():
+            writer.writerow([time, 'DeadZone', dead_zone_id, None, x, y, radius])
+
+
+if __name__ == '__main__':
+    main()
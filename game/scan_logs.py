@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+'''
+Checks logs for the problems that make logfile_to_csv.py fail, without
+converting them: lines that are not a timestamp, an identifier and a JSON
+object, JSON that cannot be decoded, timestamps that go back in time, and
+enemies and cursors that are removed without having been spawned, or
+spawned twice. Every problem found is written as a row of a csv, with the
+line it was found on.
+
+Only what the converter reads is checked, so the JSON of the event types it
+ignores is not decoded, and their timestamps are not compared, unless the
+logs are checked for the touch data export, which reads every event. No
+Event is built: lines are split as bytes, and the JSON of most lines is
+checked with a regular expression rather than decoded. The logs are
+checked in parallel.
+'''
+
+import re
+import os
+import csv
+import sys
+import glob
+import json
+
+from logfile_to_csv import ignore_events, datetime_re, DeadZoneTrack, map_trials
+
+
+problem_row_keys = ['Log',
+                    'LineNumber',
+                    'Problem']
+
+# A JSON value as the logger writes it: a number, or a string without escapes.
+json_value_pattern = rb'(?:-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|"[^"\\\x00-\x1f]*")'
+
+# Nearly every line holds a flat JSON object of such values, which this
+# checks several times faster than decoding it; anything else is decoded.
+flat_json_object_re = re.compile(rb'\s*\{"\w+":' + json_value_pattern +
+                                 rb'(?:,"\w+":' + json_value_pattern + rb')*\}\s*')
+
+# The events whose data is checked: the start of the log, and the events
+# that pair spawns with removals.
+enemy_spawned = b'Trial.EnemySpawned'
+enemy_removed = {b'Trial.EnemyHit', b'Trial.EnemyCollide'}
+cursor_spawned = b'Hybrid.CursorSpawned'
+cursor_used = {b'Hybrid.CursorMoved', b'Hybrid.CursorDespawned'}
+cursor_despawned = b'Hybrid.CursorDespawned'
+startup = b'System.Startup'
+decoded_identifiers = {startup, enemy_spawned, cursor_spawned} | enemy_removed | cursor_used
+
+# Dead zone events are always decoded by the converter, but never yielded,
+# so their timestamps are not compared.
+dead_zone_identifiers = {identifier.encode() for identifier in DeadZoneTrack.consumed_identifiers}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Check logs for problems that would stop their conversion.')
+    parser.add_argument('directory', type=str, nargs=1, help='the directory containing the files to check '
+            '(or a single file)')
+    parser.add_argument('--touch-data', action='store_true', help='check the logs as the touch data export reads '
+            'them, decoding every event rather than only those the other exports read')
+    parser.add_argument('--max-problems', type=int, default=100, help='the number of problems after which the '
+            'rest of a log is not checked, or 0 to check all of it (default: 100)')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes used '
+            '(default: one per CPU)')
+    arguments = parser.parse_args()
+
+    if os.path.isdir(arguments.directory[0]):
+        filenames = sorted(glob.glob(os.path.join(arguments.directory[0], '*.csv')))
+    else:
+        filenames = [arguments.directory[0]]
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(problem_row_keys)
+    bad_logs = 0
+    problem_count = 0
+    jobs = [(filename, arguments.touch_data, arguments.max_problems or None) for filename in filenames]
+    for filename, problems in zip(filenames, map_trials(scan_log, jobs, arguments.processes)):
+        for line_number, problem in problems:
+            writer.writerow([filename, line_number, problem])
+        bad_logs += bool(problems)
+        problem_count += len(problems)
+    print(problem_count, "problems in", bad_logs, "of", len(filenames), "logs", file=sys.stderr)
+    return 1 if bad_logs else 0
+
+
+def scan_log(job):
+    '''
+    Check a single log, returning a list of (line number, problem) for each
+    problem found. The log is only checked up to its `max_problems`-th
+    problem, unless that is None.
+    '''
+    filename, touch, max_problems = job
+    if touch:
+        ignored = set()
+    else:
+        ignored = {identifier.encode() for identifier in ignore_events}
+    flat_json_object = flat_json_object_re.fullmatch
+    problems = []
+    enemies = set()
+    cursors = set()
+    last_timestamp = None
+    line_number = 0
+    with open(filename, 'rb') as file:
+        for line_number, line in enumerate(file, 1):
+            if max_problems is not None and len(problems) >= max_problems:
+                problems.append((line_number, 'not checked any further'))
+                break
+            if not line.isascii():
+                try:
+                    line.decode()
+                except UnicodeDecodeError as error:
+                    problems.append((line_number, 'not UTF-8: {}'.format(error)))
+                    continue
+            timestamp, _, rest = line.partition(b',')
+            identifier, comma, data = rest.partition(b',')
+            if not comma:
+                problems.append((line_number, 'not a timestamp, an identifier and JSON data'))
+                continue
+            try:
+                timestamp = int(timestamp)
+            except ValueError:
+                problems.append((line_number, 'not a timestamp: {!r}'.format(timestamp.strip().decode())))
+                continue
+            identifier = identifier.strip()
+            if line_number == 1 and identifier != startup:
+                problems.append((line_number, 'the first event is not System.Startup'))
+            if identifier in ignored:
+                continue
+
+            decoded = None
+            if identifier in decoded_identifiers or flat_json_object(data) is None:
+                try:
+                    decoded = json.loads(data)
+                except ValueError as error:
+                    problems.append((line_number, 'invalid JSON for {}: {}'.format(identifier.decode(), error)))
+                    continue
+                if not isinstance(decoded, dict):
+                    problems.append((line_number, 'the JSON for {} is not an object'.format(identifier.decode())))
+                    continue
+            if identifier in dead_zone_identifiers:
+                continue
+
+            if last_timestamp is not None and timestamp < last_timestamp:
+                problems.append((line_number, 'the timestamp {} is before the previous one, {}'.format(
+                                 timestamp, last_timestamp)))
+            last_timestamp = timestamp
+
+            if identifier == startup:
+                if not isinstance(decoded.get('time'), str) or datetime_re.match(decoded['time']) is None:
+                    problems.append((line_number, 'System.Startup has no valid time'))
+            elif identifier == enemy_spawned:
+                if decoded.get('id') in enemies:
+                    problems.append((line_number, 'enemy {} is spawned again'.format(decoded.get('id'))))
+                enemies.add(decoded.get('id'))
+            elif identifier in enemy_removed:
+                if decoded.get('id') not in enemies:
+                    problems.append((line_number, '{} of enemy {}, which is not on screen'.format(
+                                     identifier.decode(), decoded.get('id'))))
+                enemies.discard(decoded.get('id'))
+            elif identifier == cursor_spawned:
+                if decoded.get('participant') in cursors:
+                    problems.append((line_number, 'the cursor of {} is spawned again'.format(
+                                     decoded.get('participant'))))
+                cursors.add(decoded.get('participant'))
+            elif identifier in cursor_used:
+                if decoded.get('participant') not in cursors:
+                    problems.append((line_number, '{} of {}, who has no cursor'.format(
+                                     identifier.decode(), decoded.get('participant'))))
+                if identifier == cursor_despawned:
+                    cursors.discard(decoded.get('participant'))
+            elif identifier == b'Trial.Resumed':
+                # As in TrialState, nothing on screen survives a crash.
+                enemies.clear()
+                cursors.clear()
+    if line_number == 0:
+        problems.append((0, 'the log is empty'))
+    return problems
+
+
+if __name__ == '__main__':
+    sys.exit(main())
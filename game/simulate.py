@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+
+'''
+Simulates sessions of the game without a screen, writing logs in the format
+of logger.pde, so that the analysis can be tried on sessions of any length
+and number of participants.
+
+The game itself is followed frame by frame: the script is read as game.pde
+reads it, with the sync countdown before each wave and a break at each
+block, and enemies are spawned, moved and collide with the earth as in
+enemy.pde, in single precision. Positions are written the way Java's %f
+writes them.
+
+The participants are simulated. Each picks the onscreen enemy nearest to
+its workspace that nobody else is after, puts a finger down in its
+workspace and moves it onto the enemy, or spawns a cursor and moves that
+onto the enemy if it is out of reach, and kills it with the weapon of its
+type when the touch is lifted, or misses if the enemy is already gone.
+
+Each log is written next to a copy of the script it played, which the log
+names, so that logfile_to_csv.py finds the script wherever the logs are.
+'''
+
+import os
+import json
+import math
+import random
+import datetime
+
+import numpy
+
+from predict_load import enemy_radius, earth_radius, spawn_timer_step, spawn_push_step
+
+
+# From game.pde, workspace.pde and logfile_to_csv.py.
+sync_frames = 60
+earth_max_health = 50
+earth_damage_taken_from_enemy = 1
+default_participants = ['Praline', 'Stiffany']
+workspace_reach = 512.0 # pixels; the radius of a movable workspace
+touch_spread = 128.0 # pixels from the workspace centre that fingers are put down
+
+time_format = '%Y-%m-%d %H-%M-%S'
+
+# Each weapon's kill sources for a finger and a cursor, from weapon.pde.
+hit_sources = {'Cannon': ('TouchTap', 'CursorTap'),
+               'BlackHole': ('TouchEncircled', 'CursorEncircled'),
+               'Shield': ('ShieldCollision', 'ShieldCollision')}
+credit_sources = {'Cannon': ('FingerTap', 'CursorTap'),
+                  'BlackHole': ('FingerEncircled', 'CursorEncircled'),
+                  'Shield': ('Active', 'Active')}
+
+# Logs are written in chunks of about this many characters.
+chunk_size = 1 << 22
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulate sessions of the game and write their logs.')
+    parser.add_argument('script', type=str, help='the script to play, as written by generate_script.py')
+    parser.add_argument('output_dir', type=str, help='the directory to write the logs to')
+    parser.add_argument('--logs', type=int, default=1, help='the number of sessions to simulate (default: 1)')
+    parser.add_argument('--participants', type=str, nargs='+', default=default_participants, help='the '
+            'participants, from left to right (default: {})'.format(' '.join(default_participants)))
+    parser.add_argument('--frame-rate', type=float, default=60.0, help='the frame rate of the game '
+            '(default: 60, the Processing default)')
+    parser.add_argument('--duration', type=float, default=None, help='repeat the blocks of the script until '
+            'each session lasts at least this many seconds (default: play the script once)')
+    parser.add_argument('--kill-time', type=float, default=0.8, help='the median time in seconds a '
+            'participant takes to kill an enemy, from putting a finger down (default: 0.8)')
+    parser.add_argument('--block-break', type=float, default=10.0, help='the time in seconds the participants '
+            'take to dismiss the dialog at the start of each block (default: 10)')
+    parser.add_argument('--screen', type=str, default='7680x2160', help='the size of the game in pixels, as '
+            'WIDTHxHEIGHT (default: 7680x2160, the wall)')
+    parser.add_argument('--trial-scale', type=float, default=1.0, help="the machine's trial scale "
+            '(default: 1.0, the wall)')
+    parser.add_argument('--cooperative', action='store_true', help='log the sessions as cooperative')
+    parser.add_argument('--movable-workspaces', action='store_true', help='log the workspaces as movable')
+    parser.add_argument('--start', type=str, default='2019-10-01 10-00-00', help='the time the first session '
+            'starts, as YYYY-MM-DD HH-MM-SS; each later session starts a day after the one before '
+            '(default: 2019-10-01 10-00-00)')
+    parser.add_argument('--seed', type=str, default=None, help='the seed of the random number generator; each '
+            'session is seeded from it and its index, so a session does not depend on the others')
+    parser.add_argument('--processes', type=int, default=None, help='the number of worker processes '
+            '(default: one per CPU)')
+    arguments = parser.parse_args()
+
+    settings = Settings()
+    settings.participants = arguments.participants
+    settings.frame_rate = arguments.frame_rate
+    settings.duration = arguments.duration
+    settings.kill_time = arguments.kill_time
+    settings.block_break = arguments.block_break
+    width, _, height = arguments.screen.partition('x')
+    settings.screen = (int(width), int(height))
+    settings.trial_scale = arguments.trial_scale
+    settings.cooperative = arguments.cooperative
+    settings.movable_workspaces = arguments.movable_workspaces
+
+    with open(arguments.script) as file:
+        script = [parse_script_line(line) for line in file if line.strip()]
+    start = datetime.datetime.strptime(arguments.start, time_format)
+    os.makedirs(arguments.output_dir, exist_ok=True)
+    jobs = [(script, settings, start + datetime.timedelta(days=index), arguments.output_dir,
+             '{}:{}'.format(arguments.seed, index) if arguments.seed is not None else None)
+            for index in range(arguments.logs)]
+    if arguments.processes == 1 or len(jobs) <= 1:
+        filenames = list(map(simulate_log, jobs))
+    else:
+        from multiprocessing import Pool
+        with Pool(arguments.processes) as pool:
+            filenames = pool.map(simulate_log, jobs)
+    for filename in filenames:
+        print(filename)
+
+
+class Settings(object):
+    '''How the sessions are simulated.'''
+    __slots__ = '''
+        participants
+        frame_rate
+        duration
+        kill_time
+        block_break
+        screen
+        trial_scale
+        cooperative
+        movable_workspaces
+    '''.split()
+
+
+class Participant(object):
+    '''
+    A participant and the touch it is killing an enemy with, if any. The
+    target is the id of the enemy; the cursor is None unless one is spawned.
+    '''
+    __slots__ = '''
+        name
+        workspace_x
+        workspace_y
+        damage
+        score
+        target
+        weapon
+        touch_id
+        frames_left
+        finger_x
+        finger_y
+        cursor
+    '''.split()
+
+
+class Enemies(object):
+    '''The enemies on screen, in the order they were spawned, as arrays.'''
+    __slots__ = 'ids types x y vx vy dead'.split()
+
+
+def parse_script_line(line):
+    name, _, data = line.partition(',')
+    return name, json.loads(data), line
+
+
+def java_float(value):
+    '''
+    Return `value`, nudged so that Python's '%f' writes it as Java's %f
+    would. Java rounds ties half up, away from zero, where Python rounds
+    them to even; a float is only ever a tie at six decimal places if it
+    has at most seven binary places and the seventh is set.
+    '''
+    if value * 128.0 % 2.0 == 1.0:
+        return value + math.copysign(2.0 ** -30, value)
+    return value
+
+
+def java_floats(values):
+    '''Return an array of floats as a list, nudged as `java_float` does.'''
+    values = values.astype(numpy.float64)
+    ties = values * 128.0 % 2.0 == 1.0
+    if ties.any():
+        values[ties] += numpy.copysign(2.0 ** -30, values[ties])
+    return values.tolist()
+
+
+def simulate_log(job):
+    '''Simulate a session and write its log and script, returning the log's filename.'''
+    script, settings, start, output_dir, seed = job
+    random.seed(seed)
+    stem = os.path.join(output_dir, start.strftime(time_format))
+    with open(stem + '.csv.partial', 'w') as file:
+        session = Session(script, settings, start, file)
+        session.run()
+    with open(stem + '.script.partial', 'w') as file:
+        file.write(script[0][2])
+        for _ in range(session.passes):
+            file.writelines(line for name, data, line in script[1:] if name != 'Script.End')
+        file.writelines(line for name, data, line in script if name == 'Script.End')
+    os.replace(stem + '.script.partial', stem + '.script')
+    os.replace(stem + '.csv.partial', stem + '.csv')
+    return stem + '.csv'
+
+
+class Session(object):
+    '''
+    The state of the game as it runs a script, and the log it is writing.
+    `passes` counts how many times the blocks of the script were played.
+    '''
+    __slots__ = '''
+        script
+        settings
+        file
+        start
+        chunks
+        chunk_length
+        frame
+        timestamp
+        state
+        countdown
+        events
+        passes
+        participants
+        enemies
+        wave
+        wave_number
+        next_enemy_id
+        next_touch_id
+        spawn_timer
+        spawn_times
+        spawn_cursor
+        width
+        height
+        scale
+    '''.split()
+    def __init__(self, script, settings, start, file):
+        self.script = script
+        self.settings = settings
+        self.file = file
+        self.start = start
+        self.chunks = []
+        self.chunk_length = 0
+        self.frame = 0
+        self.timestamp = int(start.timestamp() * 1000)
+        self.state = None
+        self.countdown = 0
+        self.events = None
+        self.passes = 0
+        self.width, self.height = settings.screen
+        self.scale = numpy.float32(settings.trial_scale)
+        self.participants = []
+        count = len(settings.participants)
+        for index, name in enumerate(settings.participants):
+            participant = Participant()
+            participant.name = name
+            participant.workspace_x = self.width * (2 * index + 1) / (2.0 * count)
+            participant.workspace_y = self.height * 0.5
+            participant.damage = 0
+            participant.score = 0
+            participant.target = None
+            participant.cursor = None
+            self.participants.append(participant)
+        self.enemies = empty_enemies()
+        self.wave = empty_enemies()
+        self.wave_number = 0
+        self.next_enemy_id = 0
+        self.next_touch_id = 0
+        self.spawn_timer = numpy.float32(0.0)
+        self.spawn_times = numpy.zeros(0, dtype=numpy.float32)
+        self.spawn_cursor = 0
+
+    def log(self, identifier, details):
+        self.write('%d, %s, %s\n' % (self.timestamp, identifier, details))
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.chunk_length += len(text)
+        if self.chunk_length >= chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.chunks))
+        self.chunks = []
+        self.chunk_length = 0
+
+    def run(self):
+        self.read_script()
+        frame_time = 1000.0 / self.settings.frame_rate
+        start_timestamp = self.timestamp
+        while self.state != 'ended':
+            self.frame += 1
+            self.timestamp = start_timestamp + int(self.frame * frame_time)
+            for participant in self.participants:
+                self.update_participant(participant)
+            if self.state == 'play':
+                self.update_enemies()
+            if self.state in ('dialog', 'sync'):
+                self.countdown -= 1
+                if self.countdown <= 0:
+                    self.read_script()
+        self.flush()
+
+    def script_events(self):
+        '''
+        Yield the events of the script, repeating its blocks until the
+        session has lasted `settings.duration`.
+        '''
+        yield self.script[0]
+        body = [event for event in self.script[1:] if event[0] != 'Script.End']
+        while True:
+            self.passes += 1
+            yield from body
+            if self.settings.duration is None or self.frame >= self.settings.duration * self.settings.frame_rate:
+                break
+        yield from (event for event in self.script if event[0] == 'Script.End')
+
+    def read_script(self):
+        '''Read the script as far as the next wave or block, as readScript does.'''
+        if self.events is None:
+            self.events = self.script_events()
+        spawns = []
+        for name, data, line in self.events:
+            if name == 'Script.Start':
+                self.log('System.Startup', '{"time":"%s","script":"%s","script_arguments":%s,"scale":%f,'
+                         '"cooperative":%d,"separateEarthHealth":%d,"movableWorkspaces":%d}' % (
+                         self.start.strftime(time_format), self.start.strftime(time_format) + '.script',
+                         json.dumps(data.get('arguments', {}), separators=(',', ':')),
+                         java_float(float(self.scale)), self.settings.cooperative, 0,
+                         self.settings.movable_workspaces))
+                for participant in self.participants:
+                    self.log('Trial.WorkspaceInitialized', '{"participant":"%s","x":%f,"y":%f}' % (
+                             participant.name, java_float(participant.workspace_x),
+                             java_float(participant.workspace_y)))
+            elif name == 'Script.BeginBlock':
+                for participant in self.participants:
+                    participant.damage = 0
+                    self.log('Trial.DamageTakenChanged', '{"participant":"%s","damage":%d,"maxHealth":%d}' % (
+                             participant.name, 0, earth_max_health))
+                self.log('Trial.BeginBlock', '{}')
+                self.state = 'dialog'
+                self.countdown = max(1, int(round(self.settings.block_break * self.settings.frame_rate)))
+                return
+            elif name == 'Script.BeginWave':
+                self.enemies = empty_enemies()
+                self.wave = empty_enemies()
+                self.spawn_cursor = 0
+                self.spawn_timer = numpy.float32(0.0)
+                self.wave_number += 1
+                self.log('Trial.BeginWave', '{"waveNumber":%d}' % self.wave_number)
+                self.state = 'sync'
+                self.countdown = sync_frames
+                return
+            elif name == 'Script.SpawnEnemy':
+                spawns.append((data['type'][len('Enemy.'):], data['angle'], data['speed'], data['spawnTime']))
+            elif name == 'Script.EndWave':
+                self.add_enemies(spawns)
+                self.state = 'play'
+                return
+            elif name == 'Script.End':
+                self.log('Trial.Ended', '{}')
+        self.log('Trial.Ended', '{}')
+        self.state = 'ended'
+
+    def add_enemies(self, spawns):
+        '''
+        Place the enemies of a wave and log their spawns, as addEnemy does:
+        on a circle just outside the corners of the screen, then pushed in
+        towards it in steps while the next step would keep them offscreen.
+        '''
+        float32 = numpy.float32
+        types, angles, speeds, spawn_times = zip(*spawns) if spawns else ((), (), (), ())
+        angles = numpy.array(angles, dtype=float32)
+        speeds = numpy.array(speeds, dtype=float32)
+        radians = angles / float32(180.0) * float32(math.pi)
+        sin = numpy.sin(radians.astype(numpy.float64)).astype(float32)
+        cos = numpy.cos(radians.astype(numpy.float64)).astype(float32)
+        width, height = float32(self.width), float32(self.height)
+        spawn_distance = float32(enemy_radius) + float32(math.sqrt(
+                float32(self.width * self.width) * float32(0.5) + float32(self.height * self.height) * float32(0.5)))
+        x = cos * spawn_distance + width * float32(0.5)
+        y = sin * spawn_distance + height * float32(0.5)
+        dx = -cos * float32(spawn_push_step)
+        dy = -sin * float32(spawn_push_step)
+        radius = float32(enemy_radius)
+        pushing = numpy.ones(len(x), dtype=bool)
+        while True:
+            next_x = x + dx
+            next_y = y + dy
+            pushing &= ((next_x < -radius) | (next_x > width + radius) |
+                        (next_y < -radius) | (next_y > height + radius))
+            if not pushing.any():
+                break
+            x = numpy.where(pushing, next_x, x)
+            y = numpy.where(pushing, next_y, y)
+        wave = Enemies()
+        wave.ids = numpy.arange(self.next_enemy_id, self.next_enemy_id + len(x), dtype=numpy.int64)
+        self.next_enemy_id += len(x)
+        wave.types = numpy.array(types, dtype=object)
+        wave.x = x
+        wave.y = y
+        wave.vx = -cos * speeds * self.scale
+        wave.vy = -sin * speeds * self.scale
+        wave.dead = numpy.zeros(len(x), dtype=bool)
+        self.wave = wave
+        self.spawn_times = numpy.array(spawn_times, dtype=float32)
+        prefix = '%d, Trial.EnemySpawned, {"id":' % self.timestamp
+        line = prefix + '%d,"x":%f,"y":%f,"r":%f,"type":"%s"}\n'
+        r = java_float(enemy_radius)
+        self.write(''.join([line % (enemy_id, enemy_x, enemy_y, r, enemy_type)
+                            for enemy_id, enemy_x, enemy_y, enemy_type
+                            in zip(wave.ids.tolist(), java_floats(x), java_floats(y), types)]))
+
+    def update_enemies(self):
+        '''Move, remove, collide and spawn enemies for a frame, as updateEnemies does.'''
+        float32 = numpy.float32
+        enemies = self.enemies
+        if len(enemies.ids):
+            enemies.x += enemies.vx * self.scale
+            enemies.y += enemies.vy * self.scale
+            prefix = '%d, Trial.EnemyMoved, {"id":' % self.timestamp
+            line = prefix + '%d,"x":%f,"y":%f}\n'
+            self.write(''.join([line % values for values in
+                                zip(enemies.ids.tolist(), java_floats(enemies.x), java_floats(enemies.y))]))
+            if enemies.dead.any():
+                self.enemies = enemies = select_enemies(enemies, ~enemies.dead)
+                if not len(enemies.ids):
+                    self.read_script()
+                    enemies = self.enemies
+        if len(enemies.ids):
+            collision_radius = float32(earth_radius) * self.scale + float32(enemy_radius)
+            dx = enemies.x - float32(self.width / 2.0)
+            dy = enemies.y - float32(self.height / 2.0)
+            for index in numpy.flatnonzero(dx * dx + dy * dy < collision_radius * collision_radius).tolist():
+                enemies.dead[index] = True
+                self.log('Trial.EnemyCollide', '{"id":%d}' % enemies.ids[index])
+                self.register_collision(float(dx[index]), float(dy[index]))
+        self.spawn_timer = float32(self.spawn_timer + float32(spawn_timer_step))
+        start = self.spawn_cursor
+        while self.spawn_cursor < len(self.wave.ids) and self.spawn_timer >= self.spawn_times[self.spawn_cursor]:
+            self.spawn_timer = float32(self.spawn_timer - self.spawn_times[self.spawn_cursor])
+            self.spawn_cursor += 1
+        if self.spawn_cursor > start:
+            self.enemies = concatenate_enemies(enemies, select_enemies(self.wave, slice(start, self.spawn_cursor)))
+
+    def register_collision(self, dx, dy):
+        '''Damage the workspace whose part of the earth was hit, as registerCollisionWithEarth does.'''
+        angle_delta = 2 * math.pi / len(self.participants)
+        angle = math.atan2(dy, dx)
+        while angle > 3 * math.pi / 2:
+            angle -= 2 * math.pi
+        while angle < -math.pi / 2:
+            angle += 2 * math.pi
+        current_angle = -math.pi / 2
+        for participant in self.participants:
+            if current_angle <= angle < current_angle + angle_delta:
+                participant.damage += earth_damage_taken_from_enemy
+                self.log('Trial.DamageTakenChanged', '{"participant":"%s","damage":%d,"maxHealth":%d}' % (
+                         participant.name, participant.damage, earth_max_health))
+            current_angle += angle_delta
+
+    def update_participant(self, participant):
+        '''Move the touch of a participant for a frame, or start or finish one.'''
+        if participant.target is None:
+            if self.state == 'play':
+                self.start_touch(participant)
+            return
+        participant.frames_left -= 1
+        index = self.enemy_index(participant.target)
+        if index is not None:
+            target_x = float(self.enemies.x[index])
+            target_y = float(self.enemies.y[index])
+        elif participant.cursor is not None:
+            target_x, target_y = participant.cursor
+        else:
+            target_x, target_y = participant.finger_x, participant.finger_y
+        steps = participant.frames_left + 1
+        if participant.cursor is not None:
+            # The finger wanders a little in the workspace while the cursor
+            # is moved onto the enemy.
+            cursor_x, cursor_y = participant.cursor
+            cursor_x = float(numpy.float32(cursor_x + (target_x - cursor_x) / steps))
+            cursor_y = float(numpy.float32(cursor_y + (target_y - cursor_y) / steps))
+            participant.cursor = (cursor_x, cursor_y)
+            participant.finger_x = float(numpy.float32(participant.finger_x + random.gauss(0.0, 2.0)))
+            participant.finger_y = float(numpy.float32(participant.finger_y + random.gauss(0.0, 2.0)))
+        else:
+            finger_x, finger_y = participant.finger_x, participant.finger_y
+            participant.finger_x = float(numpy.float32(finger_x + (target_x - finger_x) / steps))
+            participant.finger_y = float(numpy.float32(finger_y + (target_y - finger_y) / steps))
+        finger = '{"id":%d,"x":%f,"y":%f}' % (participant.touch_id, java_float(participant.finger_x),
+                                               java_float(participant.finger_y))
+        self.log('Input.RawTouchMove', finger)
+        self.log('Input.TouchMove', finger)
+        if participant.cursor is not None:
+            self.log('Hybrid.CursorMoved', '{"participant":"%s","x":%f,"y":%f}' % (
+                     participant.name, java_float(participant.cursor[0]), java_float(participant.cursor[1])))
+        if participant.frames_left > 0:
+            return
+
+        using_cursor = participant.cursor is not None
+        weapon_x, weapon_y = participant.cursor if using_cursor else (participant.finger_x, participant.finger_y)
+        cid = 0 if using_cursor or participant.weapon == 'Shield' else participant.touch_id
+        if index is not None and not self.enemies.dead[index]:
+            self.enemies.dead[index] = True
+            participant.score += 1
+            enemy_x = java_float(float(self.enemies.x[index]))
+            enemy_y = java_float(float(self.enemies.y[index]))
+            self.log('Trial.EnemyHit', '{"participant":"%s","source":"%s","cid":%d,"cx":%f,"cy":%f,"id":%d,'
+                     '"x":%f,"y":%f,"r":%f,"type":"%s"}' % (
+                     participant.name, hit_sources[participant.weapon][using_cursor], cid,
+                     java_float(weapon_x), java_float(weapon_y), participant.target, enemy_x, enemy_y,
+                     java_float(enemy_radius), 'Enemy.' + participant.weapon))
+            self.log('Trial.ParticipantCredited', '{"participant":"%s","newScore":%d,"weapon":"%s","cx":%f,'
+                     '"cy":%f,"id":%d,"x":%f,"y":%f,"cid":%d,"source":"%s"}' % (
+                     participant.name, participant.score, participant.weapon, java_float(weapon_x),
+                     java_float(weapon_y), participant.target, enemy_x, enemy_y, cid,
+                     credit_sources[participant.weapon][using_cursor]))
+        elif participant.weapon != 'Shield':
+            self.log('Trial.EnemyMissed', '{"participant":"%s","source":"%s","cid":%d,"cx":%f,"cy":%f,'
+                     '"type":"%s"}' % (
+                     participant.name, 'CursorTap' if using_cursor else 'Finger', cid,
+                     java_float(weapon_x), java_float(weapon_y), 'Enemy.' + participant.weapon))
+        finger = '{"id":%d,"x":%f,"y":%f}' % (participant.touch_id, java_float(participant.finger_x),
+                                               java_float(participant.finger_y))
+        self.log('Input.RawTouchUp', finger)
+        self.log('Input.TouchUp', finger)
+        if using_cursor:
+            self.log('Hybrid.CursorDespawned', '{"participant":"%s"}' % participant.name)
+        participant.target = None
+        participant.cursor = None
+
+    def start_touch(self, participant):
+        '''
+        Put a finger of a participant down to go after the onscreen enemy
+        nearest its workspace that no one else is after, if there is one.
+        '''
+        enemies = self.enemies
+        if not len(enemies.ids):
+            return
+        targets = [other.target for other in self.participants if other.target is not None]
+        available = (~enemies.dead & (enemies.x >= 0) & (enemies.x <= self.width) &
+                     (enemies.y >= 0) & (enemies.y <= self.height) & ~numpy.isin(enemies.ids, targets))
+        if not available.any():
+            return
+        distances = numpy.hypot(enemies.x - participant.workspace_x, enemies.y - participant.workspace_y)
+        index = int(numpy.where(available, distances, numpy.inf).argmin())
+        participant.target = int(enemies.ids[index])
+        participant.weapon = enemies.types[index]
+        participant.frames_left = max(1, int(round(random.lognormvariate(math.log(self.settings.kill_time), 0.3) *
+                                                   self.settings.frame_rate)))
+        participant.touch_id = self.next_touch_id
+        self.next_touch_id += 1
+        angle = random.uniform(0.0, 2 * math.pi)
+        spread = touch_spread * math.sqrt(random.random())
+        participant.finger_x = float(numpy.float32(participant.workspace_x + spread * math.cos(angle)))
+        participant.finger_y = float(numpy.float32(participant.workspace_y + spread * math.sin(angle)))
+        finger = '{"id":%d,"x":%f,"y":%f}' % (participant.touch_id, java_float(participant.finger_x),
+                                               java_float(participant.finger_y))
+        self.log('Input.RawTouchDown', finger)
+        self.log('Input.TouchDown', finger)
+        if distances[index] > workspace_reach:
+            participant.cursor = (participant.finger_x, participant.finger_y)
+            self.log('Hybrid.CursorSpawned', '{"participant":"%s","id":%d,"count":%d,"x":%f,"y":%f}' % (
+                     participant.name, participant.touch_id, 1, java_float(participant.finger_x),
+                     java_float(participant.finger_y)))
+
+    def enemy_index(self, enemy_id):
+        '''Return the index of an enemy on screen by its id, or None if it is gone.'''
+        ids = self.enemies.ids
+        index = int(numpy.searchsorted(ids, enemy_id))
+        if index < len(ids) and ids[index] == enemy_id:
+            return index
+        return None
+
+
+def empty_enemies():
+    enemies = Enemies()
+    enemies.ids = numpy.zeros(0, dtype=numpy.int64)
+    enemies.types = numpy.zeros(0, dtype=object)
+    enemies.x, enemies.y, enemies.vx, enemies.vy = numpy.zeros((4, 0), dtype=numpy.float32)
+    enemies.dead = numpy.zeros(0, dtype=bool)
+    return enemies
+
+
+def select_enemies(enemies, selection):
+    selected = Enemies()
+    for name in Enemies.__slots__:
+        setattr(selected, name, getattr(enemies, name)[selection])
+    return selected
+
+
+def concatenate_enemies(enemies, other):
+    joined = Enemies()
+    for name in Enemies.__slots__:
+        setattr(joined, name, numpy.concatenate([getattr(enemies, name), getattr(other, name)]))
+    return joined
+
+
+if __name__ == '__main__':
+    main()